@@ -6,41 +6,51 @@ from utils import log
 
 
 def export_events():
+    cfg = EventExportConfig.create_from_env()
     event_streams = [
         EventStream(
             EventStoreConfig.EVENTS_INDEX,
             DateOffsetOptions(
                 "cluster_id",
                 "event_time"
-            )
+            ),
+            cfg.compression,
+            cfg.format,
+            tiebreaker="event_id"
         ),
         EventStream(
             EventStoreConfig.CLUSTER_EVENTS_INDEX,
             DateOffsetOptions(
                 "id",
                 "updated_at"
-            )
+            ),
+            cfg.compression,
+            cfg.format,
+            tiebreaker="cluster_state_id"
         ),
         EventStream(
             EventStoreConfig.INFRA_ENVS_EVENTS_INDEX,
             DateOffsetOptions(
                 "id",
                 "updated_at"
-            )
+            ),
+            cfg.compression,
+            cfg.format
         ),
         EventStream(
             EventStoreConfig.COMPONENT_VERSIONS_EVENTS_INDEX,
             DateOffsetOptions(
                 None,
                 "timestamp"
-            )
+            ),
+            cfg.compression,
+            cfg.format
         )
     ]
 
     writer = ObjectStorageWriter.create_from_env()
-    cfg = EventExportConfig.create_from_env()
     es_client = create_es_client_from_env()
-    offset_repo = DateOffsetRepository(es_client, "offsets")
+    offset_repo = DateOffsetRepository(es_client, "offsets", cfg.cursor)
 
     exporter = EventsExporter(cfg, es_client, writer, offset_repo)
     for stream in event_streams:
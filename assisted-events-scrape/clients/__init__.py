@@ -1,3 +1,3 @@
-from .elasticsearch import create_es_client_from_env
+from .elasticsearch import create_es_client_from_env, create_async_es_client_from_env, CodecJSONSerializer
 
-__all__ = ["create_es_client_from_env"]
+__all__ = ["CodecJSONSerializer", "create_es_client_from_env", "create_async_es_client_from_env"]
@@ -1,10 +1,42 @@
 from config import ElasticsearchConfig
-from opensearchpy import OpenSearch
+from opensearchpy import OpenSearch, AsyncOpenSearch
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+from utils import json_loads, json_dumps
+
+
+class CodecJSONSerializer(JSONSerializer):
+    """
+    Serializes requests and responses with the configured JSON codec. The output of orjson is as compact
+    as the default serializer's, so documents sent to the cluster do not change
+    """
+    def loads(self, s):
+        try:
+            return json_loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e) from e
+
+    def dumps(self, data):
+        # don't serialize strings
+        if isinstance(data, str):
+            return data
+        try:
+            return json_dumps(data, default=self.default)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e) from e
 
 
 def create_es_client_from_env() -> OpenSearch:
     config = ElasticsearchConfig.create_from_env()
-    http_auth = None
+    return OpenSearch(config.host, http_auth=_get_http_auth(config), serializer=CodecJSONSerializer())
+
+
+def create_async_es_client_from_env() -> AsyncOpenSearch:
+    config = ElasticsearchConfig.create_from_env()
+    return AsyncOpenSearch(config.host, http_auth=_get_http_auth(config), serializer=CodecJSONSerializer())
+
+
+def _get_http_auth(config: ElasticsearchConfig):
     if config.username:
-        http_auth = (config.username, config.password)
-    return OpenSearch(config.host, http_auth=http_auth)
+        return (config.username, config.password)
+    return None
@@ -4,6 +4,9 @@ from .elasticsearch import ElasticsearchConfig
 from .event_store import EventStoreConfig
 from .sentry import SentryConfig
 from .event_export import EventExportConfig
+from .state_store import StateStoreConfig
+from .pipeline import PipelineConfig
+from .infra_env_cache import InfraEnvCacheConfig
 
 __all__ = [
     "ScraperConfig",
@@ -11,5 +14,8 @@ __all__ = [
     "SentryConfig",
     "EventStoreConfig",
     "ObjectStorageConfig",
-    "EventExportConfig"
+    "EventExportConfig",
+    "StateStoreConfig",
+    "PipelineConfig",
+    "InfraEnvCacheConfig"
 ]
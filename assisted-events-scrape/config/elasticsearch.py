@@ -1,6 +1,14 @@
 from dataclasses import dataclass
 from utils import get_env
 
+# How scans page through results: scroll contexts, or search_after on sorted results, optionally within
+# a point in time
+CURSOR_SCROLL = "scroll"
+CURSOR_SEARCH_AFTER = "search_after"
+CURSOR_POINT_IN_TIME = "point_in_time"
+SORTED_CURSORS = (CURSOR_SEARCH_AFTER, CURSOR_POINT_IN_TIME)
+DEFAULT_CURSOR = CURSOR_SCROLL
+
 
 @dataclass
 class ElasticsearchConfig:
@@ -1,17 +1,50 @@
 from dataclasses import dataclass
+from typing import Optional
 from utils import get_env
+from .elasticsearch import DEFAULT_CURSOR
 
 
 DEFAULT_CHUNK_SIZE = "500"
+DEFAULT_PARALLEL_PARTITIONS = "1"
+DEFAULT_QUEUE_SIZE = "1000"
+EXPORT_STRATEGY_PARTITIONS = "partitions"
+EXPORT_STRATEGY_SINGLE_SCAN = "single_scan"
+DEFAULT_EXPORT_STRATEGY = EXPORT_STRATEGY_PARTITIONS
+DEFAULT_CHECKPOINT_DOCUMENTS = "0"
+DEFAULT_CHECKPOINT_SECONDS = "0"
+EXPORT_FORMAT_NDJSON = "ndjson"
+EXPORT_FORMAT_PARQUET = "parquet"
+DEFAULT_EXPORT_FORMAT = EXPORT_FORMAT_NDJSON
+DEFAULT_PARQUET_ROW_GROUP_SIZE = "1000"
 
 
 @dataclass
 class EventExportConfig:
     chunk_size: int
+    parallel_partitions: int = int(DEFAULT_PARALLEL_PARTITIONS)
+    queue_size: int = int(DEFAULT_QUEUE_SIZE)
+    strategy: str = DEFAULT_EXPORT_STRATEGY
+    cursor: str = DEFAULT_CURSOR
+    checkpoint_documents: int = int(DEFAULT_CHECKPOINT_DOCUMENTS)
+    checkpoint_seconds: float = float(DEFAULT_CHECKPOINT_SECONDS)
+    compression: Optional[str] = None
+    format: str = DEFAULT_EXPORT_FORMAT
+    parquet_row_group_size: int = int(DEFAULT_PARQUET_ROW_GROUP_SIZE)
 
     @classmethod
     def create_from_env(cls) -> 'EventExportConfig':
         chunk_size = get_env("EVENT_EXPORT_STREAM_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+        parallel_partitions = get_env("EVENT_EXPORT_PARALLEL_PARTITIONS", default=DEFAULT_PARALLEL_PARTITIONS)
+        queue_size = get_env("EVENT_EXPORT_QUEUE_SIZE", default=DEFAULT_QUEUE_SIZE)
         return cls(
-            int(chunk_size)
+            int(chunk_size),
+            max(1, int(parallel_partitions)),
+            max(1, int(queue_size)),
+            get_env("EVENT_EXPORT_STRATEGY", default=DEFAULT_EXPORT_STRATEGY).lower(),
+            get_env("EVENT_EXPORT_CURSOR", default=DEFAULT_CURSOR).lower(),
+            max(0, int(get_env("EVENT_EXPORT_CHECKPOINT_DOCUMENTS", default=DEFAULT_CHECKPOINT_DOCUMENTS))),
+            max(0.0, float(get_env("EVENT_EXPORT_CHECKPOINT_SECONDS", default=DEFAULT_CHECKPOINT_SECONDS))),
+            (get_env("EVENT_EXPORT_COMPRESSION") or "").lower() or None,
+            get_env("EVENT_EXPORT_FORMAT", default=DEFAULT_EXPORT_FORMAT).lower(),
+            max(1, int(get_env("EVENT_EXPORT_PARQUET_ROW_GROUP_SIZE", default=DEFAULT_PARQUET_ROW_GROUP_SIZE)))
         )
@@ -1,11 +1,17 @@
 from typing import List
 from dataclasses import dataclass
 from utils import get_env
+from .elasticsearch import DEFAULT_CURSOR
 
 DEFAULT_EVENTS_IDX = ".events"
 DEFAULT_CLUSTER_EVENTS_IDX = ".clusters"
 DEFAULT_COMPONENT_VERSIONS_EVENTS_IDX = ".component_versions"
 DEFAULT_INFRA_ENVS_EVENTS_IDX = ".infra_envs"
+DEFAULT_BATCH_SIZE = "0"
+WRITE_MODE_SCAN = "scan"
+WRITE_MODE_OPTIMISTIC = "optimistic"
+DEFAULT_WRITE_MODE = WRITE_MODE_SCAN
+DEFAULT_HASH_ALGORITHM = "sha256"
 
 
 @dataclass
@@ -21,10 +27,14 @@ class EventStoreConfig:
     component_versions_events_index: str
     infra_envs_events_index: str
     cluster_events_ignore_fields: List[str]
+    batch_size: int = 0
+    write_mode: str = DEFAULT_WRITE_MODE
+    hash_algorithm: str = DEFAULT_HASH_ALGORITHM
+    scan_cursor: str = DEFAULT_CURSOR
 
     @classmethod
     def create_from_env(cls) -> 'EventStoreConfig':
-        cluster_events_ignore_fields = cls.CLUSTER_EVENTS_IGNORE_FIELDS_INTERNAL
+        cluster_events_ignore_fields = list(cls.CLUSTER_EVENTS_IGNORE_FIELDS_INTERNAL)
         cluster_events_ignore_fields_str = get_env("EVENT_STORE_CLUSTER_EVENTS_IGNORE_FIELDS", default="")
         if len(cluster_events_ignore_fields_str) > 0:
             cluster_events_ignore_fields += cluster_events_ignore_fields_str.split(",")
@@ -34,5 +44,9 @@ class EventStoreConfig:
             get_env("EVENT_STORE_CLUSTER_EVENTS_IDX", default=DEFAULT_CLUSTER_EVENTS_IDX),
             get_env("EVENT_STORE_COMPONENT_VERSIONS_EVENTS_IDX", default=DEFAULT_COMPONENT_VERSIONS_EVENTS_IDX),
             get_env("EVENT_STORE_INFRA_ENVS_EVENTS_IDX", default=DEFAULT_INFRA_ENVS_EVENTS_IDX),
-            cluster_events_ignore_fields
+            cluster_events_ignore_fields,
+            int(get_env("EVENT_STORE_BATCH_SIZE", default=DEFAULT_BATCH_SIZE)),
+            get_env("EVENT_STORE_WRITE_MODE", default=DEFAULT_WRITE_MODE).lower(),
+            get_env("EVENT_STORE_HASH_ALGORITHM", default=DEFAULT_HASH_ALGORITHM).lower(),
+            get_env("EVENT_STORE_SCAN_CURSOR", default=DEFAULT_CURSOR).lower()
         )
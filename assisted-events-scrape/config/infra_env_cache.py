@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from utils import get_env
+
+DEFAULT_INFRA_ENV_CACHE_SIZE = "10000"
+DEFAULT_INFRA_ENV_CACHE_TTL_SECONDS = "3600"
+
+
+@dataclass
+class InfraEnvCacheConfig:
+    max_size: int = int(DEFAULT_INFRA_ENV_CACHE_SIZE)
+    ttl_seconds: int = int(DEFAULT_INFRA_ENV_CACHE_TTL_SECONDS)
+
+    @classmethod
+    def create_from_env(cls) -> 'InfraEnvCacheConfig':
+        return cls(
+            max(1, int(get_env("INFRA_ENV_CACHE_SIZE", default=DEFAULT_INFRA_ENV_CACHE_SIZE))),
+            int(get_env("INFRA_ENV_CACHE_TTL_SECONDS", default=DEFAULT_INFRA_ENV_CACHE_TTL_SECONDS)))
@@ -3,6 +3,9 @@ from utils import get_env, log
 
 
 DEFAULT_S3_ENDPOINT_PROTOCOL = "https://"
+DEFAULT_MAX_OPEN_STREAMS = "0"
+DEFAULT_PART_SIZE_MB = "5"
+DEFAULT_UPLOAD_CONCURRENCY = "0"
 
 
 @dataclass
@@ -11,6 +14,9 @@ class ObjectStorageConfig:
     secret_key: str
     endpoint_url: str
     bucket: str
+    max_open_streams: int = int(DEFAULT_MAX_OPEN_STREAMS)
+    part_size: int = int(DEFAULT_PART_SIZE_MB) * 1024 ** 2
+    upload_concurrency: int = int(DEFAULT_UPLOAD_CONCURRENCY)
 
     @classmethod
     def create_from_env(cls) -> 'ObjectStorageConfig':
@@ -22,4 +28,7 @@ class ObjectStorageConfig:
             get_env("AWS_ACCESS_KEY_ID"),
             get_env("AWS_SECRET_ACCESS_KEY"),
             endpoint,
-            get_env("AWS_S3_BUCKET"))
+            get_env("AWS_S3_BUCKET"),
+            max(0, int(get_env("OBJECT_STORAGE_MAX_OPEN_STREAMS", default=DEFAULT_MAX_OPEN_STREAMS))),
+            max(5, int(get_env("OBJECT_STORAGE_PART_SIZE_MB", default=DEFAULT_PART_SIZE_MB))) * 1024 ** 2,
+            max(0, int(get_env("OBJECT_STORAGE_UPLOAD_CONCURRENCY", default=DEFAULT_UPLOAD_CONCURRENCY))))
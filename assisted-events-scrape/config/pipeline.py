@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+from utils import get_env
+
+DEFAULT_PIPELINE_FETCH_WORKERS = "5"
+DEFAULT_PIPELINE_TRANSFORM_WORKERS = "1"
+DEFAULT_PIPELINE_STORE_WORKERS = "2"
+DEFAULT_PIPELINE_QUEUE_SIZE = "100"
+DEFAULT_PIPELINE_BATCH_SIZE = "1000"
+MINIMUM_STAGE_WORKERS = 1
+
+
+@dataclass
+class PipelineConfig:
+    fetch_workers: int
+    transform_workers: int
+    store_workers: int
+    queue_size: int
+    batch_size: int
+
+    @classmethod
+    def create_from_env(cls) -> 'PipelineConfig':
+        return cls(
+            _get_workers_env("PIPELINE_FETCH_WORKERS", DEFAULT_PIPELINE_FETCH_WORKERS),
+            _get_workers_env("PIPELINE_TRANSFORM_WORKERS", DEFAULT_PIPELINE_TRANSFORM_WORKERS),
+            _get_workers_env("PIPELINE_STORE_WORKERS", DEFAULT_PIPELINE_STORE_WORKERS),
+            max(1, int(get_env("PIPELINE_QUEUE_SIZE", default=DEFAULT_PIPELINE_QUEUE_SIZE))),
+            max(1, int(get_env("PIPELINE_BATCH_SIZE", default=DEFAULT_PIPELINE_BATCH_SIZE))))
+
+
+def _get_workers_env(key: str, default: str) -> int:
+    return max(MINIMUM_STAGE_WORKERS, int(get_env(key, default=default)))
@@ -1,12 +1,18 @@
 from dataclasses import dataclass
-from utils import get_env
+from utils import get_env, get_bool_env
 from .elasticsearch import ElasticsearchConfig
 from .sentry import SentryConfig
 
 DEFAULT_ENV_ERRORS_BEFORE_RESTART = "100"
 DEFAULT_ENV_MAX_IDLE_MINUTES = "120"
 DEFAULT_ENV_N_WORKERS = "5"
+DEFAULT_ENV_INCREMENTAL_POLLING = "false"
+DEFAULT_ENV_FULL_RECONCILE_MINUTES = "60"
+DEFAULT_ENV_ASYNC_MAX_IN_FLIGHT = "200"
 MINIMUM_WORKERS = 1
+ENGINE_THREADS = "threads"
+ENGINE_ASYNCIO = "asyncio"
+ENGINE_PIPELINE = "pipeline"
 
 
 @dataclass
@@ -18,10 +24,19 @@ class ScraperConfig:
     max_idle_minutes: int
     errors_before_restart: int
     n_workers: int
+    incremental_polling: bool = False
+    full_reconcile_minutes: int = int(DEFAULT_ENV_FULL_RECONCILE_MINUTES)
+    engine: str = ENGINE_THREADS
+    async_max_in_flight: int = int(DEFAULT_ENV_ASYNC_MAX_IN_FLIGHT)
 
     @classmethod
     def create_from_env(cls) -> 'ScraperConfig':
         n_workers = max(MINIMUM_WORKERS, int(get_env("N_WORKERS", default=DEFAULT_ENV_N_WORKERS)))
+        engine = get_env("SCRAPER_ENGINE", default=ENGINE_THREADS)
+        if engine not in (ENGINE_THREADS, ENGINE_ASYNCIO, ENGINE_PIPELINE):
+            raise ValueError(f"Unknown scraper engine: {engine}")
+        async_max_in_flight = max(MINIMUM_WORKERS, int(get_env("ASYNC_MAX_IN_FLIGHT",
+                                                               default=DEFAULT_ENV_ASYNC_MAX_IN_FLIGHT)))
         return cls(
             get_env("ASSISTED_SERVICE_URL"),
             get_env("OFFLINE_TOKEN"),
@@ -29,4 +44,8 @@ class ScraperConfig:
             ElasticsearchConfig.create_from_env(),
             int(get_env("MAX_IDLE_MINUTES", default=DEFAULT_ENV_MAX_IDLE_MINUTES)),
             int(get_env("ERRORS_BEFORE_RESTART", default=DEFAULT_ENV_ERRORS_BEFORE_RESTART)),
-            n_workers)
+            n_workers,
+            get_bool_env("INCREMENTAL_POLLING", default=DEFAULT_ENV_INCREMENTAL_POLLING),
+            int(get_env("FULL_RECONCILE_MINUTES", default=DEFAULT_ENV_FULL_RECONCILE_MINUTES)),
+            engine,
+            async_max_in_flight)
@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+from utils import get_env
+
+STATE_STORE_BACKEND_NONE = "none"
+STATE_STORE_BACKEND_SQLITE = "sqlite"
+STATE_STORE_BACKEND_ELASTICSEARCH = "elasticsearch"
+
+DEFAULT_STATE_STORE_BACKEND = STATE_STORE_BACKEND_NONE
+DEFAULT_STATE_STORE_SQLITE_PATH = "/tmp/assisted-events-scrape-state.db"
+DEFAULT_STATE_STORE_INDEX = ".scraper_state"
+
+
+@dataclass
+class StateStoreConfig:
+    backend: str
+    sqlite_path: str
+    index: str
+
+    @classmethod
+    def create_from_env(cls) -> 'StateStoreConfig':
+        return cls(
+            get_env("STATE_STORE_BACKEND", default=DEFAULT_STATE_STORE_BACKEND).lower(),
+            get_env("STATE_STORE_SQLITE_PATH", default=DEFAULT_STATE_STORE_SQLITE_PATH),
+            get_env("STATE_STORE_INDEX", default=DEFAULT_STATE_STORE_INDEX))
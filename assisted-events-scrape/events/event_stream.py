@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from typing import Optional
+from config.event_export import DEFAULT_EXPORT_FORMAT
 from storage import DateOffsetOptions
 
 
@@ -6,3 +8,9 @@ from storage import DateOffsetOptions
 class EventStream:
     name: str
     options: DateOffsetOptions
+    # `gzip` or `zstd`, None to export plain ndjson
+    compression: Optional[str] = None
+    # `ndjson` or `parquet`
+    format: str = DEFAULT_EXPORT_FORMAT
+    # Stored field unique to each document, required to scan the stream sorted. None to always scroll
+    tiebreaker: Optional[str] = None
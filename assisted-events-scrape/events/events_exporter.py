@@ -1,17 +1,23 @@
+from functools import partial
 from itertools import chain
 import time
 import datetime
-from typing import Iterable, List
-from dateutil import parser
+from typing import Iterable, List, Optional
 from config import EventExportConfig
-from utils import get_dict_hash, log
+from config.elasticsearch import SORTED_CURSORS
+from config.event_export import EXPORT_FORMAT_PARQUET, EXPORT_STRATEGY_SINGLE_SCAN
+from utils import compile_getter, get_dict_hash, get_timestamp_day, log, merge_parallel, parse_timestamp
 from events import EventStream
-from storage import DateOffset, DateOffsetRepository, ObjectStorageWriter
+from storage import DateOffset, DateOffsetRepository, ObjectStorageWriter, ParquetOptions, WriteCheckpoint, \
+    create_cursor
 from opensearchpy.exceptions import NotFoundError
-from opensearchpy import OpenSearch, helpers
+from opensearchpy import OpenSearch
 
 
 DEFAULT_TIMEOUT = 30.0
+# Checkpointed offsets are moved back, so that documents sharing the offset of the last exported document
+# are exported again on resume rather than skipped
+CHECKPOINT_OFFSET_MARGIN = datetime.timedelta(milliseconds=1)
 
 
 class EventsExporter:
@@ -34,70 +40,137 @@ class EventsExporter:
             log.debug(f"Retrieved docs (time_field: {time_field}): {docs}")
 
             def key_fn(document: dict) -> str:
-                day = parser.parse(document[time_field])
-                day_str = datetime.datetime.strftime(day, "%Y-%m-%d")
-                return f"{stream.name}/{day_str}/{epoch}_{checksum}.ndjson"
-
-            offset = self._object_writer.write_ndjson_stream(
-                key_fn,
-                map(lambda x: x["_source"], docs),
-                options=stream.options
-            )
+                day_str = get_timestamp_day(document[time_field])
+                return f"{stream.name}/{day_str}/{epoch}_{checksum}.{stream.format}"
+
+            documents = map(lambda x: x["_source"], docs)
+            if stream.format == EXPORT_FORMAT_PARQUET:
+                offset = self._object_writer.write_parquet_stream(
+                    key_fn,
+                    documents,
+                    options=stream.options,
+                    checkpoint=self._get_checkpoint(stream),
+                    parquet_options=ParquetOptions(self._config.parquet_row_group_size, stream.compression)
+                )
+            else:
+                offset = self._object_writer.write_ndjson_stream(
+                    key_fn,
+                    documents,
+                    options=stream.options,
+                    checkpoint=self._get_checkpoint(stream),
+                    compression=stream.compression
+                )
             self._offset_repo.save(stream.name, offset)
         except NotFoundError:
             # If run before any event is ever produced there won't be such indices
             pass
 
+    def _get_checkpoint(self, stream: EventStream) -> Optional[WriteCheckpoint]:
+        """
+        Offsets can be saved before the end of the export only when each partition is exported in order:
+        otherwise documents earlier than a saved offset might not be exported yet.
+        Documents are sorted by sorted cursors, for streams with a tiebreaker
+        """
+        if not self._config.checkpoint_documents and not self._config.checkpoint_seconds:
+            return None
+        if self._config.cursor not in SORTED_CURSORS or stream.tiebreaker is None:
+            log.warning(f"Not checkpointing export of {stream.name}: documents are only sorted with "
+                        f"{' or '.join(SORTED_CURSORS)} cursors, for streams with a tiebreaker")
+            return None
+        return WriteCheckpoint(partial(self._save_checkpoint, stream), self._config.checkpoint_documents,
+                               self._config.checkpoint_seconds)
+
+    def _save_checkpoint(self, stream: EventStream, offsets: DateOffset) -> None:
+        checkpoint = DateOffset()
+        for partition, offset in offsets.items():
+            checkpoint.setOffset(get_checkpoint_offset(offset), partition)
+        self._offset_repo.save(stream.name, checkpoint)
+        log.info(f"Saved checkpoint of {stream.name} export for {checkpoint.size()} partitions")
+
     def _get_all_docs(self, stream: EventStream, offsets: DateOffset) -> Iterable[dict]:
-        all_docs = []
+        """
+        Scans each partition from its offset. With parallel partitions, several scans run concurrently and
+        their documents are interleaved: offsets are still correct, as the latest offset of each partition is kept
+        """
+        if self._config.strategy == EXPORT_STRATEGY_SINGLE_SCAN and stream.options.partition_key:
+            return self._get_new_docs(stream, offsets)
+        queries = self._get_queries(stream, offsets)
+        if self._config.parallel_partitions > 1 and len(queries) > 1:
+            log.debug(f"Scanning {len(queries)} queries for {stream.name}, "
+                      f"{self._config.parallel_partitions} at a time")
+            return merge_parallel([partial(self._scan, stream, query) for query in queries],
+                                  self._config.parallel_partitions, self._config.queue_size)
+        return chain.from_iterable(self._scan(stream, query) for query in queries)
+
+    def _get_new_docs(self, stream: EventStream, offsets: DateOffset) -> Iterable[dict]:
+        """
+        Scans partitions with an offset once, from the earliest offset, and skips documents that are not later than
+        the offset of their partition, or whose partition has no offset. Then partitions without offset are scanned
+        from the beginning
+        """
+        if offsets.size() > 0:
+            query = self._get_query(stream, None, offsets.getMinOffset(), partitioned=False)
+            log.debug(f"Retrieving documents for {stream.name} with a single scan (query: {query})")
+            get_partition = compile_getter(stream.options.partition_key)
+            get_offset = compile_getter(stream.options.order_key)
+            for doc in self._scan(stream, query):
+                source = doc["_source"]
+                partition = get_partition(source)
+                if offsets.getOffset(partition) is not None and offsets.isAfter(get_offset(source), partition):
+                    yield doc
+
+        partitions = [partition for partition, _ in offsets.items()]
+        query = self._get_query_exclude_partitions(stream.options.partition_key, partitions)
+        log.debug(f"Retrieving documents for {stream.name} partitions without offset (query: {query})")
+        yield from self._scan(stream, query)
+
+    def _scan(self, stream: EventStream, query: dict) -> Iterable[dict]:
+        # sorting only applies to cursors that support it
+        return create_cursor(self._config.cursor, self._es_client, stream.name, query, tiebreaker=stream.tiebreaker,
+                             size=self._config.chunk_size, request_timeout=DEFAULT_TIMEOUT,
+                             sort=[{stream.options.order_key: "asc"}])
+
+    def _get_queries(self, stream: EventStream, offsets: DateOffset) -> List[dict]:
+        queries = []
         partitions = []
         log.debug(f"About to retrieve documents for {stream.name} (offsets: {offsets}, options: {stream.options})")
         if offsets.size() > 0 and stream.options.partition_key:
             log.debug(f"Retrieving documents for partitioned stream {stream.name} (options: {stream.options})")
-            for partition, offset in offsets.getAll().items():
-                query = self._get_query(stream, partition, offset)
+            for partition, offset in offsets.items():
                 log.debug(f"Retrieving documents for {stream.name} (partition: {partition}, offset: {offset})")
-                docs = helpers.scan(self._es_client, index=stream.name, size=self._config.chunk_size,
-                                    query=query, request_timeout=DEFAULT_TIMEOUT)
-                all_docs = chain(all_docs, docs)
-            partitions = list(offsets.getAll().keys())
+                queries.append(self._get_query(stream, partition, offset))
+                partitions.append(partition)
         if offsets.size() == 0 and not stream.options.partition_key:
             # When it's the first time we retrieve non-partitioned data
             query = self._get_query(stream, None, None)
             log.debug(f"First time retrieving non-partitioned stream {stream.name} (query: {query})")
-            docs = helpers.scan(self._es_client, index=stream.name, size=self._config.chunk_size,
-                                query=query, request_timeout=DEFAULT_TIMEOUT)
-            all_docs = chain(all_docs, docs)
+            queries.append(query)
 
         # if it is unpartitioned data, but with offset
         if offsets.size() > 0 and not stream.options.partition_key:
-            for partition, offset in offsets.getAll().items():
+            for partition, offset in offsets.items():
                 # partition should be None
                 query = self._get_query(stream, partition, offset)
                 log.debug(f"Not first time retrieving non-partitioned stream {stream.name} (query: {query})")
-                docs = helpers.scan(self._es_client, index=stream.name, size=self._config.chunk_size,
-                                    query=query, request_timeout=DEFAULT_TIMEOUT)
-                all_docs = chain(all_docs, docs)
+                queries.append(query)
 
         # if partitions have been used, retrieve all other partitions that have no offset stored
         if stream.options.partition_key:
             log.debug(f"Make sure all non-present partitions are also retrieved for {stream.name}")
             query = self._get_query_exclude_partitions(stream.options.partition_key, partitions)
             log.debug(f"Retrieving documents for {stream.name}, query: {query}")
-            docs = helpers.scan(self._es_client, index=stream.name, size=self._config.chunk_size,
-                                query=query, request_timeout=DEFAULT_TIMEOUT)
-            all_docs = chain(all_docs, docs)
+            queries.append(query)
 
-        return all_docs
+        return queries
 
     # pylint: disable=no-self-use
-    def _get_query(self, stream: EventStream, partition: str, offset: str) -> dict:
+    def _get_query(self, stream: EventStream, partition: str, offset: str, partitioned: bool = True) -> dict:
         must = []
         if offset:
             offset_range = {"range": {stream.options.order_key: {"gt": offset}}}
             must.append(offset_range)
 
-        if stream.options.partition_key:
+        if stream.options.partition_key and partitioned:
             partition_filter = {"term": {stream.options.partition_key: partition}}
             must.append(partition_filter)
 
@@ -136,3 +209,9 @@ class EventsExporter:
             }
         }
     # pylint: enable=no-self-use
+
+
+def get_checkpoint_offset(offset: str) -> str:
+    # UTC, with `Z` notation like assisted-service timestamps
+    checkpoint = parse_timestamp(offset) - CHECKPOINT_OFFSET_MARGIN
+    return checkpoint.replace(tzinfo=None).isoformat(timespec="milliseconds") + "Z"
@@ -1 +1,2 @@
 from .assisted_service_api import InventoryClient, ClientFactory
+from .async_assisted_service_api import AsyncInventoryClient
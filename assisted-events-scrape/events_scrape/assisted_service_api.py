@@ -17,7 +17,8 @@ from kubernetes.config.kube_config import Configuration as KubeConfiguration
 from retry import retry
 from urllib3 import HTTPResponse
 
-from utils import log
+from process import get_host_inventory
+from utils import log, json_loads, json_dumps
 
 MINUTE = 60
 WAIT_FOR_BM_API = 15 * MINUTE
@@ -271,16 +272,14 @@ class InventoryClient(object):
         hosts = self.get_cluster_hosts(cluster_id)
         hosts_data = {}
         for host in hosts:
-            inventory = json.loads(host.get("inventory", '{"interfaces":[]}'))
-            hosts_data[host["id"]] = [interface["mac_address"] for interface in inventory["interfaces"]]
+            hosts_data[host["id"]] = get_host_macs(host)
         return hosts_data
 
     def get_host_by_mac(self, cluster_id: str, mac: str) -> Dict[str, Any]:
         hosts = self.get_cluster_hosts(cluster_id)
 
         for host in hosts:
-            inventory = json.loads(host.get("inventory", '{"interfaces":[]}'))
-            if mac.lower() in [interface["mac_address"].lower() for interface in inventory["interfaces"]]:
+            if mac.lower() in [host_mac.lower() for host_mac in get_host_macs(host)]:
                 return host
 
     def get_host_by_name(self, cluster_id: str, host_name: str) -> Dict[str, Any]:
@@ -373,7 +372,7 @@ class InventoryClient(object):
             _preload_content=False,
         )
 
-        return json.loads(response.data)
+        return json_loads(response.data)
 
     def download_cluster_events(self, cluster_id: str, output_file: str, categories=None) -> None:
         if categories is None:
@@ -483,8 +482,7 @@ class InventoryClient(object):
         return self.client.v2_get_credentials(cluster_id=cluster_id)
 
     def get_versions(self) -> dict:
-        response = self.versions.v2_list_component_versions()
-        return json.loads(json.dumps(response.to_dict(), sort_keys=True, default=str))
+        return get_versions_dict(self.versions.v2_list_component_versions())
 
     def get_openshift_versions(self) -> models.OpenshiftVersions:
         return self.versions.v2_list_supported_openshift_versions()
@@ -525,3 +523,14 @@ class ClientFactory:
         conf = KubeConfiguration()
         load_kube_config(config_file=kubeconfig_path, client_configuration=conf)
         return KubeApiClient(configuration=conf)
+
+
+def get_host_macs(host: Dict[str, Any]) -> List[str]:
+    inventory = get_host_inventory(host)
+    if not isinstance(inventory, dict):
+        return []
+    return [interface["mac_address"] for interface in inventory.get("interfaces", [])]
+
+
+def get_versions_dict(versions: models.ListVersions) -> dict:
+    return json_loads(json_dumps(versions.to_dict(), sort_keys=True, default=str))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from assisted_service_client import models
+from assisted_service_client.rest import ApiException
+
+from utils import log, json_loads
+from .assisted_service_api import InventoryClient, get_versions_dict
+
+DEFAULT_CONNECTIONS_LIMIT = 100
+DEFAULT_REQUEST_TIMEOUT = 60
+
+
+class AsyncInventoryClient:
+    """
+    Non-blocking client for the few assisted-service endpoints the scraper calls for each cluster.
+    It reuses host and authentication configuration (including API key refresh) from an
+    `InventoryClient`, and returns the same results as it does: responses are deserialized to models
+    by its `ApiClient` wherever `InventoryClient` returns models, or dicts of models.
+    The underlying HTTP session is created on first use, within the running event loop.
+    """
+    def __init__(self, inventory_client: InventoryClient, connections_limit: int = DEFAULT_CONNECTIONS_LIMIT,
+                 request_timeout: int = DEFAULT_REQUEST_TIMEOUT):
+        self._api = inventory_client.api
+        self._configuration = inventory_client.api.configuration
+        self._connections_limit = connections_limit
+        self._request_timeout = request_timeout
+        self._session = None
+
+    async def get_events(self, cluster_id: str, categories: Optional[List[str]] = None) -> List[dict]:
+        if categories is None:
+            categories = ["user"]
+        params = {"cluster_id": cluster_id, "categories": ",".join(categories)}
+        return json_loads(await self._get("/v2/events", params=params))
+
+    async def get_versions(self) -> dict:
+        return get_versions_dict(self._deserialize(await self._get("/v2/component-versions"), "ListVersions"))
+
+    async def get_cluster(self, cluster_id: str) -> models.Cluster:
+        return self._deserialize(await self._get(f"/v2/clusters/{cluster_id}"), "Cluster")
+
+    async def get_cluster_hosts(self, cluster_id: str) -> List[Dict[str, Any]]:
+        cluster = await self.get_cluster(cluster_id)
+        return [host.to_dict() for host in cluster.hosts or []]
+
+    async def get_infra_env(self, infra_env_id: str) -> models.InfraEnv:
+        return self._deserialize(await self._get(f"/v2/infra-envs/{infra_env_id}"), "InfraEnv")
+
+    async def infra_envs_list(self) -> List[dict]:
+        return self._deserialize(await self._get("/v2/infra-envs"), "InfraEnvList")
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _deserialize(self, data: str, response_type: str) -> Any:
+        return self._api.deserialize(SimpleNamespace(data=data), response_type)
+
+    async def _get(self, path: str, params: Optional[dict] = None) -> str:
+        """Returns the body of the response"""
+        url = self._configuration.host + path
+        response = await self._get_session().get(url, params=params, headers=self._get_auth_headers(), ssl=False)
+        try:
+            if response.status >= 300:
+                body = await response.text()
+                log.debug(f"GET {path} failed with status {response.status}: {body}")
+                raise ApiException(status=response.status, reason=response.reason)
+            return await response.text()
+        finally:
+            response.release()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._connections_limit),
+                timeout=aiohttp.ClientTimeout(total=self._request_timeout)
+            )
+        return self._session
+
+    def _get_auth_headers(self) -> Dict[str, str]:
+        # Computing auth settings triggers API key refresh, when needed
+        headers = {}
+        for auth in self._configuration.auth_settings().values():
+            if auth["in"] == "header" and auth["value"]:
+                headers[auth["key"]] = auth["value"]
+        return headers
@@ -4,14 +4,17 @@ import sys
 import time
 import logging
 import signal
+from datetime import datetime, timedelta
 import urllib3
 import sentry_sdk
 
-from events_scrape import ClientFactory
-from storage import ClusterEventsStorage, ElasticsearchStorage
-from workers import ClusterEventsWorker, ClusterEventsWorkerConfig
-from utils import ErrorCounter, Changes, log
-from config import ScraperConfig, EventStoreConfig
+from events_scrape import ClientFactory, AsyncInventoryClient
+from storage import ClusterEventsStorage, ElasticsearchStorage, AsyncClusterEventsStorage, \
+    AsyncElasticsearchStorage, create_cluster_state_store_from_env
+from workers import ClusterEventsWorker, ClusterEventsWorkerConfig, AsyncClusterEventsWorker
+from utils import ErrorCounter, Changes, ClusterWatermarks, log, set_hash_algorithm
+from config import ScraperConfig, EventStoreConfig, PipelineConfig, InfraEnvCacheConfig
+from config.scraper import ENGINE_ASYNCIO, ENGINE_PIPELINE
 
 WAIT_TIME = 60
 
@@ -24,22 +27,49 @@ es_logger.setLevel(logging.WARNING)
 class ScrapeEvents:
     def __init__(self, config: ScraperConfig):
         self._client = ClientFactory.create_client(url=config.inventory_url, offline_token=config.offline_token)
-        self._cluster_events_storage = ClusterEventsStorage.create_with_inventory_client(self._client, config)
+        self._state_store = create_cluster_state_store_from_env()
+        self._state_store.load()
 
         self._errors_before_restart = config.errors_before_restart
         self._max_idle_minutes = config.max_idle_minutes
         self._changes = Changes()
         self._error_counter = ErrorCounter()
         self._shutdown = False
+        self._watermarks = None
+        if config.incremental_polling:
+            self._watermarks = ClusterWatermarks()
+            self._watermarks.restore(self._state_store.get_all("watermark"))
+        self._full_reconcile_minutes = config.full_reconcile_minutes
+        # restored watermarks are trusted until the first full reconcile
+        self._last_full_reconcile = datetime.now()
+        event_store_config = EventStoreConfig.create_from_env()
+        set_hash_algorithm(event_store_config.hash_algorithm)
         worker_config = ClusterEventsWorkerConfig(
             config.n_workers,
             config.sentry,
             self._error_counter,
             self._changes,
-            EventStoreConfig.create_from_env()
+            event_store_config,
+            self._watermarks,
+            self._state_store,
+            infra_env_cache=InfraEnvCacheConfig.create_from_env()
         )
-        es_store = ElasticsearchStorage.create_from_env()
-        self._worker = ClusterEventsWorker(worker_config, self._client, self._cluster_events_storage, es_store)
+        if config.engine == ENGINE_PIPELINE:
+            worker_config.pipeline = PipelineConfig.create_from_env()
+        if config.engine == ENGINE_ASYNCIO:
+            log.info(f"Using asyncio engine, with up to {config.async_max_in_flight} clusters in flight")
+            self._worker = AsyncClusterEventsWorker(
+                worker_config,
+                AsyncInventoryClient(self._client),
+                AsyncClusterEventsStorage.create_from_env(config, self._state_store),
+                AsyncElasticsearchStorage.create_from_env(),
+                config.async_max_in_flight
+            )
+        else:
+            cluster_events_storage = ClusterEventsStorage.create_with_inventory_client(
+                self._client, config, self._state_store)
+            es_store = ElasticsearchStorage.create_from_env()
+            self._worker = ClusterEventsWorker(worker_config, self._client, cluster_events_storage, es_store)
 
     def is_idle(self):
         return not self._changes.has_changed_in_last_minutes(self._max_idle_minutes)
@@ -56,9 +86,44 @@ class ScrapeEvents:
         if not clusters:
             log.warning("No clusters were found.")
             return None
+
+        if self._watermarks is not None:
+            clusters = self._get_clusters_to_process(clusters)
+            if not clusters:
+                log.info("No cluster changed since last pass")
+                return None
+
         self._worker.process_clusters(clusters)
         log.info("Finish syncing all clusters")
 
+    def _get_clusters_to_process(self, clusters):
+        """
+        In incremental mode only clusters that changed since they were last processed are returned.
+        Periodically all clusters are returned (full reconcile), to catch missed updates; clusters
+        that are not listed anymore are forgotten.
+        """
+        now = datetime.now()
+        if self._last_full_reconcile + timedelta(minutes=self._full_reconcile_minutes) <= now:
+            log.info(f"Full reconcile: processing all {len(clusters)} clusters")
+            self._last_full_reconcile = now
+            cluster_ids = [cluster["id"] for cluster in clusters]
+            self._watermarks.prune(cluster_ids)
+            self._state_store.prune(cluster_ids)
+            return clusters
+
+        changed_clusters = self._watermarks.get_changed(clusters)
+        log.info(f"Incremental pass: {len(changed_clusters)} out of {len(clusters)} clusters changed")
+        return changed_clusters
+
+    def persist_state(self):
+        if self._watermarks is not None:
+            for cluster_id, watermark in self._watermarks.get_all().items():
+                self._state_store.update(cluster_id, watermark=watermark)
+        self._state_store.flush()
+
+    def close(self):
+        self._worker.close()
+
     def shutdown(self, sig, _):
         logging.info(f"Captured signal {sig}, shutting down")
         self._shutdown = True
@@ -87,17 +152,21 @@ def main():
     scrape_events = ScrapeEvents(config)
     handle_shutdown(scrape_events.shutdown)
     should_run = True
-    while should_run:
-        scrape_events.run_service()
-
-        if scrape_events.is_shutting_down():
-            should_run = False
-        elif scrape_events.is_idle():
-            log.error("Scraping is idle, exiting...")
-            should_run = False
-        elif scrape_events.has_too_many_unexpected_errors():
-            log.error("Too many unexpected errors, exiting")
-            should_run = False
-        log.info(f"Waiting {WAIT_TIME} seconds")
-        time.sleep(WAIT_TIME)
+    try:
+        while should_run:
+            scrape_events.run_service()
+            scrape_events.persist_state()
+
+            if scrape_events.is_shutting_down():
+                should_run = False
+            elif scrape_events.is_idle():
+                log.error("Scraping is idle, exiting...")
+                should_run = False
+            elif scrape_events.has_too_many_unexpected_errors():
+                log.error("Too many unexpected errors, exiting")
+                should_run = False
+            log.info(f"Waiting {WAIT_TIME} seconds")
+            time.sleep(WAIT_TIME)
+    finally:
+        scrape_events.close()
     sys.exit(1)
@@ -1,3 +1,3 @@
-from .host import get_hosts_summary, reshape_host
+from .host import get_hosts_summary, get_host_inventory, reshape_host
 
-__all__ = ["get_hosts_summary", "reshape_host"]
+__all__ = ["get_hosts_summary", "get_host_inventory", "reshape_host"]
@@ -1,4 +1,5 @@
 import json
+from utils import json_loads
 
 _ATTRIBUTES_TO_SUMMARIZE = {
     "infra_env": ["type", "cpu_architecture", "openshift_version"]
@@ -7,15 +8,28 @@ _ATTRIBUTES_TO_SUMMARIZE = {
 
 def reshape_host(host):
     if "inventory" in host:
-        try:
-            inventory = json.loads(host["inventory"])
-        except (TypeError, json.decoder.JSONDecodeError):
-            inventory = host["inventory"]
-
-        host["host_inventory"] = inventory
+        host["host_inventory"] = parse_inventory(host["inventory"])
         del host["inventory"]
 
 
+def get_host_inventory(host):
+    """
+    Returns the parsed inventory of the host. Reshaped hosts already hold it in `host_inventory`,
+    so it is parsed only for hosts that were not reshaped
+    """
+    if "host_inventory" in host:
+        return host["host_inventory"]
+    return parse_inventory(host.get("inventory"))
+
+
+def parse_inventory(inventory):
+    """Inventories are JSON strings: they are returned as they are when they cannot be parsed"""
+    try:
+        return json_loads(inventory)
+    except (TypeError, json.decoder.JSONDecodeError):
+        return inventory
+
+
 def get_hosts_summary(hosts):
     # get automatic summary
     summary = _get_summary(_ATTRIBUTES_TO_SUMMARIZE, hosts)
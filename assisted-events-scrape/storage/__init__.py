@@ -1,13 +1,34 @@
 from .cluster_events_storage import ClusterEventsStorage
-from .elasticsearch_storage import ElasticsearchStorage
-from .object_storage_writer import ObjectStorageWriter
+from .cluster_state_store import ClusterStateStore, SQLiteStateBackend, ElasticsearchStateBackend, \
+    create_cluster_state_store_from_env
+from .elasticsearch_storage import ElasticsearchStorage, DocumentsNotStoredException
+from .async_cluster_events_storage import AsyncClusterEventsStorage
+from .async_elasticsearch_storage import AsyncElasticsearchStorage
+from .documents_batch import DocumentsBatch
+from .object_storage_writer import ObjectStorageWriter, WriteCheckpoint
+from .parquet import ParquetOptions
 from .offset import DateOffset, DateOffsetOptions, DateOffsetRepository
+from .cursor import ScrollCursor, SearchAfterCursor, PointInTimeCursor, create_cursor
 
 __all__ = [
     "ClusterEventsStorage",
+    "ClusterStateStore",
+    "SQLiteStateBackend",
+    "ElasticsearchStateBackend",
+    "create_cluster_state_store_from_env",
     "ElasticsearchStorage",
+    "DocumentsNotStoredException",
+    "AsyncClusterEventsStorage",
+    "AsyncElasticsearchStorage",
+    "DocumentsBatch",
     "ObjectStorageWriter",
+    "WriteCheckpoint",
+    "ParquetOptions",
     "DateOffset",
     "DateOffsetOptions",
-    "DateOffsetRepository"
+    "DateOffsetRepository",
+    "ScrollCursor",
+    "SearchAfterCursor",
+    "PointInTimeCursor",
+    "create_cursor"
 ]
@@ -0,0 +1,82 @@
+from typing import Dict, Iterable, List, Set
+import opensearchpy
+from opensearchpy.helpers import async_bulk
+from clients import create_async_es_client_from_env
+from config import ScraperConfig
+from utils import log
+
+from .cluster_state_store import ClusterStateStore
+from .cluster_events_storage import BaseClusterEventsStorage, prepare_cluster_events, get_actions_chunks, \
+    has_bulk_conflicts, get_count_batches, get_event_count_query, add_event_counts, add_written_indices, \
+    get_indices_expression
+
+
+class AsyncClusterEventsStorage(BaseClusterEventsStorage):
+    """
+    Non-blocking counterpart of `ClusterEventsStorage`, used by the asyncio engine.
+    """
+    @classmethod
+    def create_from_env(cls, config: ScraperConfig,
+                        state_store: ClusterStateStore = None) -> 'AsyncClusterEventsStorage':
+        es_client = create_async_es_client_from_env()
+        return cls(es_client, config.inventory_url, config.elasticsearch.index_prefix, state_store)
+
+    async def store(self, component_versions, cluster, event_list, infra_envs):
+        prepared = prepare_cluster_events(component_versions, cluster, event_list, infra_envs)
+        events = self.process_events(prepared.cluster_metadata, prepared.event_list, prepared.event_names)
+        written_indices = set()
+        self._add_event_count(prepared.cluster_id, await self.store_events(events, written_indices=written_indices))
+
+        if await self.does_cluster_needs_full_update(prepared.cluster_id, prepared.event_list, written_indices):
+            log.info(f"Cluster {prepared.cluster_id} logged events are not same as the event count, "
+                     "logging all clusters events")
+            events = self.process_events(prepared.cluster_metadata, prepared.event_list, prepared.event_names)
+            self._add_event_count(prepared.cluster_id, await self.store_events(events, only_new_events=False))
+
+    async def store_events(self, events, only_new_events=True, written_indices: Set[str] = None) -> int:
+        """
+        Stores events, returns how many were created. Indices events were created in are added to `written_indices`
+        """
+        created = 0
+        for actions in get_actions_chunks(events, self._get_create_action, only_new_events):
+            chunk_created, errors = await async_bulk(self._es_client, actions, raise_on_error=False)
+            created += chunk_created
+            add_written_indices(written_indices, chunk_created, actions)
+            if has_bulk_conflicts(errors) and only_new_events:
+                break
+        return created
+
+    async def prefetch_event_counts(self, cluster_ids: List[str]) -> None:
+        self._set_event_indices(await self.get_event_indices_on_es_db())
+        cluster_ids = self._get_uncounted_cluster_ids(cluster_ids)
+        if cluster_ids:
+            self._set_event_counts(await self.get_cluster_event_counts_on_es_db(cluster_ids))
+
+    async def does_cluster_needs_full_update(self, cluster_id, event_list, written_indices: Iterable[str] = ()):
+        if self._has_expected_event_count(cluster_id, event_list):
+            return False
+        counts = await self.get_cluster_event_counts_on_es_db([cluster_id], refresh=written_indices)
+        return self._is_missing_events(cluster_id, event_list, counts[cluster_id])
+
+    async def get_event_indices_on_es_db(self) -> List[str]:
+        try:
+            return list(await self._es_client.indices.get_alias(index=self._get_index_pattern()))
+        except opensearchpy.NotFoundError:
+            return []
+
+    async def get_cluster_event_counts_on_es_db(self, cluster_ids: List[str],
+                                                refresh: Iterable[str] = ()) -> Dict[str, int]:
+        index_pattern = self._get_index_pattern()
+        counts = {cluster_id: 0 for cluster_id in cluster_ids}
+        try:
+            if refresh:
+                await self._es_client.indices.refresh(index=get_indices_expression(refresh))
+            for batch in get_count_batches(cluster_ids):
+                results = await self._es_client.search(index=index_pattern, body=get_event_count_query(batch))
+                add_event_counts(counts, results)
+        except opensearchpy.NotFoundError:
+            log.warning(f"Index {index_pattern} not found, returning 0 found values for {len(cluster_ids)} clusters")
+        return counts
+
+    async def close(self) -> None:
+        await self._es_client.close()
@@ -0,0 +1,61 @@
+from typing import List, Callable
+from clients import create_async_es_client_from_env
+from config import EventStoreConfig
+from config.event_store import WRITE_MODE_OPTIMISTIC
+from utils import BulkStats, log
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.helpers import ScanError, async_bulk, async_scan
+from opensearchpy.exceptions import NotFoundError
+from sentry_sdk import capture_exception
+
+from .elasticsearch_storage import DEFAULT_SCAN_SIZE, DEFAULT_SCROLL_WINDOW, get_existing_ids_query, \
+    get_create_actions, add_bulk_stats, capture_bulk_exception
+
+
+class AsyncElasticsearchStorage:
+    """
+    Non-blocking counterpart of `ElasticsearchStorage`, used by the asyncio engine.
+    """
+    @classmethod
+    def create_from_env(cls) -> 'AsyncElasticsearchStorage':
+        es_client = create_async_es_client_from_env()
+        config = EventStoreConfig.create_from_env()
+        return cls(es_client, optimistic=config.write_mode == WRITE_MODE_OPTIMISTIC)
+
+    def __init__(self, es_client: AsyncOpenSearch, optimistic: bool = False):
+        self._es_client = es_client
+        self._optimistic = optimistic
+        self.stats = BulkStats()
+
+    async def store_changes(self, index: str, documents: List[dict], id_fn: Callable[[dict], str],
+                            transform_document_fn: Callable[[dict], dict] = None, filter_by: dict = None) -> bool:
+        """
+        Stores documents that are not already stored. See `ElasticsearchStorage.store_changes`
+        """
+        existing_ids = set()
+        if not self._optimistic:
+            existing_ids = await self._get_existing_ids(index, filter_by)
+        actions = get_create_actions(index, documents, id_fn, transform_document_fn, existing_ids)
+        try:
+            inserted, errors = await async_bulk(self._es_client, actions, raise_on_error=False)
+            return add_bulk_stats(self.stats, index, inserted, errors) == 0
+        except Exception as e:
+            capture_bulk_exception(e)
+        return False
+
+    async def close(self) -> None:
+        await self._es_client.close()
+
+    async def _get_existing_ids(self, index: str, filter_by: dict = None):
+        existing_ids = set()
+        try:
+            async for doc in async_scan(self._es_client, index=index, query=get_existing_ids_query(filter_by),
+                                        size=DEFAULT_SCAN_SIZE, scroll=DEFAULT_SCROLL_WINDOW):
+                existing_ids.add(doc["_id"])
+        except ScanError as e:
+            capture_exception(e)
+            log.exception("captured exception while scanning")
+        except NotFoundError:
+            # first time we set documents index will be not found
+            pass
+        return existing_ids
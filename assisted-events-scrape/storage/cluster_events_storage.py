@@ -1,113 +1,313 @@
 import re
-import time
-import json
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
 from dateutil.parser import parse as parse_date
-from utils import log, get_event_id
+from utils import log, get_event_id, get_dict_hash, json_loads
 from clients import create_es_client_from_env
 from config import ScraperConfig
 from events_scrape import InventoryClient
 from process import get_hosts_summary
 import opensearchpy
+from opensearchpy import helpers
 
 from . import process
+from .cluster_state_store import ClusterStateStore
 
 MAX_EVENTS = 5000
+# Events are sent newest first, in growing chunks: most of the times only the first
+# few events are new, and we stop as soon as a chunk contains an already stored event
+BULK_CHUNK_SIZE_START = 10
+BULK_CHUNK_SIZE_MAX = 500
+HTTP_STATUS_CONFLICT = 409
+MONTH_REGEX = re.compile(r'^\d{4}-\d{2}')
+COUNT_BATCH_SIZE = 1000
 UUID_REGEX = r'[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab][a-f0-9]{3}-?[a-f0-9]{12}'
 
 
-class ClusterEventsStorage:
-    @classmethod
-    def create_with_inventory_client(cls, inventory_client: InventoryClient,
-                                     config: ScraperConfig) -> 'ClusterEventsStorage':
-        es_client = create_es_client_from_env()
-        return cls(inventory_client, es_client, config.inventory_url, config.elasticsearch.index_prefix)
+class PreparedClusterEvents(NamedTuple):
+    cluster_id: str
+    cluster_metadata: dict
+    event_list: List[dict]
+    event_names: List[str]
 
-    def __init__(self, assisted_client, es_client, inventory_url, index_prefix):
-        self._client = assisted_client
+
+class BaseClusterEventsStorage:
+    """
+    Bookkeeping shared by the blocking and the asyncio storages of legacy events, that does not involve any I/O
+    """
+    def __init__(self, es_client, inventory_url, index_prefix, state_store=None):
         self._es_client = es_client
         self._inventory_url = inventory_url
         self._index_prefix = index_prefix
-        self._cache_event_count_per_cluster = {}
+        if state_store is None:
+            state_store = ClusterStateStore()
+        self._state_store = state_store
+        # Identifies the event indices that stored event counts were counted in: counts are not valid anymore when
+        # indices are created or deleted, e.g. when monthly indices are rotated
+        self._event_indices_hash: Optional[str] = None
 
-    def store(self, component_versions, cluster, event_list, infra_envs):
-        cluster_id = cluster["id"]
+    def process_events(self, cluster_metadata, event_list, event_names):
+        return process_events(cluster_metadata, event_list, event_names, self._inventory_url)
 
-        event_count = len(event_list)
-        if event_count > MAX_EVENTS:
-            log.info(f"Cluster {cluster_id} has {event_count} event records, logging only {MAX_EVENTS}")
-            event_list = event_list[:MAX_EVENTS]
+    def _get_create_action(self, doc):
+        return get_create_action(doc, self._index_prefix, self._es_client.transport.serializer)
 
-        metadata = get_metadata(cluster, component_versions, infra_envs)
+    def _add_event_count(self, cluster_id, created):
+        # Keep the cached count in sync with what we store, so there is no need to count again
+        cluster_events_count = self._get_event_count(cluster_id)
+        if cluster_events_count is not None and created > 0:
+            self._state_store.update(cluster_id, event_count=cluster_events_count + created)
 
-        cluster_metadata = process_metadata(metadata)
-        event_names = get_cluster_object_names(cluster_metadata)
+    def _get_event_count(self, cluster_id) -> Optional[int]:
+        """Returns the stored event count of the cluster, None if it was not counted in the current event indices"""
+        if self._event_indices_hash is None or \
+                self._state_store.get(cluster_id, "event_indices_hash") != self._event_indices_hash:
+            return None
+        return self._state_store.get(cluster_id, "event_count")
 
-        events = self.process_events(cluster_metadata, event_list, event_names)
-        self.store_events(events)
+    def _set_event_indices(self, indices: Iterable[str]) -> None:
+        event_indices_hash = get_dict_hash({"indices": sorted(indices)})
+        if self._event_indices_hash is not None and event_indices_hash != self._event_indices_hash:
+            log.info("Event indices changed, clusters events will be counted again")
+        self._event_indices_hash = event_indices_hash
 
-        if self.does_cluster_needs_full_update(cluster_id, event_list):
-            log.info(f"Cluster {cluster_id} logged events are not same as the event count, logging all clusters events")
-            events = self.process_events(cluster_metadata, event_list, event_names)
-            self.store_events(events, only_new_events=False)
+    def _get_uncounted_cluster_ids(self, cluster_ids: List[str]) -> List[str]:
+        return [cluster_id for cluster_id in cluster_ids if self._get_event_count(cluster_id) is None]
 
-    def process_events(self, cluster_metadata, event_list, event_names):
-        for event in event_list[::-1]:
-            if process.is_event_skippable(event):
-                continue
-
-            cluster_metadata["no_name_message"] = get_no_name_message(event["message"], event_names)
-            cluster_metadata["inventory_url"] = self._inventory_url
-
-            if "props" in event:
-                event["event.props"] = json.loads(event["props"])
-
-            process_event_doc(event, cluster_metadata)
-            yield cluster_metadata
-            for key in event:
-                _ = cluster_metadata.pop(key, None)
-
-    def store_events(self, events, only_new_events=True):
-        for event in events:
-            doc_id = get_event_id(event)
-            ret = self.log_doc(event, doc_id)
-            if not ret and only_new_events:
-                break
+    def _set_event_count(self, cluster_id, count: int) -> None:
+        self._state_store.update(cluster_id, event_count=count, event_indices_hash=self._event_indices_hash)
 
-    def does_cluster_needs_full_update(self, cluster_id, event_list):
-        # check if cluster is missing past events
-        cluster_events_count = self._cache_event_count_per_cluster.get(cluster_id, None)
-        relevant_event_count = len([event for event in event_list if not process.is_event_skippable(event)])
+    def _set_event_counts(self, counts: Dict[str, int]) -> None:
+        for cluster_id, count in counts.items():
+            self._set_event_count(cluster_id, count)
+        log.info(f"Prefetched event count for {len(counts)} clusters")
 
-        if cluster_events_count and cluster_events_count == relevant_event_count:
-            return False
-        cluster_events_count_from_db = self.get_cluster_event_count_on_es_db(cluster_id)
-        self._cache_event_count_per_cluster[cluster_id] = cluster_events_count_from_db
+    def _has_expected_event_count(self, cluster_id, event_list) -> bool:
+        # a count of 0 is trusted as well: when no event is expected, no event can be missing
+        cluster_events_count = self._get_event_count(cluster_id)
+        return cluster_events_count is not None and cluster_events_count == get_relevant_event_count(event_list)
 
+    def _is_missing_events(self, cluster_id, event_list, cluster_events_count_from_db) -> bool:
+        self._set_event_count(cluster_id, cluster_events_count_from_db)
+        relevant_event_count = get_relevant_event_count(event_list)
         if cluster_events_count_from_db < relevant_event_count:
             missing_events = relevant_event_count - cluster_events_count_from_db
             log.info(f"cluster {cluster_id} is missing {missing_events} events")
             return True
         return False
 
-    def get_cluster_event_count_on_es_db(self, cluster_id):
-        time.sleep(1)
+    def _get_index_pattern(self) -> str:
+        return self._index_prefix + "*"
+
+
+class ClusterEventsStorage(BaseClusterEventsStorage):
+    @classmethod
+    def create_with_inventory_client(cls, inventory_client: InventoryClient, config: ScraperConfig,
+                                     state_store: ClusterStateStore = None) -> 'ClusterEventsStorage':
+        es_client = create_es_client_from_env()
+        return cls(inventory_client, es_client, config.inventory_url, config.elasticsearch.index_prefix,
+                   state_store)
+
+    def __init__(self, assisted_client, es_client, inventory_url, index_prefix, state_store=None):
+        super().__init__(es_client, inventory_url, index_prefix, state_store)
+        self._client = assisted_client
+
+    def store(self, component_versions, cluster, event_list, infra_envs):
+        self.store_prepared(prepare_cluster_events(component_versions, cluster, event_list, infra_envs))
+
+    def store_prepared(self, prepared: PreparedClusterEvents):
+        events = self.process_events(prepared.cluster_metadata, prepared.event_list, prepared.event_names)
+        written_indices = set()
+        self._add_event_count(prepared.cluster_id, self.store_events(events, written_indices=written_indices))
+
+        if self.does_cluster_needs_full_update(prepared.cluster_id, prepared.event_list, written_indices):
+            log.info(f"Cluster {prepared.cluster_id} logged events are not same as the event count, "
+                     "logging all clusters events")
+            events = self.process_events(prepared.cluster_metadata, prepared.event_list, prepared.event_names)
+            self._add_event_count(prepared.cluster_id, self.store_events(events, only_new_events=False))
+
+    def store_events(self, events, only_new_events=True, written_indices: Set[str] = None) -> int:
+        """
+        Stores events, returns how many were created. Indices events were created in are added to `written_indices`
+        """
+        created = 0
+        for actions in get_actions_chunks(events, self._get_create_action, only_new_events):
+            chunk_created, has_conflicts = self._bulk_create(actions)
+            created += chunk_created
+            add_written_indices(written_indices, chunk_created, actions)
+            if has_conflicts and only_new_events:
+                break
+        return created
+
+    def _bulk_create(self, actions):
+        """
+        Creates documents in bulk. Returns how many documents were created, and whether
+        any of the documents was already stored
+        """
+        created, errors = helpers.bulk(self._es_client, actions, raise_on_error=False)
+        return created, has_bulk_conflicts(errors)
+
+    def prefetch_event_counts(self, cluster_ids: List[str]) -> None:
+        """
+        Fills the event count cache for the given clusters, whose count is not known yet, or was counted before
+        event indices changed
+        """
+        self._set_event_indices(self.get_event_indices_on_es_db())
+        cluster_ids = self._get_uncounted_cluster_ids(cluster_ids)
+        if cluster_ids:
+            self._set_event_counts(self.get_cluster_event_counts_on_es_db(cluster_ids))
+
+    def does_cluster_needs_full_update(self, cluster_id, event_list, written_indices: Iterable[str] = ()):
+        # check if cluster is missing past events
+        if self._has_expected_event_count(cluster_id, event_list):
+            return False
+        # we might have just stored events: make sure they are visible when counting
+        cluster_events_count_from_db = self.get_cluster_event_count_on_es_db(cluster_id, refresh=written_indices)
+        return self._is_missing_events(cluster_id, event_list, cluster_events_count_from_db)
+
+    def get_event_indices_on_es_db(self) -> List[str]:
         try:
-            index_pattern = self._index_prefix + "*"
-            results = self._es_client.search(index=index_pattern,
-                                             body={"query": {"match_phrase": {"cluster.id": cluster_id}}})
+            return list(self._es_client.indices.get_alias(index=self._get_index_pattern()))
         except opensearchpy.NotFoundError:
-            log.warning(f"Index {self._index} not found, returning 0 found values for cluster ID {cluster_id}")
-            return 0
-        return results["hits"]["total"]["value"]
+            return []
+
+    def get_cluster_event_count_on_es_db(self, cluster_id, refresh: Iterable[str] = ()):
+        return self.get_cluster_event_counts_on_es_db([cluster_id], refresh=refresh)[cluster_id]
+
+    def get_cluster_event_counts_on_es_db(self, cluster_ids: List[str], refresh: Iterable[str] = ()) -> Dict[str, int]:
+        """
+        Counts events of each cluster with one terms aggregation per batch of clusters.
 
-    def log_doc(self, doc, id_):
+        :param List[str] cluster_ids: IDs of the clusters to count events for
+        :param Iterable[str] refresh: indices to refresh before counting, to take into account events just stored
+        in them
+        """
+        index_pattern = self._get_index_pattern()
+        counts = {cluster_id: 0 for cluster_id in cluster_ids}
         try:
-            index = self._index_prefix + parse_date(doc["event_time"]).strftime("%Y-%m")
-            res = self._es_client.create(index=index, body=doc, id=id_)
-        except opensearchpy.exceptions.ConflictError:
-            log.debug("Hit logged event")
-            return None
-        return res
+            if refresh:
+                self._es_client.indices.refresh(index=get_indices_expression(refresh))
+            for batch in get_count_batches(cluster_ids):
+                results = self._es_client.search(index=index_pattern, body=get_event_count_query(batch))
+                add_event_counts(counts, results)
+        except opensearchpy.NotFoundError:
+            log.warning(f"Index {index_pattern} not found, returning 0 found values for {len(cluster_ids)} clusters")
+        return counts
+
+
+def get_relevant_event_count(event_list) -> int:
+    return len([event for event in event_list if not process.is_event_skippable(event)])
+
+
+def get_count_batches(cluster_ids: List[str]) -> Iterable[List[str]]:
+    for i in range(0, len(cluster_ids), COUNT_BATCH_SIZE):
+        yield cluster_ids[i:i + COUNT_BATCH_SIZE]
+
+
+def add_event_counts(counts: Dict[str, int], results: dict) -> None:
+    for bucket in results["aggregations"]["event_count"]["buckets"]:
+        counts[bucket["key"]] = bucket["doc_count"]
+
+
+def get_event_count_query(cluster_ids: List[str]) -> dict:
+    return {
+        "size": 0,
+        "query": {"terms": {"cluster.id": cluster_ids}},
+        "aggs": {
+            "event_count": {
+                "terms": {"field": "cluster.id", "size": len(cluster_ids)}
+            }
+        }
+    }
+
+
+def add_written_indices(written_indices: Optional[Set[str]], created: int, actions: List[dict]) -> None:
+    if written_indices is not None and created > 0:
+        written_indices.update(action["_index"] for action in actions)
+
+
+def get_indices_expression(indices: Iterable[str]) -> str:
+    return ",".join(sorted(indices))
+
+
+def get_actions_chunks(events, get_action, only_new_events=True):
+    """
+    Yields bulk actions for the given events in chunks. When only new events are expected,
+    chunks start small and grow, as consumers stop at the first chunk with a stored event
+    """
+    chunk_size = BULK_CHUNK_SIZE_START if only_new_events else BULK_CHUNK_SIZE_MAX
+    actions = []
+    for event in events:
+        actions.append(get_action(event))
+        if len(actions) < chunk_size:
+            continue
+        yield actions
+        actions = []
+        chunk_size = min(chunk_size * 2, BULK_CHUNK_SIZE_MAX)
+    if actions:
+        yield actions
+
+
+def prepare_cluster_events(component_versions, cluster, event_list, infra_envs) -> PreparedClusterEvents:
+    """
+    Processes cluster metadata, shared by all the events of the cluster. This does not depend on
+    what is stored, so it can be done ahead of storing
+    """
+    event_count = len(event_list)
+    if event_count > MAX_EVENTS:
+        log.info(f"Cluster {cluster['id']} has {event_count} event records, logging only {MAX_EVENTS}")
+        event_list = event_list[:MAX_EVENTS]
+
+    metadata = get_metadata(cluster, component_versions, infra_envs)
+
+    cluster_metadata = process_metadata(metadata)
+    event_names = get_cluster_object_names(cluster_metadata)
+    return PreparedClusterEvents(cluster["id"], cluster_metadata, event_list, event_names)
+
+
+def process_events(cluster_metadata, event_list, event_names, inventory_url):
+    for event in event_list[::-1]:
+        if process.is_event_skippable(event):
+            continue
+
+        cluster_metadata["no_name_message"] = get_no_name_message(event["message"], event_names)
+        cluster_metadata["inventory_url"] = inventory_url
+
+        if "props" in event:
+            event["event.props"] = json_loads(event["props"])
+
+        process_event_doc(event, cluster_metadata)
+        yield cluster_metadata
+        for key in event:
+            _ = cluster_metadata.pop(key, None)
+
+
+def get_create_action(doc, index_prefix, serializer):
+    # events are yielded as the same dict being updated, so it needs to be serialized right away
+    return {
+        "_op_type": "create",
+        "_index": get_event_index(doc["event_time"], index_prefix),
+        "_id": get_event_id(doc),
+        "_source": serializer.dumps(doc)
+    }
+
+
+def get_event_index(event_time, index_prefix):
+    # ISO formatted dates start with the month, no need to parse them
+    if MONTH_REGEX.match(event_time):
+        return index_prefix + event_time[:7]
+    return index_prefix + parse_date(event_time).strftime("%Y-%m")
+
+
+def has_bulk_conflicts(errors) -> bool:
+    has_conflicts = False
+    for error in errors:
+        if error.get("create", {}).get("status") == HTTP_STATUS_CONFLICT:
+            has_conflicts = True
+        else:
+            log.warning(f"Error while creating event: {error}")
+    if has_conflicts:
+        log.debug("Hit logged event")
+    return has_conflicts
 
 
 def get_no_name_message(event_message: str, event_names: list):
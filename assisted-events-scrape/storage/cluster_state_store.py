@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Dict, Iterable, Optional
+from opensearchpy import OpenSearch, helpers
+from opensearchpy.exceptions import NotFoundError, TransportError, ConnectionTimeout
+from retry import retry
+from clients import create_es_client_from_env
+from config import StateStoreConfig
+from config.state_store import STATE_STORE_BACKEND_NONE, STATE_STORE_BACKEND_SQLITE, \
+    STATE_STORE_BACKEND_ELASTICSEARCH
+from utils import log
+
+HTTP_STATUS_NOT_FOUND = 404
+
+
+class SQLiteStateBackend:
+    """
+    Persists cluster states in a local SQLite database, one JSON document per cluster.
+    """
+    def __init__(self, path: str):
+        self._path = path
+        with closing(sqlite3.connect(self._path)) as conn:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS cluster_state (cluster_id TEXT PRIMARY KEY, state TEXT)")
+
+    def load(self) -> Dict[str, dict]:
+        with closing(sqlite3.connect(self._path)) as conn:
+            rows = conn.execute("SELECT cluster_id, state FROM cluster_state").fetchall()
+        return {cluster_id: json.loads(state) for cluster_id, state in rows}
+
+    def save(self, states: Dict[str, dict]) -> None:
+        with closing(sqlite3.connect(self._path)) as conn:
+            # connection context manager commits the transaction
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cluster_state (cluster_id, state) VALUES (?, ?)",
+                    [(cluster_id, json.dumps(state)) for cluster_id, state in states.items()]
+                )
+
+    def delete(self, cluster_ids: Iterable[str]) -> None:
+        with closing(sqlite3.connect(self._path)) as conn:
+            with conn:
+                conn.executemany("DELETE FROM cluster_state WHERE cluster_id = ?",
+                                 [(cluster_id,) for cluster_id in cluster_ids])
+
+
+class ElasticsearchStateBackend:
+    """
+    Persists cluster states in an Elasticsearch index, one document per cluster.
+    """
+    def __init__(self, es_client: OpenSearch, index: str):
+        self._es_client = es_client
+        self._index = index
+
+    def load(self) -> Dict[str, dict]:
+        states = {}
+        try:
+            for doc in self._scan():
+                states[doc["_id"]] = doc["_source"]
+        except NotFoundError:
+            # Index not created yet, no state stored
+            pass
+        return states
+
+    def save(self, states: Dict[str, dict]) -> None:
+        actions = ({
+            "_index": self._index,
+            "_op_type": "index",
+            "_id": cluster_id,
+            "_source": state
+        } for cluster_id, state in states.items())
+        helpers.bulk(self._es_client, actions)
+
+    def delete(self, cluster_ids: Iterable[str]) -> None:
+        actions = ({
+            "_index": self._index,
+            "_op_type": "delete",
+            "_id": cluster_id
+        } for cluster_id in cluster_ids)
+        # states that were never saved are not found
+        helpers.bulk(self._es_client, actions, ignore_status=(HTTP_STATUS_NOT_FOUND,))
+
+    @retry((TransportError, ConnectionTimeout), delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
+    def _scan(self):
+        return helpers.scan(self._es_client, index=self._index, query={"query": {"match_all": {}}})
+
+
+class ClusterStateStore:
+    """
+    Thread-safe, in-memory state of each cluster (event count, last event time, checksum, ...).
+    When a backend is set, state can be loaded on startup and changes are persisted on `flush`,
+    so that the scraper resumes warm after a restart.
+    """
+    def __init__(self, backend=None):
+        self.lock = threading.Lock()
+        self._backend = backend
+        self._states = {}
+        self._dirty = set()
+        self._deleted = set()
+
+    def load(self) -> None:
+        if not self._backend:
+            return
+        states = self._backend.load()
+        with self.lock:
+            self._states.update(states)
+        log.info(f"Loaded state for {len(states)} clusters")
+
+    def get(self, cluster_id: str, key: str, default: Any = None) -> Any:
+        with self.lock:
+            return self._states.get(cluster_id, {}).get(key, default)
+
+    def get_all(self, key: str) -> Dict[str, Any]:
+        with self.lock:
+            return {cluster_id: state[key] for cluster_id, state in self._states.items() if key in state}
+
+    def update(self, cluster_id: str, **fields) -> None:
+        with self.lock:
+            state = self._states.setdefault(cluster_id, {})
+            self._deleted.discard(cluster_id)
+            for key, value in fields.items():
+                if state.get(key) != value:
+                    state[key] = value
+                    self._dirty.add(cluster_id)
+
+    def prune(self, cluster_ids: Iterable[str]) -> None:
+        """Forget clusters that are not in the given list, i.e. deleted clusters. They are deleted on `flush`"""
+        keep = set(cluster_ids)
+        with self.lock:
+            for cluster_id in list(self._states):
+                if cluster_id not in keep:
+                    del self._states[cluster_id]
+                    self._dirty.discard(cluster_id)
+                    if self._backend:
+                        self._deleted.add(cluster_id)
+
+    def flush(self) -> None:
+        if not self._backend:
+            return
+        with self.lock:
+            dirty = {cluster_id: dict(self._states[cluster_id]) for cluster_id in self._dirty}
+            deleted = self._deleted
+            self._dirty = set()
+            self._deleted = set()
+        if not dirty and not deleted:
+            return
+        try:
+            if deleted:
+                self._backend.delete(deleted)
+                log.debug(f"Deleted state of {len(deleted)} clusters")
+            if dirty:
+                self._backend.save(dirty)
+                log.debug(f"Persisted state for {len(dirty)} clusters")
+        except Exception:
+            # Keep changes, so they are persisted on next flush
+            with self.lock:
+                self._dirty.update(dirty.keys())
+                self._deleted.update(deleted - self._states.keys())
+            log.exception("Error while persisting clusters state")
+
+
+def create_cluster_state_store_from_env(config: Optional[StateStoreConfig] = None) -> ClusterStateStore:
+    if config is None:
+        config = StateStoreConfig.create_from_env()
+    if config.backend == STATE_STORE_BACKEND_SQLITE:
+        return ClusterStateStore(SQLiteStateBackend(config.sqlite_path))
+    if config.backend == STATE_STORE_BACKEND_ELASTICSEARCH:
+        return ClusterStateStore(ElasticsearchStateBackend(create_es_client_from_env(), config.index))
+    if config.backend != STATE_STORE_BACKEND_NONE:
+        raise ValueError(f"Unknown state store backend: {config.backend}")
+    return ClusterStateStore()
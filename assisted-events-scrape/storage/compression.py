@@ -0,0 +1,50 @@
+import gzip
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+_EXTENSIONS = {
+    COMPRESSION_GZIP: ".gz",
+    COMPRESSION_ZSTD: ".zst",
+}
+
+
+def get_compression_extension(compression: Optional[str]) -> str:
+    """Suffix of keys of objects written with compression, empty without compression"""
+    if not compression:
+        return ""
+    if compression not in _EXTENSIONS:
+        raise ValueError(f"Unsupported compression {compression}, supported: {', '.join(sorted(_EXTENSIONS))}")
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        raise ValueError(f"{COMPRESSION_ZSTD} compression requires the zstandard package")
+    return _EXTENSIONS[compression]
+
+
+class CompressedTextStream:
+    """
+    Compresses text while it is written to a binary stream. Closing it flushes the compressor, then closes
+    the binary stream
+    """
+    def __init__(self, raw, compression: str):
+        self._raw = raw
+        if compression == COMPRESSION_ZSTD:
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=False)
+        else:
+            self._compressor = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=GZIP_LEVEL)
+
+    def write(self, data: str) -> int:
+        return self._compressor.write(data.encode("utf-8"))
+
+    def close(self) -> None:
+        try:
+            self._compressor.close()
+        finally:
+            self._raw.close()
@@ -0,0 +1,130 @@
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional
+from opensearchpy import OpenSearch, helpers
+from config.elasticsearch import CURSOR_SCROLL, CURSOR_SEARCH_AFTER, CURSOR_POINT_IN_TIME, SORTED_CURSORS
+
+DEFAULT_SCAN_SIZE = 1000
+DEFAULT_KEEP_ALIVE = "5m"
+# OpenSearch point in time API
+POINT_IN_TIME_PATH = "/_search/point_in_time"
+
+
+@dataclass
+class ScrollCursor:
+    """
+    Scans with a scroll context. Results are not sorted, so a scan cannot be resumed: `checkpoint` is always None
+    """
+    es_client: OpenSearch
+    index: str
+    query: dict
+    size: int = DEFAULT_SCAN_SIZE
+    request_timeout: Optional[float] = None
+    checkpoint = None
+
+    def __iter__(self) -> Iterator[dict]:
+        return helpers.scan(self.es_client, index=self.index, query=self.query, size=self.size,
+                            request_timeout=self.request_timeout)
+
+
+@dataclass
+class SearchAfterCursor:
+    """
+    Scans pages of sorted results with search_after, without keeping any context on the cluster.
+    `tiebreaker` is a stored field, unique to each document and sortable (e.g. a keyword), appended to the sort
+    so that search_after positions are unambiguous.
+    `checkpoint` holds the sort values of the last hit consumed: a cursor created with that checkpoint
+    resumes right after it.
+    """
+    es_client: OpenSearch
+    index: str
+    query: dict
+    tiebreaker: str
+    size: int = DEFAULT_SCAN_SIZE
+    request_timeout: Optional[float] = None
+    sort: Optional[List[Any]] = None
+    checkpoint: Optional[List[Any]] = None
+    _sort: List[Any] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._sort = get_sort(self.sort if self.sort is not None else self.query.get("sort"), self.tiebreaker)
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            hits = self._search()["hits"]["hits"]
+            for hit in hits:
+                yield hit
+                self.checkpoint = hit["sort"]
+            if len(hits) < self.size:
+                return
+
+    def _search(self) -> dict:
+        return self.es_client.search(index=self.index, body=self._get_body(), **self._get_kwargs())
+
+    def _get_body(self) -> dict:
+        body = dict(self.query, size=self.size, sort=self._sort)
+        if self.checkpoint is not None:
+            body["search_after"] = self.checkpoint
+        return body
+
+    def _get_kwargs(self) -> dict:
+        if self.request_timeout is None:
+            return {}
+        return {"request_timeout": self.request_timeout}
+
+
+@dataclass
+class PointInTimeCursor(SearchAfterCursor):
+    """
+    Same as `SearchAfterCursor`, within an OpenSearch point in time, so results are consistent for the whole scan.
+    The point in time is released when the scan ends; a checkpoint still resumes the scan once it is gone.
+    """
+    keep_alive: str = DEFAULT_KEEP_ALIVE
+    _pit_id: Optional[str] = field(default=None, init=False, repr=False)
+
+    def __iter__(self) -> Iterator[dict]:
+        self._pit_id = self.es_client.transport.perform_request(
+            "POST", f"/{self.index}{POINT_IN_TIME_PATH}", params={"keep_alive": self.keep_alive},
+            **self._get_kwargs())["pit_id"]
+        try:
+            yield from super().__iter__()
+        finally:
+            self.es_client.transport.perform_request(
+                "DELETE", POINT_IN_TIME_PATH, body={"pit_id": [self._pit_id]}, params={"ignore": 404})
+            self._pit_id = None
+
+    def _search(self) -> dict:
+        # searches within a point in time cannot target an index
+        response = self.es_client.search(body=self._get_body(), **self._get_kwargs())
+        # the point in time ID can change between searches
+        self._pit_id = response.get("pit_id", self._pit_id)
+        return response
+
+    def _get_body(self) -> dict:
+        return dict(super()._get_body(), pit={"id": self._pit_id, "keep_alive": self.keep_alive})
+
+
+def get_sort(sort: Optional[List[Any]], tiebreaker: str) -> List[Any]:
+    """Appends the tiebreaker to the sort, unless results are already sorted by it"""
+    sort = list(sort or [])
+    sort_fields = [field if isinstance(field, str) else next(iter(field)) for field in sort]
+    if tiebreaker not in sort_fields:
+        sort.append({tiebreaker: "asc"})
+    return sort
+
+
+def create_cursor(cursor: str, es_client: OpenSearch, index: str, query: dict, tiebreaker: Optional[str] = None,
+                  **kwargs):
+    """
+    Returns an iterable over the hits of query. Options that do not apply to the cursor, e.g. a checkpoint
+    for a scroll, are ignored.
+    Sorted cursors need `tiebreaker`, a unique stored field: without it, a scroll is used instead.
+    """
+    if cursor != CURSOR_SCROLL and cursor not in SORTED_CURSORS:
+        raise ValueError(f"Unsupported cursor {cursor}, supported: {CURSOR_SCROLL}, {CURSOR_SEARCH_AFTER}, "
+                         f"{CURSOR_POINT_IN_TIME}")
+    if cursor == CURSOR_SCROLL or tiebreaker is None:
+        return ScrollCursor(es_client, index, query, size=kwargs.get("size", DEFAULT_SCAN_SIZE),
+                            request_timeout=kwargs.get("request_timeout"))
+    if cursor == CURSOR_SEARCH_AFTER:
+        return SearchAfterCursor(es_client, index, query, tiebreaker, **kwargs)
+    return PointInTimeCursor(es_client, index, query, tiebreaker, **kwargs)
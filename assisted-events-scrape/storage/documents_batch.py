@@ -0,0 +1,81 @@
+import threading
+from typing import Callable, Dict, List
+from utils import log
+from .elasticsearch_storage import ElasticsearchStorage, DocumentsNotStoredException
+
+
+class DocumentsBatch:
+    """
+    Accumulates documents to be stored, across clusters, and stores them per index in batches
+    via `ElasticsearchStorage.store_changes_batch`. This way, existing documents are looked up
+    once per batch instead of once per cluster.
+    Documents are serialized when added, as callers might modify them afterwards.
+    Callbacks added along documents are called once the batch they belong to is stored: when storing fails,
+    `DocumentsNotStoredException` is raised and they are never called.
+    """
+    def __init__(self, es_store: ElasticsearchStorage, batch_size: int):
+        self.lock = threading.Lock()
+        self._es_store = es_store
+        self._batch_size = batch_size
+        self._documents = {}
+        self._on_stored = {}
+
+    def add(self, index: str, documents: list, id_fn: Callable[[dict], str],
+            transform_document_fn: Callable[[dict], dict] = None, on_stored: Callable[[], None] = None) -> None:
+        self.add_serialized(index, self.serialize(documents, id_fn, transform_document_fn), on_stored)
+
+    def serialize(self, documents: list, id_fn: Callable[[dict], str],
+                  transform_document_fn: Callable[[dict], dict] = None) -> Dict[str, str]:
+        """
+        Returns serialized documents keyed by ID, ready to be added with `add_serialized`.
+        It does not need the lock, so it can be done ahead, concurrently.
+        """
+        serialized = {}
+        for doc in documents:
+            doc_id = id_fn(doc)
+            if transform_document_fn:
+                doc = transform_document_fn(doc)
+            serialized[doc_id] = self._es_store.serialize(doc)
+        return serialized
+
+    def add_serialized(self, index: str, serialized: Dict[str, str], on_stored: Callable[[], None] = None) -> None:
+        if not serialized:
+            if on_stored is not None:
+                on_stored()
+            return
+
+        with self.lock:
+            index_documents = self._documents.setdefault(index, {})
+            for doc_id, doc in serialized.items():
+                # first document wins: same ID means same content
+                index_documents.setdefault(doc_id, doc)
+            if on_stored is not None:
+                self._on_stored.setdefault(index, []).append(on_stored)
+            if len(index_documents) < self._batch_size:
+                return
+            to_store = self._documents.pop(index)
+            on_batch_stored = self._on_stored.pop(index, [])
+        self._store(index, to_store, on_batch_stored)
+
+    def flush(self) -> None:
+        with self.lock:
+            to_store = self._documents
+            on_stored = self._on_stored
+            self._documents = {}
+            self._on_stored = {}
+        not_stored = None
+        for index, documents in to_store.items():
+            try:
+                self._store(index, documents, on_stored.get(index, []))
+            except DocumentsNotStoredException as e:
+                # other indices are stored nonetheless
+                not_stored = e
+        if not_stored is not None:
+            raise not_stored
+
+    def _store(self, index: str, documents: dict, on_stored: List[Callable[[], None]]) -> None:
+        log.debug(f"Storing batch of {len(documents)} documents in {index}")
+        if not self._es_store.store_changes_batch(index, documents):
+            raise DocumentsNotStoredException(f"Batch of {len(documents)} documents was not stored in {index}")
+        for callback in on_stored:
+            callback()
@@ -1,29 +1,52 @@
-from typing import List, Callable, Iterable
+from typing import Any, Dict, List, Callable, Iterable, Set, Tuple
 from clients import create_es_client_from_env
-from utils import log
+from config import EventStoreConfig
+from config.elasticsearch import CURSOR_SCROLL
+from config.event_store import WRITE_MODE_OPTIMISTIC
+from utils import BulkStats, log
 from opensearchpy import OpenSearch, helpers
 from opensearchpy.exceptions import NotFoundError, ConnectionTimeout, TransportError
 from retry import retry
 from sentry_sdk import capture_exception
+from .cursor import create_cursor
 
 DEFAULT_SCAN_SIZE = 500
 DEFAULT_SCROLL_WINDOW = '5m'
+DEFAULT_MGET_SIZE = 1000
+HTTP_STATUS_CONFLICT = 409
+# Stored fields holding the document ID, that scans sorted with search_after use as tiebreaker.
+# Scans of other indices use a scroll
+ID_FIELDS = {
+    EventStoreConfig.EVENTS_INDEX: "event_id",
+    EventStoreConfig.CLUSTER_EVENTS_INDEX: "cluster_state_id"
+}
+
+
+class DocumentsNotStoredException(Exception):
+    pass
 
 
 class ElasticsearchStorage:
     """
     This class is used to store documents in Elasticsearch.
+    In optimistic mode, existing documents are not retrieved before storing: documents are created
+    straight away, and the ones that already exist are rejected by Elasticsearch with a conflict.
+    This requires ID functions to be deterministic.
     """
     @classmethod
     def create_from_env(cls) -> 'ElasticsearchStorage':
         es_client = create_es_client_from_env()
-        return cls(es_client)
+        config = EventStoreConfig.create_from_env()
+        return cls(es_client, optimistic=config.write_mode == WRITE_MODE_OPTIMISTIC, cursor=config.scan_cursor)
 
-    def __init__(self, es_client: OpenSearch):
+    def __init__(self, es_client: OpenSearch, optimistic: bool = False, cursor: str = CURSOR_SCROLL):
         self._es_client = es_client
+        self._optimistic = optimistic
+        self._cursor = cursor
+        self.stats = BulkStats()
 
     def store_changes(self, index: str, documents: List[dict], id_fn: Callable[[dict], str],
-                      transform_document_fn: Callable[[dict], dict] = None, filter_by: dict = None):
+                      transform_document_fn: Callable[[dict], dict] = None, filter_by: dict = None) -> bool:
         """
         Stores documents that are not already stored, by retrieving what is stored first.
         It is very important to filter by a reasonable key for performance purposes: if we won't
@@ -36,6 +59,9 @@ class ElasticsearchStorage:
         and the output should be a string
         :param Callable[[dict], dict] transform_document_fn: Function to transform document. Useful to add/remove fields
         :param dict filter_by: Filter document when scanning. This is useful for performance
+
+        :return True when all documents are stored, either by this call or before it
+        :rtype bool
         """
         actions = self._get_new_documents_actions(
             index=index,
@@ -43,15 +69,66 @@ class ElasticsearchStorage:
             id_fn=id_fn,
             transform_document_fn=transform_document_fn,
             filter_by=filter_by)
-        self._bulk(actions)
+        return self._bulk(index, actions)
+
+    def serialize(self, document: dict) -> str:
+        return self._es_client.transport.serializer.dumps(document)
+
+    def store_changes_batch(self, index: str, documents: Dict[str, Any]) -> bool:
+        """
+        Stores documents that are not already stored. Unlike `store_changes`, documents can belong
+        to many clusters: existing IDs are resolved with one `mget` per chunk of IDs, and all new
+        documents are sent in one bulk.
+
+        :param str index: Index to store documents in
+        :param Dict[str, Any] documents: Documents to be stored, keyed by ID. Documents can be already
+        serialized to JSON strings
+
+        :return True when all documents are stored, either by this call or before it
+        :rtype bool
+        """
+        existing_ids = set()
+        if not self._optimistic:
+            existing_ids = self._get_existing_ids(index, list(documents.keys()))
+        log.debug(f"Storing {len(documents) - len(existing_ids)} out of {len(documents)} documents in {index}")
+        actions = ({
+            "_index": index,
+            "_id": doc_id,
+            "_source": doc,
+            "_op_type": "create"
+        } for doc_id, doc in documents.items() if doc_id not in existing_ids)
+        return self._bulk(index, actions)
+
+    def _get_existing_ids(self, index: str, ids: List[str]) -> Set[str]:
+        existing_ids = set()
+        for i in range(0, len(ids), DEFAULT_MGET_SIZE):
+            try:
+                response = self._mget(index, ids[i:i + DEFAULT_MGET_SIZE])
+            except NotFoundError:
+                # first time we set documents index will be not found
+                return existing_ids
+            for doc in response["docs"]:
+                if doc.get("found"):
+                    existing_ids.add(doc["_id"])
+        return existing_ids
 
     @retry((TransportError, ConnectionTimeout), delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
-    def _bulk(self, actions):
+    def _mget(self, index: str, ids: List[str]) -> dict:
+        return self._es_client.mget(index=index, body={"ids": ids}, _source=False)
+
+    def _bulk(self, index, actions) -> bool:
         try:
-            helpers.bulk(self._es_client, actions, raise_on_error=False)
+            # actions are sent again when retrying: a generator would be consumed by the first attempt
+            inserted, errors = self._retry_bulk(list(actions))
         except Exception as e:
-            capture_exception(e)
-            log.exception("captured exception while bulk index")
+            capture_bulk_exception(e)
+            return False
+        return add_bulk_stats(self.stats, index, inserted, errors) == 0
+
+    @retry((TransportError, ConnectionTimeout), delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
+    def _retry_bulk(self, actions: List[dict]) -> Tuple[int, List[dict]]:
+        # documents created by a failed attempt are conflicts when sent again, which count as stored
+        return helpers.bulk(self._es_client, actions, raise_on_error=False)
 
     def _get_new_documents_actions(self, index: str, documents: List[dict],
                                    id_fn: Callable[[dict], str], transform_document_fn: Callable[[dict], dict],
@@ -69,28 +146,17 @@ class ElasticsearchStorage:
         :return Generator containing elasticsearch bulk actions.
         :rtype Iterable[dict]
         """
-        def identity(x: dict) -> dict:
-            return x
-
         all_ids = set()
-        if filter_by is None:
-            filter_by = {"match_all": {}}
-
-        query = {
-            "query": filter_by,
-            "_source": [""]
-        }
+        query = get_existing_ids_query(filter_by)
 
         existing_docs = []
         try:
-            existing_docs = self._scan(index=index, query=query)
+            if not self._optimistic:
+                existing_docs = self._scan(index=index, query=query)
         except helpers.ScanError as e:
             capture_exception(e)
             log.exception("captured exception while scanning")
 
-        if transform_document_fn is None:
-            transform_document_fn = identity
-
         try:
             for d in existing_docs:
                 all_ids.add(d["_id"])
@@ -99,19 +165,51 @@ class ElasticsearchStorage:
             # In this case, there are no existing documents
             pass
 
-        # we are using create operation: should not overwrite an existing doc,
-        # as it could change its date and mess up export
-
-        for d in documents:
-            doc_id = id_fn(d)
-            if doc_id not in all_ids:
-                yield {
-                    "_index": index,
-                    "_id": doc_id,
-                    "_source": transform_document_fn(d),
-                    "_op_type": "create"
-                }
+        return get_create_actions(index, documents, id_fn, transform_document_fn, all_ids)
 
     @retry((TransportError, ConnectionTimeout), delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
     def _scan(self, index, query):
-        return helpers.scan(self._es_client, index=index, query=query)
+        return create_cursor(self._cursor, self._es_client, index, query, tiebreaker=ID_FIELDS.get(index))
+
+
+def get_existing_ids_query(filter_by: dict = None) -> dict:
+    if filter_by is None:
+        filter_by = {"match_all": {}}
+    return {
+        "query": filter_by,
+        "_source": [""]
+    }
+
+
+def get_create_actions(index: str, documents: List[dict], id_fn: Callable[[dict], str],
+                       transform_document_fn: Callable[[dict], dict], existing_ids: Set[str]) -> Iterable[dict]:
+    # we are using create operation: should not overwrite an existing doc,
+    # as it could change its date and mess up export
+    for d in documents:
+        doc_id = id_fn(d)
+        if doc_id not in existing_ids:
+            yield {
+                "_index": index,
+                "_id": doc_id,
+                "_source": transform_document_fn(d) if transform_document_fn else d,
+                "_op_type": "create"
+            }
+
+
+def add_bulk_stats(stats: BulkStats, index: str, inserted: int, errors: List[dict]) -> int:
+    """Returns the number of documents that failed to be stored: conflicts are documents already stored"""
+    duplicates = len([e for e in errors if _get_item_status(e) == HTTP_STATUS_CONFLICT])
+    stats.add(index, inserted=inserted, duplicates=duplicates, errors=len(errors) - duplicates)
+    return len(errors) - duplicates
+
+
+def capture_bulk_exception(e: Exception) -> None:
+    capture_exception(e)
+    log.exception("captured exception while bulk index")
+
+
+def _get_item_status(item: dict) -> int:
+    """Returns status of a bulk response item, i.e. {"create": {"status": 409, ...}}"""
+    for result in item.values():
+        return result.get("status")
+    return None
@@ -0,0 +1,121 @@
+import io
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+from utils import log
+
+# Minimum size of all parts but the last one, allowed by AWS S3
+MIN_PART_SIZE = 5 * 1024 ** 2
+
+
+class UploadPool:
+    """
+    Uploads parts of all the objects written at the same time, on `concurrency` threads.
+    Parts waiting for a thread count in memory: submitting a part blocks while `max_pending` parts are pending,
+    so serialization does not get ahead of uploads
+    """
+    def __init__(self, client, concurrency: int, part_size: int = MIN_PART_SIZE, max_pending: int = 0):
+        self.client = client
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="upload")
+        self._pending = threading.BoundedSemaphore(max_pending or 2 * concurrency)
+
+    def open(self, bucket: str, key: str) -> 'MultipartUploadStream':
+        return MultipartUploadStream(self, bucket, key)
+
+    def submit(self, fn, *args) -> Future:
+        self._pending.acquire()  # pylint: disable=consider-using-with
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> 'UploadPool':
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+class MultipartUploadStream(io.BufferedIOBase):
+    """
+    Binary stream to bucket/key: each `part_size` bytes written are uploaded by the pool as a part, while writing
+    goes on. Closing it uploads the last part and completes the upload, objects smaller than a part are uploaded
+    in one request. A failed upload is aborted, and its error raised by `write` or `close`
+    """
+    def __init__(self, pool: UploadPool, bucket: str, key: str):
+        super().__init__()
+        self._pool = pool
+        self._bucket = bucket
+        self._key = key
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Future] = []
+
+    def writable(self) -> bool:  # pylint: disable=no-self-use
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError(f"Writing to closed object {self._key}")
+        self._buffer += data
+        if len(self._buffer) >= self._pool.part_size:
+            self._upload_part()
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self._pool.client.put_object(Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part()
+                self._complete()
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    def _upload_part(self) -> None:
+        self._raise_failed_upload()
+        if self._upload_id is None:
+            self._upload_id = self._pool.client.create_multipart_upload(Bucket=self._bucket, Key=self._key)["UploadId"]
+        part, self._buffer = bytes(self._buffer), bytearray()
+        self._parts.append(self._pool.submit(self._put_part, len(self._parts) + 1, part))
+
+    def _put_part(self, number: int, part: bytes) -> dict:
+        response = self._pool.client.upload_part(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                                 PartNumber=number, Body=part)
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def _complete(self) -> None:
+        try:
+            parts = [future.result() for future in self._parts]
+        except Exception:
+            self._abort()
+            raise
+        self._pool.client.complete_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+                                                    MultipartUpload={"Parts": parts})
+
+    def _raise_failed_upload(self) -> None:
+        failed = next((future for future in self._parts if future.done() and future.exception()), None)
+        if failed is not None:
+            self._abort()
+            self._buffer = bytearray()
+            super().close()
+            raise failed.exception()
+
+    def _abort(self) -> None:
+        for future in self._parts:
+            future.cancel()
+        try:
+            self._pool.client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning(f"Failed to abort upload of {self._key}: {e}")
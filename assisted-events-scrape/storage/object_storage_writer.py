@@ -1,14 +1,33 @@
-from typing import Iterable, Callable
+import contextlib
+import io
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Callable, Dict, Optional
 import tempfile
-import json
 import boto3
+import botocore.config
 import smart_open
-import dpath.util
-from utils import log
+from utils import log, compile_getter, json_dumps
 from config import ObjectStorageConfig
+from .compression import CompressedTextStream, get_compression_extension
+from .multipart_upload import UploadPool
+from .parquet import ParquetObject, ParquetOptions, check_parquet_support
 from .offset import DateOffsetOptions, DateOffset
 
 
+@dataclass
+class WriteCheckpoint:
+    """
+    Calls `fn` every `documents` documents or `seconds` seconds, once all the objects written so far are complete,
+    with the offset of the documents they contain
+    """
+    fn: Callable[[DateOffset], None]
+    documents: int = 0
+    seconds: float = 0
+
+
 class ObjectStorageWriter:
     """
     Writes documents to object storage
@@ -24,7 +43,9 @@ class ObjectStorageWriter:
             aws_access_key_id=config.access_key,
             aws_secret_access_key=config.secret_key
         )
-        client = session.client('s3', endpoint_url=config.endpoint_url)
+        # Each upload thread needs its own connection, botocore keeps 10 by default
+        client_config = botocore.config.Config(max_pool_connections=max(10, config.upload_concurrency))
+        client = session.client('s3', endpoint_url=config.endpoint_url, config=client_config)
         return cls(client, config)
 
     def __init__(self, client, config: ObjectStorageConfig):
@@ -32,44 +53,56 @@ class ObjectStorageWriter:
         self.client = client
 
     def write_ndjson_stream(self, key_fn: Callable[[dict], str], documents: Iterable[dict],
-                            options: DateOffsetOptions = None) -> DateOffset:
+                            options: DateOffsetOptions = None, checkpoint: Optional[WriteCheckpoint] = None,
+                            compression: Optional[str] = None) -> DateOffset:
 
         """
         Stream documents to bucket/key.
 
         :param str key: Key to write documents to
         :param Iterable[str] documents: Documents to be streamed at bucket/key
+        :param WriteCheckpoint checkpoint: When to report offsets of complete objects. Documents of a key written
+        after a checkpoint go to a new object, whose key is suffixed by a part number
+        :param str compression: `gzip` or `zstd`, documents are compressed while they are streamed. The extension
+        of the compression is appended to keys
+        """
+        with self._create_upload_pool() as upload_pool:
+            streams = _NdjsonStreams(self.client, self.config, upload_pool, compression)
+            return self._write_stream(streams, key_fn, documents, options, checkpoint)
+
+    def write_parquet_stream(self, key_fn: Callable[[dict], str], documents: Iterable[dict],
+                             options: DateOffsetOptions = None, checkpoint: Optional[WriteCheckpoint] = None,
+                             parquet_options: Optional[ParquetOptions] = None) -> DateOffset:
         """
+        Same as `write_ndjson_stream`, documents are written as Parquet row groups.
+        Column types are inferred and unified across the first row groups of each object: documents that do not fit
+        the schema of the object they are written to go to a new object, whose key is suffixed by a part number
+
+        :param ParquetOptions parquet_options: Row groups size and pages compression, snappy by default
+        """
+        parquet_options = parquet_options or ParquetOptions()
+        check_parquet_support(parquet_options)
+        with self._create_upload_pool() as upload_pool:
+            streams = _ParquetStreams(self.client, self.config, upload_pool, parquet_options)
+            return self._write_stream(streams, key_fn, documents, options, checkpoint)
+
+    def _create_upload_pool(self):
+        """
+        With upload concurrency, parts of all the objects being written are uploaded by a pool of threads while
+        documents are serialized. Otherwise each part is uploaded when it is written
+        """
+        if not self.config.upload_concurrency:
+            return contextlib.nullcontext()
+        return UploadPool(self.client, self.config.upload_concurrency, self.config.part_size)
+
+    def _write_stream(self, streams: '_ObjectStreams', key_fn: Callable[[dict], str], documents: Iterable[dict],
+                      options: Optional[DateOffsetOptions], checkpoint: Optional[WriteCheckpoint]) -> DateOffset:
         offset = None
         if options:
             offset = DateOffset()
 
-        buff = {}
-        streams = {}
+        timer = _CheckpointTimer(checkpoint.documents, checkpoint.seconds) if checkpoint else None
         for document in documents:
-            key = key_fn(document)
-            stream = streams.get(key)
-            if not stream:
-                # pylint: disable=consider-using-with
-                buff[key] = tempfile.NamedTemporaryFile(delete=True)
-                # pylint: enable=consider-using-with
-
-                transport_params = dict(
-                    client=self.client,
-                    # 5MB is the minimum part size allowed by AWS S3
-                    # We need this number as low as possible, as we will have several multipart upload
-                    # in progress when importing large datasets
-                    min_part_size=5 * 1024 ** 2,
-                    # We also buffer on disk
-                    writebuffer=buff[key]
-                )
-
-                streams[key] = smart_open.open(
-                    f"s3://{self.config.bucket}/{key}",
-                    "w",
-                    transport_params=transport_params
-                )
-
             if options:
                 doc_offset = None
                 partition = None
@@ -80,25 +113,169 @@ class ObjectStorageWriter:
                 offset.setOffset(doc_offset, partition)
 
             log.debug(f"Writing document: {document}")
-            document_str = json.dumps(document)
-            streams[key].write(document_str + "\n")
+            streams.write(key_fn(document), document)
+
+            if timer and timer.is_due():
+                streams.close()
+                checkpoint.fn(offset)
+                timer.reset()
 
-        for stream in streams.values():
-            stream.close()
-        for buff in buff.values():
-            buff.close()
+        streams.close()
         return offset
 
+    # Paths are compiled once and cached, not on each document
     # pylint: disable=no-self-use
     def _get_partition_from_doc(self, doc: dict, partition_key: str) -> str:
-        try:
-            return dpath.util.get(doc, partition_key, separator=".")
-        except KeyError:
-            return None
+        return compile_getter(partition_key)(doc)
 
     def _get_offset_from_doc(self, doc: dict, order_key: str) -> str:
-        try:
-            return dpath.util.get(doc, order_key, separator=".")
-        except KeyError:
-            return None
+        return compile_getter(order_key)(doc)
     # pylint: enable=no-self-use
+
+
+class _ObjectStreams:
+    """
+    Open multipart uploads, one per key. Closing them completes the objects: keys written again afterwards
+    are written to new objects, with a part number suffix.
+    When `max_open` is set, opening a stream beyond it closes the least recently written one first, so the number
+    of buffers does not depend on the number of keys
+    """
+    _extension = ""
+
+    def __init__(self, client, config: ObjectStorageConfig, upload_pool: Optional[UploadPool] = None):
+        self._client = client
+        self._bucket = config.bucket
+        self._max_open = config.max_open_streams
+        self._part_size = config.part_size
+        self._upload_pool = upload_pool
+        self._streams = OrderedDict()
+        self._buffers = {}
+        self._parts: Dict[str, int] = {}
+
+    def write(self, key: str, document: dict) -> None:
+        self._write(key, self._get_stream(key), document)
+
+    def close(self) -> None:
+        while self._streams:
+            self._close_stream(next(iter(self._streams)))
+
+    def _write(self, key: str, stream, document: dict) -> None:
+        raise NotImplementedError
+
+    def _open(self, key: str):
+        raise NotImplementedError
+
+    def _get_stream(self, key: str):
+        stream = self._streams.get(key)
+        if stream is None:
+            if self._max_open and len(self._streams) >= self._max_open:
+                self._close_stream(next(iter(self._streams)))
+            stream = self._streams[key] = self._open(key)
+        else:
+            self._streams.move_to_end(key)
+        return stream
+
+    def _close_stream(self, key: str) -> None:
+        stream = self._streams.pop(key)
+        log.debug(f"Closing object {self._get_object_key(key)}")
+        stream.close()
+        buffer = self._buffers.pop(key, None)
+        if buffer is not None:
+            buffer.close()
+        self._parts[key] = self._parts.get(key, 0) + 1
+
+    def _open_object(self, key: str, mode: str):
+        if self._upload_pool is not None:
+            stream = self._upload_pool.open(self._bucket, self._get_object_key(key))
+            return stream if mode == "wb" else io.TextIOWrapper(stream, encoding="utf-8")
+
+        # pylint: disable=consider-using-with
+        self._buffers[key] = tempfile.NamedTemporaryFile(delete=True)
+        # pylint: enable=consider-using-with
+
+        transport_params = dict(
+            client=self._client,
+            # 5MB is the minimum part size allowed by AWS S3
+            # We need this number as low as possible, as we will have several multipart upload
+            # in progress when importing large datasets
+            min_part_size=self._part_size,
+            # We also buffer on disk
+            writebuffer=self._buffers[key]
+        )
+
+        url = f"s3://{self._bucket}/{self._get_object_key(key)}"
+        return smart_open.open(url, mode, compression="disable", transport_params=transport_params)
+
+    def _get_object_key(self, key: str) -> str:
+        return get_part_key(key, self._parts.get(key, 0)) + self._extension
+
+
+class _NdjsonStreams(_ObjectStreams):
+    def __init__(self, client, config: ObjectStorageConfig, upload_pool: Optional[UploadPool] = None,
+                 compression: Optional[str] = None):
+        super().__init__(client, config, upload_pool)
+        self._compression = compression
+        self._extension = get_compression_extension(compression)
+
+    def _write(self, key: str, stream, document: dict) -> None:
+        stream.write(json_dumps(document) + "\n")
+
+    def _open(self, key: str):
+        if not self._compression:
+            return self._open_object(key, "w")
+        return CompressedTextStream(self._open_object(key, "wb"), self._compression)
+
+
+class _ParquetStreams(_ObjectStreams):
+    """Rows left buffered when an object does not fit them anymore are written to the next object of the key"""
+    def __init__(self, client, config: ObjectStorageConfig, upload_pool: Optional[UploadPool] = None,
+                 options: Optional[ParquetOptions] = None):
+        super().__init__(client, config, upload_pool)
+        self._options = options or ParquetOptions()
+
+    def _write(self, key: str, stream, document: dict) -> None:
+        if not stream.write(document):
+            self._move_rows_to_next_object(key, stream)
+
+    def _open(self, key: str):
+        return ParquetObject(self._open_object(key, "wb"), self._options)
+
+    def _close_stream(self, key: str) -> None:
+        stream = self._streams[key]
+        if not stream.write_row_group():
+            self._move_rows_to_next_object(key, stream)
+        super()._close_stream(key)
+
+    def _move_rows_to_next_object(self, key: str, stream: ParquetObject) -> None:
+        rows, stream.rows = stream.rows, []
+        super()._close_stream(key)
+        next_stream = self._get_stream(key)
+        next_stream.rows = rows
+        next_stream.write_row_group()
+
+
+class _CheckpointTimer:
+    def __init__(self, documents: int, seconds: float, now: Callable[[], float] = time.monotonic):
+        self._documents = documents
+        self._seconds = seconds
+        self._now = now
+        self._count = 0
+        self._started_at = now()
+
+    def is_due(self) -> bool:
+        self._count += 1
+        if self._documents and self._count >= self._documents:
+            return True
+        return bool(self._seconds) and self._now() - self._started_at >= self._seconds
+
+    def reset(self) -> None:
+        self._count = 0
+        self._started_at = self._now()
+
+
+def get_part_key(key: str, part: int) -> str:
+    """The first part is written to key, next ones are numbered: foo/bar.ndjson, foo/bar-1.ndjson..."""
+    if part == 0:
+        return key
+    root, extension = os.path.splitext(key)
+    return f"{root}-{part}{extension}"
@@ -1,12 +1,18 @@
-from typing import Iterable, List
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 from dataclasses import dataclass
-from datetime import timezone
-from dateutil.parser import parse
 from opensearchpy import OpenSearch, helpers
 from opensearchpy.exceptions import NotFoundError, TransportError, ConnectionTimeout
 from retry import retry
+from config.elasticsearch import CURSOR_SCROLL
+from utils import get_timestamp_micros
+from .cursor import create_cursor
 
-MAX_OFFSET_ITEMS = 10000
+# Offsets are loaded in pages of this many documents, there is no limit on the number of partitions
+OFFSET_LOAD_PAGE_SIZE = 5000
+# Offsets of a stream are unique per partition. The offsets index is mapped dynamically: strings are only
+# sortable through their keyword sub-field
+OFFSET_TIEBREAKER = "partition.keyword"
 
 
 @dataclass
@@ -16,41 +22,79 @@ class DateOffsetOptions:
 
 
 class DateOffset:
-    def __init__(self, items: List[dict] = None):
-        self._offsets = {}
+    """
+    Offsets of partitions: partition keys are mapped to slots, which hold offsets as given in a list, and as
+    microseconds since epoch in an array of 64 bits integers to compare them.
+    Offsets are kept as given, time zone included, since they are used as is in queries and saved documents
+    """
+    def __init__(self, items: Iterable[dict] = None):
+        self._slots: Dict[Any, int] = {}
+        self._offsets: List[str] = []
+        self._micros = array("q")
         if items:
             for item in items:
                 self.setOffset(item.get("offset"), item.get("partition"))
 
     def __repr__(self):
-        return str(self._offsets)
+        return str(self.getAll())
 
     def size(self):
-        return len(self._offsets)
+        return len(self._slots)
 
     def setOffset(self, offset: str, partition: str = None):
         """
         When partition is none, it means there is no partition.
-        In this case offset will be kept track with `None` key
+        In this case offset will be kept track with `None` key.
+        A missing offset, e.g. a document without order key, is ignored: the partition offset is left unchanged
         """
-        if partition in self._offsets:
-            current_offset = parse(self._offsets[partition]).replace(tzinfo=timezone.utc)
-            proposed_offset = parse(offset).replace(tzinfo=timezone.utc)
-            if current_offset > proposed_offset:
-                return None
-        self._offsets[partition] = offset
+        if offset is None:
+            return None
+        proposed_offset = get_timestamp_micros(offset)
+        slot = self._slots.get(partition)
+        if slot is None:
+            self._slots[partition] = len(self._offsets)
+            self._offsets.append(offset)
+            self._micros.append(proposed_offset)
+            return None
+        if self._micros[slot] > proposed_offset:
+            return None
+        self._offsets[slot] = offset
+        self._micros[slot] = proposed_offset
+        return None
+
+    def isAfter(self, offset: str, partition: str = None) -> bool:
+        """
+        Whether offset is later than the partition offset, or the partition has no offset yet
+        """
+        slot = self._slots.get(partition)
+        if slot is None:
+            return True
+        return get_timestamp_micros(offset) > self._micros[slot]
+
+    def getMinOffset(self) -> str:
+        """Earliest offset of all partitions, None when there is no offset"""
+        if not self._offsets:
+            return None
+        return self._offsets[self._micros.index(min(self._micros))]
 
     def getOffset(self, partition: str = None) -> str:
-        return self._offsets.get(partition, None)
+        slot = self._slots.get(partition)
+        return None if slot is None else self._offsets[slot]
+
+    def items(self) -> Iterator[Tuple[Any, str]]:
+        """Partitions and their offset, without building a dict as `getAll` does"""
+        for partition, slot in self._slots.items():
+            yield partition, self._offsets[slot]
 
     def getAll(self) -> dict:
-        return self._offsets
+        return dict(self.items())
 
 
 class DateOffsetRepository:
-    def __init__(self, es_client: OpenSearch, offset_index: str):
+    def __init__(self, es_client: OpenSearch, offset_index: str, cursor: str = CURSOR_SCROLL):
         self._es_client = es_client
         self._offset_index = offset_index
+        self._cursor = cursor
 
     def save(self, stream: str, offsets: DateOffset):
         actions = self._get_actions_from_offsets(stream, offsets)
@@ -70,27 +114,23 @@ class DateOffsetRepository:
                     ]
                 }
             },
-            "sort": [
-                {
-                    "offset": "desc",
-                }
-            ],
-            "terminate_after": MAX_OFFSET_ITEMS,
+            "_source": ["partition", "offset"],
         }
 
         try:
             res = self._scan(index=self._offset_index, query=query)
-            return DateOffset([item["_source"] for item in res])
+            return DateOffset(item["_source"] for item in res)
         except NotFoundError:
             # Index not created yet, return empty offset
             return DateOffset()
 
     @retry((TransportError, ConnectionTimeout), delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
     def _scan(self, index, query):
-        return helpers.scan(self._es_client, index=index, query=query)
+        return create_cursor(self._cursor, self._es_client, index, query, tiebreaker=OFFSET_TIEBREAKER,
+                             size=OFFSET_LOAD_PAGE_SIZE)
 
     def _get_actions_from_offsets(self, stream: str, offsets: DateOffset) -> Iterable[dict]:
-        for partition, offset in offsets.getAll().items():
+        for partition, offset in offsets.items():
             doc = {
                 "stream" : stream,
                 "partition": partition,
@@ -0,0 +1,181 @@
+from dataclasses import dataclass
+from typing import List, Optional
+from utils import json_dumps
+from .compression import COMPRESSION_GZIP, COMPRESSION_ZSTD
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+DEFAULT_ROW_GROUP_SIZE = 1000
+# Row groups of an object buffered before its schema is written: their schemas are unified, later row groups
+# must fit in it
+MAX_PENDING_ROW_GROUPS = 8
+# Pages are compressed by Parquet itself, with snappy unless another compression is set
+PARQUET_COMPRESSION_DEFAULT = "snappy"
+_COMPRESSIONS = {COMPRESSION_GZIP, COMPRESSION_ZSTD}
+
+_CONVERSION_ERRORS = (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError) \
+    if pyarrow is not None else ()
+
+
+@dataclass
+class ParquetOptions:
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+    # `gzip` or `zstd`, compression of pages
+    compression: Optional[str] = None
+
+
+def check_parquet_support(options: ParquetOptions) -> None:
+    if pyarrow is None:
+        raise ValueError("Parquet export requires the pyarrow package")
+    if options.compression and options.compression not in _COMPRESSIONS:
+        raise ValueError(f"Unsupported compression {options.compression}, "
+                         f"supported: {', '.join(sorted(_COMPRESSIONS))}")
+
+
+def documents_to_table(documents: List[dict]) -> "pyarrow.Table":
+    """
+    Top level fields are columns, with types inferred from values. When values of a column do not share a type
+    (e.g. a nested field which is sometimes a string, sometimes an object), nested values are stored as JSON strings
+    """
+    try:
+        return pyarrow.Table.from_pylist(documents)
+    except _CONVERSION_ERRORS:
+        return pyarrow.Table.from_pylist([_encode_nested_values(document) for document in documents])
+
+
+def unify_schemas(schema: "pyarrow.Schema", other: "pyarrow.Schema") -> Optional["pyarrow.Schema"]:
+    """
+    Returns a schema both schemas can be cast to: columns of both, with types promoted by `unify_types`.
+    Returns None when a column has incompatible types
+    """
+    fields = _unify_fields(list(schema), list(other))
+    return pyarrow.schema(fields) if fields is not None else None
+
+
+def unify_types(data_type: "pyarrow.DataType", other: "pyarrow.DataType") -> Optional["pyarrow.DataType"]:
+    """
+    Null is promoted to any type, integers to doubles, structs to the union of their fields and lists to lists of
+    unified values. Returns None for other types that differ, e.g. a string and an integer
+    """
+    if data_type == other or pyarrow.types.is_null(other):
+        return data_type
+    if pyarrow.types.is_null(data_type):
+        return other
+    if _is_number(data_type) and _is_number(other):
+        return pyarrow.float64()
+    if pyarrow.types.is_struct(data_type) and pyarrow.types.is_struct(other):
+        fields = _unify_fields(list(data_type), list(other))
+        return pyarrow.struct(fields) if fields is not None else None
+    if pyarrow.types.is_list(data_type) and pyarrow.types.is_list(other):
+        value_type = unify_types(data_type.value_type, other.value_type)
+        return pyarrow.list_(value_type) if value_type is not None else None
+    return None
+
+
+def cast_to_schema(table: "pyarrow.Table", schema: "pyarrow.Schema") -> "pyarrow.Table":
+    """Casts table to a schema unified with its own: missing columns and struct fields are null"""
+    columns = [
+        pyarrow.chunked_array([_cast_array(chunk, field.type) for chunk in table.column(field.name).chunks],
+                              type=field.type)
+        if field.name in table.column_names else pyarrow.nulls(table.num_rows, field.type)
+        for field in schema
+    ]
+    return pyarrow.Table.from_arrays(columns, schema=schema)
+
+
+class ParquetObject:
+    """
+    Buffers documents written to a binary stream and writes them as row groups of `row_group_size` rows.
+    The schema of the object unifies the schemas of its row groups (see `unify_types`): the first
+    `MAX_PENDING_ROW_GROUPS` row groups are kept in memory until the schema is written, later row groups are cast to
+    it. `write_row_group` returns False when rows do not fit in it, e.g. with new columns, and they are left buffered
+    for the next object
+    """
+    def __init__(self, raw, options: ParquetOptions):
+        self._raw = raw
+        self._row_group_size = max(1, options.row_group_size)
+        self._compression = options.compression or PARQUET_COMPRESSION_DEFAULT
+        self._writer = None
+        self._schema = None
+        self._pending: List["pyarrow.Table"] = []
+        self.rows: List[dict] = []
+
+    def write(self, document: dict) -> bool:
+        self.rows.append(document)
+        return len(self.rows) < self._row_group_size or self.write_row_group()
+
+    def write_row_group(self) -> bool:
+        if not self.rows:
+            return True
+        table = documents_to_table(self.rows)
+        schema = unify_schemas(self._schema, table.schema) if self._schema is not None else table.schema
+        if schema is None or (self._writer is not None and schema != self._schema):
+            return False
+        self._schema = schema
+        self._pending.append(table)
+        self.rows = []
+        if self._writer is not None or len(self._pending) >= MAX_PENDING_ROW_GROUPS:
+            self._write_pending()
+        return True
+
+    def close(self) -> None:
+        """Closes the object without the rows left buffered"""
+        try:
+            if self._pending:
+                self._write_pending()
+            if self._writer is not None:
+                self._writer.close()
+        finally:
+            self._raw.close()
+
+    def _write_pending(self) -> None:
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self._raw, self._schema, compression=self._compression)
+        for table in self._pending:
+            self._writer.write_table(cast_to_schema(table, self._schema))
+        self._pending = []
+
+
+def _unify_fields(fields: List["pyarrow.Field"], other: List["pyarrow.Field"]) -> Optional[List["pyarrow.Field"]]:
+    other_types = {field.name: field.type for field in other}
+    unified = []
+    for field in fields:
+        data_type = unify_types(field.type, other_types.pop(field.name)) if field.name in other_types else field.type
+        if data_type is None:
+            return None
+        unified.append(pyarrow.field(field.name, data_type))
+    names = {field.name for field in fields}
+    unified.extend(field for field in other if field.name not in names)
+    return unified
+
+
+def _is_number(data_type: "pyarrow.DataType") -> bool:
+    return pyarrow.types.is_integer(data_type) or pyarrow.types.is_floating(data_type)
+
+
+def _cast_array(array: "pyarrow.Array", data_type: "pyarrow.DataType") -> "pyarrow.Array":
+    # structs are rebuilt from their fields, as casts between structs with different fields are not supported
+    mask = array.is_null() if array.null_count else None
+    if array.type == data_type or pyarrow.types.is_null(array.type):
+        return array.cast(data_type)
+    if pyarrow.types.is_list(data_type) and pyarrow.types.is_list(array.type):
+        return pyarrow.ListArray.from_arrays(array.offsets, _cast_array(array.values, data_type.value_type),
+                                             mask=mask)
+    if not pyarrow.types.is_struct(data_type) or not pyarrow.types.is_struct(array.type):
+        return array.cast(data_type)
+    children = dict(zip((field.name for field in array.type), array.flatten()))
+    return pyarrow.StructArray.from_arrays(
+        [_cast_array(children[field.name], field.type) if field.name in children
+         else pyarrow.nulls(len(array), field.type) for field in data_type],
+        fields=list(data_type), mask=mask)
+
+
+def _encode_nested_values(document: dict) -> dict:
+    return {
+        key: json_dumps(value, default=str) if isinstance(value, (dict, list)) else value
+        for key, value in document.items()
+    }
@@ -1,5 +1,6 @@
-import json
 import logging
+from utils import compile_deleter, json_loads
+from process import get_host_inventory
 
 REMOVED_FIELDS = [
     "cluster.image_info_ssh_public_key",
@@ -18,6 +19,9 @@ REMOVED_FIELDS = [
     "link"
 ]
 
+# Lists are traversed: `cluster.hosts.connectivity` is removed from every host
+_REMOVED_FIELDS_DELETERS = [compile_deleter(removed_field, traverse_lists=True) for removed_field in REMOVED_FIELDS]
+
 SKIPPABLE_EVENTS = [
     "reached installation stage Writing image to disk"
 ]
@@ -40,9 +44,9 @@ class GetProcessedMetadataJson:
 
     def __set_host_vendor(self):
         for host in self.metadata_json["cluster"]["hosts"]:
-            if "inventory" not in host or host["inventory"] is None:
-                return
-            inventory = json.loads(host["inventory"])
+            inventory = get_host_inventory(host)
+            if not isinstance(inventory, dict):
+                continue
             vendor = inventory.get("system_vendor", None)
             if vendor:
                 host["vendor"] = vendor
@@ -61,26 +65,8 @@ class GetProcessedMetadataJson:
                 host["validations_info"] = convert_field_to_json(host["validations_info"])
 
     def __remove_fields_if_exists(self):
-        for remove_field in REMOVED_FIELDS:
-            try:
-                self.__pop_fields(self.metadata_json, remove_field)
-            except KeyError:
-                pass
-
-    # Delete a field in string path joind by "."
-    def __pop_fields(self, p_json, pop_str):
-        if type(p_json) == list:
-            for instance in p_json:
-                self.__pop_fields(instance, pop_str)
-            return
-        pop_list = pop_str.split(".", 1)
-        if len(pop_list) == 1:
-            del p_json[pop_list[0]]
-            return
-        if pop_list[0] not in p_json:
-            return
-        self.__pop_fields(p_json[pop_list[0]], pop_list[1])
-        return
+        for delete_field in _REMOVED_FIELDS_DELETERS:
+            delete_field(self.metadata_json)
 
 
 def is_event_skippable(event):
@@ -93,6 +79,6 @@ def is_event_skippable(event):
 def convert_field_to_json(converted_field):
     try:
         if type(converted_field) == str:
-            return json.loads(converted_field)
+            return json_loads(converted_field)
     except KeyError:
         logger.warning("Error while conversing to json")
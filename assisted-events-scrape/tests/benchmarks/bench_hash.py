@@ -0,0 +1,74 @@
+"""
+Compares document hashing against the implementation it replaced, which deep-copied documents
+and deleted ignored fields with dpath before hashing.
+
+Run with: make benchmark
+"""
+import copy
+import hashlib
+import json
+import timeit
+import dpath.util
+from dpath.exceptions import PathNotFound
+from utils import get_dict_hash, set_hash_algorithm
+from workers.cluster_events_worker import get_cluster_checksum, by_id
+from payloads import get_cluster
+
+IGNORE_FIELDS = ["cluster_state_id", "infra_env", "hosts.*.checked_in_at", "updated_at"]
+ROUNDS = 200
+
+
+def legacy_get_dict_hash(d: dict, ignore_fields=None) -> str:
+    to_hash = copy.deepcopy(d)
+    if ignore_fields:
+        for field in ignore_fields:
+            if field in to_hash:
+                del to_hash[field]
+    hashed_str = json.dumps(to_hash, default=str, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(hashed_str).hexdigest()
+
+
+def legacy_get_cluster_checksum(doc: dict, ignore_fields) -> str:
+    doc_copy = copy.deepcopy(doc)
+    for ignore_field in ignore_fields:
+        try:
+            dpath.util.delete(doc_copy, ignore_field, separator=".")
+        except PathNotFound:
+            pass
+    if "hosts" in doc_copy:
+        doc_copy["hosts"].sort(key=by_id)
+    return legacy_get_dict_hash(doc_copy)
+
+
+def bench(name: str, fn) -> float:
+    seconds = min(timeit.repeat(fn, number=ROUNDS, repeat=3)) / ROUNDS
+    print(f"{name:<40} {seconds * 1000:8.3f} ms")
+    return seconds
+
+
+def main():
+    cluster = get_cluster()
+    assert get_dict_hash(cluster) == legacy_get_dict_hash(cluster)
+    assert get_cluster_checksum(cluster, IGNORE_FIELDS) == legacy_get_cluster_checksum(cluster, IGNORE_FIELDS)
+    print(f"Cluster with {len(cluster['hosts'])} hosts, {len(json.dumps(cluster))} bytes")
+
+    legacy = bench("legacy get_dict_hash", lambda: legacy_get_dict_hash(cluster))
+    current = bench("get_dict_hash (sha256)", lambda: get_dict_hash(cluster))
+    print(f"{'speedup':<40} {legacy / current:8.1f} x")
+
+    legacy = bench("legacy get_cluster_checksum", lambda: legacy_get_cluster_checksum(cluster, IGNORE_FIELDS))
+    current = bench("get_cluster_checksum (sha256)", lambda: get_cluster_checksum(cluster, IGNORE_FIELDS))
+    print(f"{'speedup':<40} {legacy / current:8.1f} x")
+
+    for algorithm in ["blake2b", "xxh3_128"]:
+        try:
+            set_hash_algorithm(algorithm)
+        except ValueError as e:
+            print(f"Skipping {algorithm}: {e}")
+            continue
+        bench(f"get_dict_hash ({algorithm})", lambda: get_dict_hash(cluster))
+    set_hash_algorithm("sha256")
+
+
+if __name__ == "__main__":
+    main()
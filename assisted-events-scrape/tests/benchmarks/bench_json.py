@@ -0,0 +1,61 @@
+"""
+Compares the JSON codecs on the serialization paths run for each scraped cluster: decoding events, parsing
+hosts inventories and properties, serializing events for bulk requests and for the exported ndjson.
+
+Run with: make benchmark
+"""
+import copy
+import json
+import timeit
+from clients import CodecJSONSerializer
+from process import reshape_host
+from storage.cluster_events_storage import prepare_cluster_events, process_events, get_create_action
+from utils import json_loads, json_dumps, set_json_codec, get_json_codec_name
+from payloads import get_cluster, get_events, get_component_versions
+
+ROUNDS = 5
+EVENTS_COUNT = 50
+
+
+def scrape_cluster(cluster: dict, events_data: bytes) -> int:
+    component_versions = json_loads(json_dumps(get_component_versions(), sort_keys=True, default=str))
+    event_list = json_loads(events_data)
+    for host in cluster["hosts"]:
+        reshape_host(host)
+    prepared = prepare_cluster_events(component_versions, cluster, event_list, {})
+    serializer = CodecJSONSerializer()
+    written = 0
+    for doc in process_events(prepared.cluster_metadata, prepared.event_list, prepared.event_names, "url"):
+        written += len(get_create_action(doc, "events-", serializer)["_source"])
+        written += len(json_dumps(doc))
+    return written
+
+
+def bench(name: str, cluster: dict, events_data: bytes) -> float:
+    clusters = iter([copy.deepcopy(cluster) for _ in range(ROUNDS * 3)])
+    seconds = min(timeit.Timer(lambda: scrape_cluster(next(clusters), events_data)).repeat(number=ROUNDS, repeat=3))
+    seconds /= ROUNDS
+    print(f"{name:<40} {seconds * 1000:10.2f} ms")
+    return seconds
+
+
+def main():
+    cluster = get_cluster()
+    events_data = json.dumps(get_events(cluster, EVENTS_COUNT)).encode("utf-8")
+    default_codec = get_json_codec_name()
+
+    results = {}
+    for codec in ["stdlib", "orjson"]:
+        try:
+            set_json_codec(codec)
+        except ValueError:
+            print(f"{codec} is not installed, skipping")
+            continue
+        results[codec] = bench(f"{codec}, per cluster", cluster, events_data)
+    set_json_codec(default_codec)
+    if len(results) == 2:
+        print(f"{'speedup':<40} {results['stdlib'] / results['orjson']:10.1f} x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares compiled field paths against dpath and the recursive field removal they replaced,
+per exported document and per processed cluster metadata.
+
+Run with: make benchmark
+"""
+import copy
+import timeit
+import dpath.util
+from utils import compile_getter
+from storage import process
+from payloads import get_cluster
+
+ROUNDS = 200
+EXPORT_PATHS = ["id", "updated_at", "cluster_id", "event_time", "this.key.is.undefined"]
+
+
+def dpath_get(doc: dict, path: str):
+    try:
+        return dpath.util.get(doc, path, separator=".")
+    except KeyError:
+        return None
+
+
+def legacy_pop_fields(p_json, pop_str):
+    if isinstance(p_json, list):
+        for instance in p_json:
+            legacy_pop_fields(instance, pop_str)
+        return
+    pop_list = pop_str.split(".", 1)
+    if len(pop_list) == 1:
+        del p_json[pop_list[0]]
+        return
+    if pop_list[0] not in p_json:
+        return
+    legacy_pop_fields(p_json[pop_list[0]], pop_list[1])
+
+
+def legacy_remove_fields(metadata: dict):
+    for remove_field in process.REMOVED_FIELDS:
+        try:
+            legacy_pop_fields(metadata, remove_field)
+        except KeyError:
+            pass
+
+
+def remove_fields(metadata: dict):
+    # pylint: disable=protected-access
+    for delete_field in process._REMOVED_FIELDS_DELETERS:
+        delete_field(metadata)
+
+
+def bench(name: str, fn, setup=None) -> float:
+    timer = timeit.Timer(fn, setup=setup) if setup else timeit.Timer(fn)
+    seconds = min(timer.repeat(number=ROUNDS, repeat=3)) / ROUNDS
+    print(f"{name:<40} {seconds * 1000000:10.1f} us")
+    return seconds
+
+
+def main():
+    cluster = get_cluster()
+    for path in EXPORT_PATHS:
+        assert compile_getter(path)(cluster) == dpath_get(cluster, path)
+
+    def get_with_dpath():
+        for path in EXPORT_PATHS:
+            dpath_get(cluster, path)
+
+    def get_compiled():
+        for path in EXPORT_PATHS:
+            compile_getter(path)(cluster)
+
+    legacy = bench("dpath.util.get, per document", get_with_dpath)
+    current = bench("compile_getter, per document", get_compiled)
+    print(f"{'speedup':<40} {legacy / current:10.1f} x")
+
+    metadata = {"cluster": cluster, "link": "foo"}
+    expected = copy.deepcopy(metadata)
+    legacy_remove_fields(expected)
+    actual = copy.deepcopy(metadata)
+    remove_fields(actual)
+    assert actual == expected
+
+    copies = [copy.deepcopy(metadata) for _ in range(ROUNDS * 3)]
+    legacy_copies = iter(copies)
+    legacy = bench("recursive pop of removed fields", lambda: legacy_remove_fields(next(legacy_copies)))
+    copies = [copy.deepcopy(metadata) for _ in range(ROUNDS * 3)]
+    compiled_copies = iter(copies)
+    current = bench("compiled deleters", lambda: remove_fields(next(compiled_copies)))
+    print(f"{'speedup':<40} {legacy / current:10.1f} x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares per document timestamp handling of the export, day keys and offset tracking, against dateutil parsing
+it replaced.
+
+Run with: make benchmark
+"""
+import datetime
+import timeit
+from dateutil import parser
+from utils import get_timestamp_day
+from storage import DateOffset
+
+DOCUMENTS = 10000
+ROUNDS = 3
+
+
+def get_documents() -> list:
+    start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        {"cluster_id": f"cluster-{i % 500}",
+         "event_time": (start + datetime.timedelta(seconds=37 * i)).isoformat(timespec="milliseconds")[:-6] + "Z"}
+        for i in range(DOCUMENTS)
+    ]
+
+
+def legacy_day(value: str) -> str:
+    return datetime.datetime.strftime(parser.parse(value), "%Y-%m-%d")
+
+
+def legacy_set_offsets(documents: list) -> dict:
+    offsets = {}
+    for document in documents:
+        partition, offset = document["cluster_id"], document["event_time"]
+        if partition in offsets:
+            current = parser.parse(offsets[partition]).replace(tzinfo=datetime.timezone.utc)
+            if current > parser.parse(offset).replace(tzinfo=datetime.timezone.utc):
+                continue
+        offsets[partition] = offset
+    return offsets
+
+
+def set_offsets(documents: list) -> dict:
+    offset = DateOffset()
+    for document in documents:
+        offset.setOffset(document["event_time"], document["cluster_id"])
+    return offset.getAll()
+
+
+def bench(name: str, fn) -> float:
+    seconds = min(timeit.repeat(fn, number=ROUNDS, repeat=3)) / ROUNDS
+    print(f"{name:<40} {seconds * 1000:8.3f} ms")
+    return seconds
+
+
+def main():
+    documents = get_documents()
+    assert [legacy_day(doc["event_time"]) for doc in documents] == \
+        [get_timestamp_day(doc["event_time"]) for doc in documents]
+    assert legacy_set_offsets(documents) == set_offsets(documents)
+    print(f"{DOCUMENTS} documents")
+
+    legacy = bench("legacy day keys", lambda: [legacy_day(doc["event_time"]) for doc in documents])
+    current = bench("get_timestamp_day", lambda: [get_timestamp_day(doc["event_time"]) for doc in documents])
+    print(f"{'speedup':<40} {legacy / current:8.1f} x")
+
+    legacy = bench("legacy setOffset", lambda: legacy_set_offsets(documents))
+    current = bench("DateOffset.setOffset", lambda: set_offsets(documents))
+    print(f"{'speedup':<40} {legacy / current:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
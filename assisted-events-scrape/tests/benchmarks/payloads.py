@@ -0,0 +1,111 @@
+"""
+Realistic documents for micro-benchmarks: clusters as retrieved from assisted-service, with hosts inventories
+"""
+import json
+
+HOSTS_COUNT = 50
+DISKS_COUNT = 4
+INTERFACES_COUNT = 4
+EVENTS_COUNT = 200
+
+
+def get_inventory(host_index: int) -> dict:
+    return {
+        "bmc_address": "0.0.0.0",
+        "boot": {"current_boot_mode": "uefi"},
+        "cpu": {"architecture": "x86_64", "count": 16, "flags": ["fpu", "vme", "de", "pse", "tsc"] * 20,
+                "frequency": 2095.076, "model_name": "Intel(R) Xeon(R) Gold 6130 CPU @ 2.10GHz"},
+        "disks": [{
+            "by_path": f"/dev/disk/by-path/pci-0000:00:0{disk}.0",
+            "drive_type": "SSD",
+            "id": f"/dev/disk/by-id/wwn-0x5000c500a{host_index:04d}{disk}",
+            "installation_eligibility": {"eligible": True, "not_eligible_reasons": None},
+            "model": "INTEL SSDSC2KG96",
+            "name": f"sd{chr(ord('a') + disk)}",
+            "path": f"/dev/sd{chr(ord('a') + disk)}",
+            "serial": f"PHYG{host_index:04d}{disk}",
+            "size_bytes": 960197124096,
+            "vendor": "ATA",
+            "wwn": f"0x5000c500a{host_index:04d}{disk}",
+        } for disk in range(DISKS_COUNT)],
+        "hostname": f"host-{host_index}",
+        "interfaces": [{
+            "flags": ["up", "broadcast", "multicast"],
+            "ipv4_addresses": [f"10.0.{interface}.{host_index}/24"],
+            "ipv6_addresses": [],
+            "mac_address": f"52:54:00:{interface:02x}:00:{host_index:02x}",
+            "mtu": 1500,
+            "name": f"eth{interface}",
+            "product": "0x1572",
+            "speed_mbps": 10000,
+            "type": "physical",
+            "vendor": "0x8086",
+        } for interface in range(INTERFACES_COUNT)],
+        "memory": {"physical_bytes": 68719476736, "usable_bytes": 67332091904},
+        "system_vendor": {"manufacturer": "Dell Inc.", "product_name": "PowerEdge R640", "virtual": False},
+    }
+
+
+def get_host(host_index: int, cluster_id: str) -> dict:
+    validations = {
+        group: [{"id": f"{group}-validation-{i}", "status": "success", "message": "Validation passed"}
+                for i in range(8)]
+        for group in ["hardware", "network", "operators"]
+    }
+    return {
+        "id": f"00000000-0000-0000-0000-{host_index:012d}",
+        "cluster_id": cluster_id,
+        "infra_env_id": "11111111-1111-1111-1111-111111111111",
+        "checked_in_at": "2022-06-01T10:00:00.000Z",
+        "connectivity": json.dumps({"remote_hosts": [{"host_id": str(i), "l2_connectivity": []} for i in range(10)]}),
+        "created_at": "2022-06-01T09:00:00.000Z",
+        "images_status": json.dumps({"quay.io/image": {"result": "success", "size_bytes": 1000}}),
+        "inventory": json.dumps(get_inventory(host_index)),
+        "progress": {"current_stage": "Done", "stage_started_at": "2022-06-01T10:00:00.000Z"},
+        "requested_hostname": f"host-{host_index}",
+        "role": "master" if host_index < 3 else "worker",
+        "status": "installed",
+        "status_info": "Done",
+        "updated_at": "2022-06-01T10:30:00.000Z",
+        "validations_info": json.dumps(validations),
+    }
+
+
+def get_cluster(cluster_index: int = 0, hosts_count: int = HOSTS_COUNT) -> dict:
+    cluster_id = f"22222222-2222-2222-2222-{cluster_index:012d}"
+    return {
+        "id": cluster_id,
+        "name": f"cluster-{cluster_index}",
+        "kind": "Cluster",
+        "openshift_version": "4.10.16",
+        "status": "installed",
+        "status_info": "Cluster is installed",
+        "created_at": "2022-06-01T09:00:00.000Z",
+        "updated_at": "2022-06-01T10:30:00.000Z",
+        "base_dns_domain": "example.com",
+        "cpu_architecture": "x86_64",
+        "feature_usage": json.dumps({"SNO": {"id": "SNO", "name": "SNO"}}),
+        "hosts": [get_host(i, cluster_id) for i in range(hosts_count)],
+        "user_id": "3f1a9f6a8c2b4d1e",
+        "org_id": "xxxxxxxx",
+    }
+
+
+def get_events(cluster: dict, events_count: int = EVENTS_COUNT) -> list:
+    return [{
+        "cluster_id": cluster["id"],
+        "host_id": cluster["hosts"][i % len(cluster["hosts"])]["id"],
+        "category": "user",
+        "event_time": f"2022-06-01T10:{i % 60:02d}:00.000Z",
+        "message": f"Host {cluster['hosts'][i % len(cluster['hosts'])]['requested_hostname']}: updated status "
+                   f"from discovering to known (Host is ready to be installed)",
+        "name": "host_status_updated",
+        "severity": "info",
+        "props": json.dumps({"host_name": f"host-{i}", "old_status": "discovering", "new_status": "known"}),
+    } for i in range(events_count)]
+
+
+def get_component_versions() -> dict:
+    return {"versions": {"assisted-installer": "quay.io/edge-infrastructure/assisted-installer:v2.5.0",
+                         "assisted-installer-service": "quay.io/app-sre/assisted-service:v2.5.0"},
+            "release_tag": "v2.5.0"}
@@ -0,0 +1,62 @@
+import asyncio
+import json
+from unittest.mock import Mock, AsyncMock
+from storage import AsyncClusterEventsStorage, AsyncElasticsearchStorage
+
+
+def get_events(count):
+    return ({
+        "cluster_id": "abcd",
+        "event_time": f"2022-01-{(i % 28) + 1:02d}T00:00:00.{i:06d}Z",
+        "message": f"message {i}"
+    } for i in range(count))
+
+
+class TestAsyncClusterEventsStorage:
+    def setup(self):
+        self._es_client = Mock()
+        self._es_client.transport.serializer.dumps = json.dumps
+        self._es_client.search = AsyncMock()
+        self._es_client.indices.refresh = AsyncMock()
+        self._es_client.indices.get_alias = AsyncMock(return_value={"events-2022-01": {"aliases": {}}})
+        self._storage = AsyncClusterEventsStorage(self._es_client, "http://inventory", "events-")
+
+    def test_stop_after_known_event(self, monkeypatch):
+        bulk = AsyncMock(return_value=(9, [{"create": {"status": 409}}]))
+        monkeypatch.setattr("storage.async_cluster_events_storage.async_bulk", bulk)
+
+        created = asyncio.run(self._storage.store_events(get_events(1000)))
+        bulk.assert_awaited_once()
+        assert created == 9
+
+    def test_does_cluster_needs_full_update(self):
+        self._es_client.search.return_value = {
+            "aggregations": {"event_count": {"buckets": [{"key": "abcd", "doc_count": 2}]}}
+        }
+        events = list(get_events(5))
+        asyncio.run(self._storage.prefetch_event_counts(["abcd"]))
+        self._es_client.indices.get_alias.assert_awaited_once_with(index="events-*")
+
+        assert asyncio.run(self._storage.does_cluster_needs_full_update("abcd", events, {"events-2022-01"}))
+        self._es_client.indices.refresh.assert_awaited_once_with(index="events-2022-01")
+        assert self._es_client.search.await_count == 2
+
+        # count on db is now cached
+        asyncio.run(self._storage.prefetch_event_counts(["abcd"]))
+        assert self._es_client.search.await_count == 2
+
+
+class TestAsyncElasticsearchStorage:
+    def test_store_changes(self, monkeypatch):
+        async def scan(*_, **__):
+            yield {"_id": "A"}
+
+        bulk = AsyncMock(return_value=(1, []))
+        monkeypatch.setattr("storage.async_elasticsearch_storage.async_scan", scan)
+        monkeypatch.setattr("storage.async_elasticsearch_storage.async_bulk", bulk)
+        es_store = AsyncElasticsearchStorage(Mock())
+
+        asyncio.run(es_store.store_changes("foo", [{"id": "A"}, {"id": "B"}], id_fn=lambda d: d["id"]))
+        actions = list(bulk.call_args[0][1])
+        assert [action["_id"] for action in actions] == ["B"]
+        assert es_store.stats.get() == {"foo": {"inserted": 1, "duplicates": 0, "errors": 0}}
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import aiohttp
+from unittest.mock import Mock, AsyncMock, call, ANY
+from workers import AsyncClusterEventsWorker, ClusterEventsWorkerConfig
+from utils import ErrorCounter, Changes, ClusterWatermarks, get_dict_hash, get_event_id
+from config import SentryConfig, EventStoreConfig
+from assisted_service_client.rest import ApiException
+from assisted_service_client.models import InfraEnv
+
+
+class TestAsyncClusterEventsWorker:
+    def setup(self):
+        logging.disable(logging.CRITICAL)
+        self.ai_client_mock = Mock()
+        self.ai_client_mock.get_cluster_hosts = AsyncMock(return_value=[
+            {"id": "1", "hostname": "myhost", "infra_env_id": "12345"},
+            {"id": "2", "hostname": "yourhost", "infra_env_id": "67890"},
+        ])
+        self.ai_client_mock.infra_envs_list = AsyncMock(return_value=[
+            {"id": "12345", "cluster_id": "abcd", "name": "foo"},
+        ])
+        self.ai_client_mock.get_infra_env = AsyncMock(return_value=InfraEnv(
+            kind="InfraEnv", href="foobar", id="67890", name="bar", type="full-iso",
+            created_at="2022-01-01", updated_at="2022-01-01"
+        ))
+        self.ai_client_mock.get_events = AsyncMock(return_value=[])
+        self.ai_client_mock.get_versions = AsyncMock(return_value={"release_tag": "v1.0.0"})
+        self.cluster_events_storage_mock = Mock()
+        self.cluster_events_storage_mock.store = AsyncMock()
+        self.cluster_events_storage_mock.prefetch_event_counts = AsyncMock()
+        self.es_store = Mock()
+        self.es_store.store_changes = AsyncMock(return_value=True)
+        self.error_counter = ErrorCounter()
+        self.changes = Changes()
+        self.config = ClusterEventsWorkerConfig(
+            1,
+            SentryConfig(
+                False,
+                ""
+            ),
+            self.error_counter,
+            self.changes,
+            EventStoreConfig.create_from_env()
+        )
+        self.worker = AsyncClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store,
+            max_in_flight=2
+        )
+
+    def teardown(self):
+        self.worker = None
+
+    def test_process_clusters(self):
+        clusters = [{"id": str(i), "name": "mycluster", "hosts": []} for i in range(5)]
+        self.worker.process_clusters(clusters)
+
+        assert 5 == self.ai_client_mock.get_cluster_hosts.await_count
+        assert 5 == self.ai_client_mock.get_events.await_count
+        assert 5 == self.cluster_events_storage_mock.store.await_count
+        # infra env not listed is retrieved only once
+        self.ai_client_mock.get_infra_env.assert_awaited_once_with(infra_env_id="67890")
+        self.es_store.store_changes.assert_has_calls([
+            call(index=self.config.events.infra_envs_events_index, filter_by=ANY,
+                 documents=ANY, id_fn=get_dict_hash),
+            call(index=self.config.events.cluster_events_index, filter_by=ANY,
+                 documents=ANY, id_fn=ANY),
+            call(index=self.config.events.events_index, documents=ANY, filter_by=ANY,
+                 id_fn=get_event_id, transform_document_fn=ANY),
+        ])
+        # infra envs were all referenced by hosts, so they are not synced again at the end of the pass
+        assert 1 == len([c for c in self.es_store.store_changes.call_args_list
+                         if c[1]["index"] == self.config.events.infra_envs_events_index])
+        self.es_store.store_changes.assert_called_with(
+            index=self.config.events.component_versions_events_index,
+            documents=ANY, id_fn=ANY, transform_document_fn=ANY)
+
+        assert 0 == self.error_counter.get_errors()
+        assert self.changes.has_changed_in_last_minutes(1)
+
+    def test_cluster_not_found(self):
+        self.ai_client_mock.get_cluster_hosts.side_effect = ApiException(status=404, reason="Not found")
+
+        self._store_events_for_cluster({"id": "abcd", "name": "mycluster"})
+        self.ai_client_mock.get_events.assert_awaited_once()
+        self.cluster_events_storage_mock.store.assert_awaited_once()
+
+        assert 0 == self.error_counter.get_errors()
+
+    def test_error_getting_events(self):
+        self.ai_client_mock.get_events.side_effect = Exception("Error getting cluster")
+
+        self._store_events_for_cluster({"id": "abcd", "name": "mycluster"})
+        self.cluster_events_storage_mock.store.assert_not_awaited()
+        self.es_store.store_changes.assert_not_awaited()
+
+        assert 1 == self.error_counter.get_errors()
+        assert not self.changes.has_changed_in_last_minutes(1)
+
+    def test_error_storing_normalized_events(self):
+        self.config.watermarks = ClusterWatermarks()
+        self.es_store.store_changes.side_effect = Exception("Error storing normalized events")
+
+        self._store_events_for_cluster({"id": "abcd", "name": "mycluster", "updated_at": "2022-01-01T00:00:00.000Z"})
+        self.cluster_events_storage_mock.store.assert_not_awaited()
+
+        assert 1 == self.error_counter.get_errors()
+        assert not self.changes.has_changed_in_last_minutes(1)
+        assert 0 == self.config.watermarks.size()
+
+    def test_retry_server_error(self, monkeypatch):
+        monkeypatch.setattr(asyncio, "sleep", AsyncMock())
+        self.ai_client_mock.get_events.side_effect = [ApiException(status=503, reason="Unavailable"), []]
+
+        self._store_events_for_cluster({"id": "abcd", "name": "mycluster"})
+        assert 2 == self.ai_client_mock.get_events.await_count
+        self.cluster_events_storage_mock.store.assert_awaited_once()
+
+        assert 0 == self.error_counter.get_errors()
+
+    def test_retry_connection_errors(self, monkeypatch):
+        sleep = AsyncMock()
+        monkeypatch.setattr(asyncio, "sleep", sleep)
+        self.ai_client_mock.get_events.side_effect = [aiohttp.ClientConnectionError("Connection reset"),
+                                                      asyncio.TimeoutError(), []]
+
+        self._store_events_for_cluster({"id": "abcd", "name": "mycluster"})
+        assert 3 == self.ai_client_mock.get_events.await_count
+        self.cluster_events_storage_mock.store.assert_awaited_once()
+        assert 0 == self.error_counter.get_errors()
+
+        # exponential backoff, with up to 1 second of jitter
+        first_delay, second_delay = [sleep_call.args[0] for sleep_call in sleep.await_args_list]
+        assert 1 <= first_delay <= 2
+        assert 2 <= second_delay <= 3
+
+    def test_blacklisted_cluster(self):
+        self.config.watermarks = ClusterWatermarks()
+        cluster = {"id": "abcd", "name": "perf-test", "hosts": [], "updated_at": "2022-01-01T00:00:00.000Z"}
+
+        self._store_events_for_cluster(cluster)
+        self.ai_client_mock.get_events.assert_not_awaited()
+        self.cluster_events_storage_mock.store.assert_not_awaited()
+
+        assert 0 == self.error_counter.get_errors()
+        assert 1 == self.config.watermarks.size()
+
+    def test_shutdown(self):
+        self.worker.shutdown()
+        self.worker.process_clusters([{"id": "abcd", "name": "mycluster", "hosts": []}])
+
+        self.ai_client_mock.get_events.assert_not_awaited()
+        self.cluster_events_storage_mock.store.assert_not_awaited()
+
+    def _store_events_for_cluster(self, cluster):
+        asyncio.run(self.worker.store_events_for_cluster(cluster))
@@ -0,0 +1,98 @@
+import json
+import logging
+from unittest.mock import Mock, AsyncMock
+from urllib.parse import urlparse
+from events_scrape import InventoryClient, AsyncInventoryClient
+from workers import ClusterEventsWorker, AsyncClusterEventsWorker, ClusterEventsWorkerConfig
+from utils import ErrorCounter, Changes
+from config import SentryConfig, EventStoreConfig
+
+API_PATH = "/api/assisted-install"
+
+RESPONSES = {
+    "/v2/clusters/abcd": {
+        "kind": "Cluster",
+        "id": "abcd",
+        "href": "/api/assisted-install/v2/clusters/abcd",
+        "name": "mycluster",
+        "openshift_version": "4.10",
+        "image_info": {},
+        "status": "installed",
+        "status_info": "Cluster is installed",
+        "hosts": [
+            {"kind": "Host", "id": "1", "href": "", "status": "installed", "status_info": "", "infra_env_id": "12345",
+             "requested_hostname": "master-0", "created_at": "2022-01-01T00:00:00.000Z"},
+            {"kind": "Host", "id": "2", "href": "", "status": "installed", "status_info": "", "infra_env_id": "67890",
+             "requested_hostname": "master-1", "created_at": "2022-01-01T00:00:00.000Z"},
+        ],
+    },
+    "/v2/events": [
+        {"cluster_id": "abcd", "event_time": "2022-01-01T00:00:00.000Z", "message": "Cluster created",
+         "name": "cluster_registration_succeeded", "severity": "info", "category": "user"},
+        {"cluster_id": "abcd", "host_id": "1", "event_time": "2022-01-01T00:10:00.000Z",
+         "message": "Host master-0: installed", "severity": "info", "category": "user"},
+    ],
+    "/v2/component-versions": {
+        "versions": {"assisted-installer-service": "quay.io/assisted-service:v2.0"},
+        "release_tag": "v2.0.0",
+    },
+    "/v2/infra-envs": [
+        {"kind": "InfraEnv", "id": "12345", "href": "", "name": "foo", "type": "full-iso", "cluster_id": "abcd",
+         "created_at": "2022-01-01T00:00:00.000Z", "updated_at": "2022-01-01T00:00:00.000Z"},
+    ],
+    "/v2/infra-envs/67890": {
+        "kind": "InfraEnv", "id": "67890", "href": "", "name": "bar", "type": "minimal-iso",
+        "created_at": "2022-01-01T00:00:00.000Z", "updated_at": "2022-01-01T00:00:00.000Z",
+    },
+}
+
+
+def get_response(url, **_kwargs):
+    return Mock(status=200, reason="OK", data=json.dumps(RESPONSES[urlparse(url).path[len(API_PATH):]]))
+
+
+def get_stored_documents(store_changes: Mock):
+    return [
+        (kwargs["index"], [(kwargs["id_fn"](doc), doc) for doc in kwargs["documents"]])
+        for _, kwargs in store_changes.call_args_list
+    ]
+
+
+class TestAsyncInventoryClient:
+    def setup(self):
+        logging.disable(logging.CRITICAL)
+        self.inventory_client = InventoryClient("http://inventory", None, "")
+        self.inventory_client.api.rest_client.GET = Mock(side_effect=get_response)
+
+    def test_same_documents_as_inventory_client(self):
+        es_store = Mock()
+        es_store.store_changes = Mock(return_value=True)
+        cluster_events_storage = Mock()
+        ClusterEventsWorker(self._get_config(), self.inventory_client, cluster_events_storage, es_store) \
+            .process_clusters([{"id": "abcd", "name": "mycluster", "hosts": []}])
+
+        async_client = AsyncInventoryClient(self.inventory_client)
+        async_client._get = AsyncMock(side_effect=lambda path, **_: json.dumps(RESPONSES[path]))
+        async_es_store = Mock()
+        async_es_store.store_changes = AsyncMock(return_value=True)
+        async_es_store.close = AsyncMock()
+        async_cluster_events_storage = Mock()
+        async_cluster_events_storage.store = AsyncMock()
+        async_cluster_events_storage.prefetch_event_counts = AsyncMock()
+        async_cluster_events_storage.close = AsyncMock()
+        worker = AsyncClusterEventsWorker(self._get_config(), async_client, async_cluster_events_storage,
+                                          async_es_store)
+        worker.process_clusters([{"id": "abcd", "name": "mycluster", "hosts": []}])
+        worker.close()
+
+        stored_documents = get_stored_documents(es_store.store_changes)
+        assert [index for index, _ in stored_documents] == [
+            ".infra_envs", ".clusters", ".events", ".component_versions"
+        ]
+        assert get_stored_documents(async_es_store.store_changes) == stored_documents
+        assert async_cluster_events_storage.store.call_args == cluster_events_storage.store.call_args
+
+    @staticmethod
+    def _get_config() -> ClusterEventsWorkerConfig:
+        return ClusterEventsWorkerConfig(1, SentryConfig(False, ""), ErrorCounter(), Changes(),
+                                         EventStoreConfig.create_from_env())
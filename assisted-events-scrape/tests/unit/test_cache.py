@@ -0,0 +1,78 @@
+import threading
+import time
+from unittest.mock import Mock
+from utils import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache:
+    def setup(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(max_size=2, ttl_seconds=10, clock=self.clock)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        assert self.cache.get("a") == 1
+        self.cache.put("c", 3)
+
+        assert "b" not in self.cache
+        assert self.cache.get("a") == 1
+        assert self.cache.get("c") == 3
+        assert self.cache.stats()["evictions"] == 1
+
+    def test_ttl(self):
+        self.cache.put("a", 1)
+        self.clock.now = 9
+        assert self.cache.get("a") == 1
+        self.clock.now = 10
+        assert self.cache.get("a", "expired") == "expired"
+        assert self.cache.values() == []
+        assert self.cache.reset_stats() == {"hits": 1, "misses": 1, "evictions": 0, "expired": 1, "size": 0}
+        assert self.cache.stats() == {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "size": 0}
+
+    def test_negative_entries(self):
+        loader = Mock(return_value=None)
+        assert self.cache.get_or_load("a", loader) is None
+        assert self.cache.get_or_load("a", loader) is None
+        loader.assert_called_once_with("a")
+        assert self.cache.values() == []
+
+        self.cache.discard_missing()
+        loader.return_value = 1
+        assert self.cache.get_or_load("a", loader) == 1
+
+    def test_loader_errors_are_not_cached(self):
+        loader = Mock(side_effect=[ValueError(), 1])
+        try:
+            self.cache.get_or_load("a", loader)
+            assert False, "error expected"
+        except ValueError:
+            pass
+        assert self.cache.get_or_load("a", loader) == 1
+
+    def test_concurrent_misses_load_once(self):
+        calls = []
+
+        def slow_loader(key):
+            calls.append(key)
+            time.sleep(0.05)
+            return key.upper()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_load("a", slow_loader)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ["a"]
+        assert results == ["A"] * 5
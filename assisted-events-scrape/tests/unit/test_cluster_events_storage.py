@@ -0,0 +1,129 @@
+import json
+from unittest.mock import Mock
+from storage import ClusterEventsStorage
+from storage.cluster_events_storage import get_event_index
+
+
+def get_events(count):
+    return ({
+        "cluster_id": "abcd",
+        "event_time": f"2022-01-{(i % 28) + 1:02d}T00:00:00.{i:06d}Z",
+        "message": f"message {i}"
+    } for i in range(count))
+
+
+class TestClusterEventsStorage:
+    def setup(self):
+        self._es_client = Mock()
+        self._es_client.transport.serializer.dumps = json.dumps
+        self._storage = ClusterEventsStorage(Mock(), self._es_client, "http://inventory", "events-")
+
+    def test_store_new_events(self, monkeypatch):
+        bulk = Mock(return_value=(10, []))
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        self._storage.store_events(get_events(25))
+
+        # first chunk has 10 events, second one would have 20 but only 15 are left
+        assert bulk.call_count == 2
+        actions = bulk.call_args_list[0][0][1]
+        assert len(actions) == 10
+        assert actions[0]["_op_type"] == "create"
+        assert actions[0]["_index"] == "events-2022-01"
+        assert json.loads(actions[0]["_source"])["message"] == "message 0"
+        assert len(bulk.call_args_list[1][0][1]) == 15
+
+    def test_stop_after_known_event(self, monkeypatch):
+        bulk = Mock(return_value=(9, [{"create": {"status": 409}}]))
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        written_indices = set()
+        self._storage.store_events(get_events(1000), written_indices=written_indices)
+        bulk.assert_called_once()
+        assert written_indices == {"events-2022-01"}
+
+    def test_refresh_written_indices(self, monkeypatch):
+        self._es_client.search.return_value = {
+            "aggregations": {"event_count": {"buckets": [{"key": "abcd", "doc_count": 1}]}}
+        }
+        events = [{"cluster_id": "abcd", "event_time": f"2022-0{i}-01T00:00:00.000Z", "message": "foo"}
+                  for i in range(1, 4)]
+
+        monkeypatch.setattr(self._storage, "process_events", lambda *_: iter(events))
+
+        # nothing was created: nothing to refresh before counting
+        monkeypatch.setattr("opensearchpy.helpers.bulk", Mock(return_value=(0, [{"create": {"status": 409}}])))
+        self._storage.store_prepared(Mock(cluster_id="abcd", event_list=events))
+        self._es_client.indices.refresh.assert_not_called()
+
+        monkeypatch.setattr("opensearchpy.helpers.bulk", Mock(return_value=(3, [])))
+        self._storage.store_prepared(Mock(cluster_id="efgh", event_list=events))
+        self._es_client.indices.refresh.assert_called_once_with(index="events-2022-01,events-2022-02,events-2022-03")
+
+    def test_full_update_does_not_stop(self, monkeypatch):
+        bulk = Mock(return_value=(9, [{"create": {"status": 409}}]))
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        self._storage.store_events(get_events(1000), only_new_events=False)
+        assert bulk.call_count == 2
+
+    def test_get_index(self):
+        assert get_event_index("2022-03-08T13:15:29.553Z", "events-") == "events-2022-03"
+        assert get_event_index("Tue Mar 08 13:15:29 UTC 2022", "events-") == "events-2022-03"
+
+    def test_get_cluster_event_counts(self):
+        self._es_client.search.return_value = {
+            "aggregations": {"event_count": {"buckets": [{"key": "A", "doc_count": 3}]}}
+        }
+        counts = self._storage.get_cluster_event_counts_on_es_db(["A", "B"])
+
+        assert counts == {"A": 3, "B": 0}
+        self._es_client.search.assert_called_once()
+        self._es_client.indices.refresh.assert_not_called()
+        query = self._es_client.search.call_args[1]["body"]
+        assert query["query"] == {"terms": {"cluster.id": ["A", "B"]}}
+
+        assert self._storage.get_cluster_event_count_on_es_db("A", refresh={"events-2022-02", "events-2022-01"}) == 3
+        self._es_client.indices.refresh.assert_called_once_with(index="events-2022-01,events-2022-02")
+
+    def test_prefetch_event_counts(self, monkeypatch):
+        self._es_client.search.return_value = {
+            "aggregations": {"event_count": {"buckets": [{"key": "abcd", "doc_count": 3}]}}
+        }
+        self._es_client.indices.get_alias.return_value = {"events-2022-01": {"aliases": {}}}
+        self._storage.prefetch_event_counts(["abcd"])
+        self._storage.prefetch_event_counts(["abcd"])
+        self._es_client.search.assert_called_once()
+
+        # 2 more events are stored: cached count is up to date, no need to count
+        monkeypatch.setattr("opensearchpy.helpers.bulk", Mock(return_value=(2, [])))
+        events = [{"cluster_id": "abcd", "event_time": f"2022-01-0{i}T00:00:00.000Z", "message": "foo"}
+                  for i in range(1, 6)]
+        self._storage._add_event_count("abcd", self._storage.store_events(iter(events[:2])))
+        assert not self._storage.does_cluster_needs_full_update("abcd", events)
+        self._es_client.search.assert_called_once()
+
+    def test_event_indices_change(self):
+        self._es_client.search.return_value = {"aggregations": {"event_count": {"buckets": []}}}
+        self._es_client.indices.get_alias.return_value = {"events-2022-01": {}, "events-2022-02": {}}
+        self._storage.prefetch_event_counts(["abcd"])
+        self._es_client.indices.get_alias.assert_called_once_with(index="events-*")
+
+        # a count of 0 is trusted when no event is expected: no event can be missing
+        skippable_events = [{"cluster_id": "abcd", "event_time": "2022-01-01T00:00:00.000Z",
+                             "message": "Host master-0: reached installation stage Writing image to disk: 50%"}]
+        assert not self._storage.does_cluster_needs_full_update("abcd", skippable_events)
+        assert not self._storage.does_cluster_needs_full_update("abcd", [])
+        self._es_client.search.assert_called_once()
+
+        # indices are the same, in another order: counts are still valid
+        self._es_client.indices.get_alias.return_value = {"events-2022-02": {}, "events-2022-01": {}}
+        self._storage.prefetch_event_counts(["abcd"])
+        self._es_client.search.assert_called_once()
+
+        # oldest index is deleted: counts are not valid anymore
+        self._es_client.indices.get_alias.return_value = {"events-2022-02": {}}
+        self._storage.prefetch_event_counts(["abcd"])
+        assert self._es_client.search.call_count == 2
+        assert not self._storage.does_cluster_needs_full_update("abcd", [])
+        assert self._es_client.search.call_count == 2
@@ -1,8 +1,10 @@
+import json
 import logging
 from unittest.mock import Mock, call, ANY
 from workers import ClusterEventsWorker, ClusterEventsWorkerConfig
-from utils import ErrorCounter, Changes, get_dict_hash, get_event_id
-from config import SentryConfig, EventStoreConfig
+from utils import ErrorCounter, Changes, ClusterWatermarks, get_dict_hash, get_event_id
+from config import SentryConfig, EventStoreConfig, PipelineConfig, InfraEnvCacheConfig
+from storage import ClusterStateStore
 from assisted_service_client.rest import ApiException
 from assisted_service_client.models import InfraEnv
 
@@ -50,6 +52,7 @@ class TestClusterEventsWorker:
         ])
         self.ai_client_mock.infra_envs_list = Mock(return_value=infraenvs)
         self.ai_client_mock.get_infra_env = Mock(return_value=infraenv)
+        self.ai_client_mock.get_events = Mock(return_value=[])
         self.cluster_events_storage_mock = Mock()
         self.es_store = Mock()
         self.error_counter = ErrorCounter()
@@ -96,7 +99,7 @@ class TestClusterEventsWorker:
         self.ai_client_mock.get_events.assert_called_once()
         self.ai_client_mock.get_versions.assert_called_once()
         self.cluster_events_storage_mock.store.assert_called_once()
-        self._expect_store_normalized_events()
+        self._expect_store_normalized_events(no_infraenv=True)
 
         assert 0 == self.error_counter.get_errors()
         assert self.changes.has_changed_in_last_minutes(1)
@@ -142,18 +145,21 @@ class TestClusterEventsWorker:
         assert not self.changes.has_changed_in_last_minutes(1)
 
     def test_error_storing_normalized_events(self):
+        self.config.watermarks = ClusterWatermarks()
         self.es_store.store_changes.side_effect = Exception("Error storing normalized events")
 
-        cluster = {"id": "abcd", "name": "mycluster"}
+        cluster = {"id": "abcd", "name": "mycluster", "updated_at": "2022-01-01T00:00:00.000Z"}
 
         self.worker.store_events_for_cluster(cluster)
         self.ai_client_mock.get_cluster_hosts.assert_called_once()
         self.ai_client_mock.get_events.assert_called_once()
         self.ai_client_mock.get_versions.assert_called_once()
-        self.cluster_events_storage_mock.store.assert_called_once()
+        self.cluster_events_storage_mock.store.assert_not_called()
 
         assert 1 == self.error_counter.get_errors()
-        assert self.changes.has_changed_in_last_minutes(1)
+        assert not self.changes.has_changed_in_last_minutes(1)
+        # cluster is processed again on next pass
+        assert 0 == self.config.watermarks.size()
 
     def test_storing_events(self):
 
@@ -183,7 +189,7 @@ class TestClusterEventsWorker:
         self.ai_client_mock.get_events.assert_called_once()
         self.ai_client_mock.get_versions.assert_called_once()
         self.cluster_events_storage_mock.store.assert_called_once()
-        self._expect_store_normalized_events()
+        self._expect_store_normalized_events(no_infraenv=True)
 
         assert 0 == self.error_counter.get_errors()
         assert self.changes.has_changed_in_last_minutes(1)
@@ -248,11 +254,133 @@ class TestClusterEventsWorker:
         self.ai_client_mock.get_events.assert_called_once()
         self.ai_client_mock.get_versions.assert_called_once()
         self.cluster_events_storage_mock.store.assert_called_once()
-        self._expect_store_normalized_events()
+        self._expect_store_normalized_events(component_versions=True)
 
         assert 0 == self.error_counter.get_errors()
         assert self.changes.has_changed_in_last_minutes(1)
 
+    def test_watermark_set_on_success(self):
+        self.config.watermarks = ClusterWatermarks()
+        cluster = {"id": "abcd", "name": "mycluster", "updated_at": "2022-01-01T00:00:00.000Z"}
+        self.worker.store_events_for_cluster(cluster)
+
+        assert self.config.watermarks.get_changed([{"id": "abcd", "updated_at": "2022-01-01T00:00:00.000Z"}]) == []
+
+    def test_watermark_not_set_on_error(self):
+        self.config.watermarks = ClusterWatermarks()
+        self.ai_client_mock.get_events.side_effect = Exception("Error getting cluster")
+        cluster = {"id": "abcd", "name": "mycluster", "updated_at": "2022-01-01T00:00:00.000Z"}
+        self.worker.store_events_for_cluster(cluster)
+
+        assert 0 == self.config.watermarks.size()
+
+    def test_unchanged_cluster_state_skips_storing(self):
+        self.config.state_store = ClusterStateStore()
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+        self.ai_client_mock.get_events.return_value = [
+            {"cluster_id": "abcd", "event_time": "2022-01-01T00:00:00.000Z", "message": "foo"}
+        ]
+
+        self.worker.store_events_for_cluster({"id": "abcd", "name": "mycluster"})
+        assert self.es_store.store_changes.call_count == 3
+
+        self.es_store.reset_mock()
+        self.worker.store_events_for_cluster({"id": "abcd", "name": "mycluster"})
+        # infra envs were already stored as well
+        self.es_store.store_changes.assert_not_called()
+
+    def test_failed_bulk_stored_again_on_next_pass(self):
+        self.config.state_store = ClusterStateStore()
+        self.config.watermarks = ClusterWatermarks()
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+        self.ai_client_mock.get_events.return_value = [
+            {"cluster_id": "abcd", "event_time": "2022-01-01T00:00:00.000Z", "message": "foo"}
+        ]
+        cluster = {"id": "abcd", "name": "mycluster", "updated_at": "2022-01-01T00:00:00.000Z"}
+        # documents are rejected by Elasticsearch
+        self.es_store.store_changes.return_value = False
+
+        self.worker.store_events_for_cluster(dict(cluster))
+        assert 1 == self.error_counter.get_errors()
+        assert 0 == self.config.watermarks.size()
+        assert self.config.state_store.get("abcd", "checksum") is None
+
+        self.es_store.reset_mock()
+        self.es_store.store_changes.return_value = True
+        self.worker.store_events_for_cluster(dict(cluster))
+        self.es_store.store_changes.assert_has_calls([
+            call(index=self.config.events.infra_envs_events_index, documents=ANY, id_fn=ANY, filter_by=ANY),
+            call(index=self.config.events.cluster_events_index, documents=ANY, id_fn=ANY, filter_by=ANY),
+            call(index=self.config.events.events_index, documents=ANY, id_fn=ANY, filter_by=ANY,
+                 transform_document_fn=ANY),
+        ])
+        assert 1 == self.error_counter.get_errors()
+        assert 1 == self.config.watermarks.size()
+        assert self.config.state_store.get("abcd", "last_event_time") == "2022-01-01T00:00:00.000Z"
+
+    def test_failed_batch_stored_again_on_next_pass(self):
+        self.config.events.batch_size = 100
+        self.config.state_store = ClusterStateStore()
+        self.config.watermarks = ClusterWatermarks()
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+        self.ai_client_mock.get_versions.return_value = {"release_tag": "v1.0.0"}
+        cluster = {"id": "abcd", "name": "mycluster", "hosts": [], "updated_at": "2022-01-01T00:00:00.000Z"}
+        self.es_store.store_changes_batch.return_value = False
+
+        self.worker.process_clusters([dict(cluster)])
+        assert 1 == self.error_counter.get_errors()
+        # cluster is considered stored once its batched documents are
+        assert 0 == self.config.watermarks.size()
+        assert self.config.state_store.get("abcd", "checksum") is None
+
+        self.es_store.reset_mock()
+        self.es_store.store_changes_batch.return_value = True
+        self.worker.process_clusters([dict(cluster)])
+        self.es_store.store_changes_batch.assert_any_call(self.config.events.cluster_events_index, ANY)
+        assert 1 == self.error_counter.get_errors()
+        assert 1 == self.config.watermarks.size()
+        assert self.config.state_store.get("abcd", "checksum") is not None
+
+    def test_batched_normalized_events(self):
+        self.config.events.batch_size = 100
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+        self.ai_client_mock.get_versions.return_value = {"release_tag": "v1.0.0"}
+        clusters = [
+            {"id": "abcd", "name": "mycluster", "hosts": []},
+            {"id": "efgh", "name": "yourcluster", "hosts": []},
+        ]
+        self.worker.process_clusters(clusters)
+
+        self.es_store.store_changes.assert_not_called()
+        self.es_store.store_changes_batch.assert_has_calls([
+            call(self.config.events.infra_envs_events_index, ANY),
+            call(self.config.events.cluster_events_index, ANY),
+            call(self.config.events.component_versions_events_index, ANY),
+        ], any_order=True)
+        # both clusters are stored within the same batch
+        assert 3 == self.es_store.store_changes_batch.call_count
+        assert 0 == self.error_counter.get_errors()
+
     def test_large_cluster(self):
 
         cluster = {
@@ -285,7 +413,7 @@ class TestClusterEventsWorker:
 
         assert 0 == self.error_counter.get_errors()
 
-    def _expect_store_normalized_events(self, no_infraenv=False):
+    def _expect_store_normalized_events(self, no_infraenv=False, component_versions=False):
         expected_calls = []
 
         if not no_infraenv:
@@ -297,10 +425,177 @@ class TestClusterEventsWorker:
                  documents=ANY, id_fn=ANY),
             call(index=self.config.events.events_index, documents=ANY, filter_by=ANY,
                  id_fn=get_event_id, transform_document_fn=ANY),
-            call(index=self.config.events.component_versions_events_index,
-                 documents=ANY, id_fn=ANY, transform_document_fn=ANY),
         ]
+        if component_versions:
+            # infra envs not referenced by any host are synced at the end of the pass
+            expected_calls += [call(index=self.config.events.infra_envs_events_index, filter_by=ANY,
+                                    documents=ANY, id_fn=get_dict_hash),
+                               call(index=self.config.events.component_versions_events_index,
+                                    documents=ANY, id_fn=ANY, transform_document_fn=ANY)]
         self.es_store.store_changes.assert_has_calls(expected_calls)
 
     def _expect_store_normalized_events_not_called(self):
         self.es_store.store_changes.assert_not_called()
+
+    def test_infra_envs_cache(self):
+        self.ai_client_mock.get_cluster_hosts.return_value = [
+            {"id": "1", "hostname": "myhost", "infra_env_id": "12345"},
+            {"id": "2", "hostname": "yourhost", "infra_env_id": "missing"},
+        ]
+        self.ai_client_mock.get_infra_env.return_value = None
+        self.ai_client_mock.infra_envs_list.return_value[0]["user_name"] = "myuser"
+        clusters = [{"id": str(i), "name": "mycluster", "hosts": []} for i in range(3)]
+        self.worker.process_clusters(clusters)
+
+        # missing infra env is requested once per pass, the listed one is never requested
+        self.ai_client_mock.get_infra_env.assert_called_once_with(infra_env_id="missing")
+        hosts_infra_envs = self.cluster_events_storage_mock.store.call_args[0][3]
+        assert list(hosts_infra_envs) == ["12345"]
+        assert "user_name" not in hosts_infra_envs["12345"]
+        assert "user_id" in hosts_infra_envs["12345"]
+
+        self.worker.process_clusters(clusters)
+        assert 2 == self.ai_client_mock.get_infra_env.call_count
+
+    def test_all_listed_infra_envs_synced(self):
+        # cache holds only one of the two listed infra envs
+        self.config.infra_env_cache = InfraEnvCacheConfig(max_size=1)
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+        self.worker.process_clusters([])
+
+        infra_envs_calls = [c[1] for c in self.es_store.store_changes.call_args_list
+                            if c[1]["index"] == self.config.events.infra_envs_events_index]
+        assert [[doc["id"] for doc in c["documents"]] for c in infra_envs_calls] == [["12345", "67890"]]
+
+    def test_infra_envs_written_once(self):
+        clusters = [{"id": str(i), "name": "mycluster", "hosts": []} for i in range(3)]
+        self.worker.process_clusters(clusters)
+
+        infra_envs_calls = [c[1] for c in self.es_store.store_changes.call_args_list
+                            if c[1]["index"] == self.config.events.infra_envs_events_index]
+        # first cluster stores the infra env its hosts reference, the other one is synced at the end of the pass
+        assert [[doc["id"] for doc in c["documents"]] for c in infra_envs_calls] == [["12345"], ["67890"]]
+        stored_hash = get_dict_hash(infra_envs_calls[0]["documents"][0])
+        assert infra_envs_calls[0]["filter_by"] == {"ids": {"values": [stored_hash]}}
+
+        self.es_store.reset_mock()
+        self.worker.process_clusters(clusters)
+        infra_envs_calls = [c for c in self.es_store.store_changes.call_args_list
+                            if c[1]["index"] == self.config.events.infra_envs_events_index]
+        assert infra_envs_calls == []
+
+    def test_component_versions_once_per_pass(self):
+        self.ai_client_mock.get_versions.return_value = {"release_tag": "v1.0.0"}
+        clusters = [{"id": str(i), "name": "mycluster", "hosts": []} for i in range(3)]
+        self.worker.process_clusters(clusters)
+
+        self.ai_client_mock.get_versions.assert_called_once()
+        assert 3 == self.cluster_events_storage_mock.store.call_count
+        versions_calls = [c for c in self.es_store.store_changes.call_args_list
+                          if c[1]["index"] == self.config.events.component_versions_events_index]
+        assert 1 == len(versions_calls)
+
+        # versions are retrieved again on next pass
+        self.worker.process_clusters(clusters)
+        assert 2 == self.ai_client_mock.get_versions.call_count
+
+
+class TestClusterEventsWorkerPipeline:
+    def setup(self):
+        logging.disable(logging.CRITICAL)
+        self.ai_client_mock = Mock()
+        self.ai_client_mock.get_cluster_hosts = Mock(return_value=[
+            {"id": "1", "hostname": "myhost", "infra_env_id": "12345"},
+        ])
+        self.ai_client_mock.infra_envs_list = Mock(return_value=[{"id": "12345", "name": "foo"}])
+        self.ai_client_mock.get_events = Mock(return_value=[
+            {"cluster_id": "abcd", "event_time": "2022-01-01T00:00:00.000Z", "message": "foo"}
+        ])
+        self.ai_client_mock.get_versions = Mock(return_value={"release_tag": "v1.0.0"})
+        self.cluster_events_storage_mock = Mock()
+        self.es_store = Mock()
+        self.es_store.serialize = json.dumps
+        self.error_counter = ErrorCounter()
+        self.changes = Changes()
+        self.config = ClusterEventsWorkerConfig(
+            1,
+            SentryConfig(False, ""),
+            self.error_counter,
+            self.changes,
+            EventStoreConfig.create_from_env(),
+            pipeline=PipelineConfig(2, 1, 1, 1, 100)
+        )
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+
+    def test_process_clusters(self):
+        clusters = [
+            {"id": str(i), "name": "mycluster", "hosts": []} for i in range(10)
+        ] + [{"id": "large", "name": "mycluster", "hosts": [{"id": str(i)} for i in range(100)]}]
+        self.worker.process_clusters(clusters)
+
+        assert 10 == self.ai_client_mock.get_events.call_count
+        assert 10 == self.cluster_events_storage_mock.store_prepared.call_count
+        self.cluster_events_storage_mock.store.assert_not_called()
+        # normalized documents of all clusters are stored in one batch per index
+        self.es_store.store_changes.assert_not_called()
+        assert 4 == self.es_store.store_changes_batch.call_count
+        clusters_batch = [c[0][1] for c in self.es_store.store_changes_batch.call_args_list
+                          if c[0][0] == self.config.events.cluster_events_index][0]
+        assert 10 == len(clusters_batch)
+
+        assert 0 == self.error_counter.get_errors()
+        assert self.changes.has_changed_in_last_minutes(1)
+
+    def test_documents_serialized_before_legacy_metadata(self):
+        self.worker.process_clusters([{"id": "abcd", "name": "mycluster", "hosts": []}])
+
+        clusters_batch = [c[0][1] for c in self.es_store.store_changes_batch.call_args_list
+                          if c[0][0] == self.config.events.cluster_events_index][0]
+        cluster = json.loads(list(clusters_batch.values())[0])
+        # legacy metadata processing adds hosts summary and infra envs to the cluster
+        assert "hosts_summary" not in cluster
+        assert "infra_env" not in cluster["hosts"][0]
+
+    def test_failed_batch_stored_again_on_next_pass(self):
+        self.config.state_store = ClusterStateStore()
+        self.config.watermarks = ClusterWatermarks()
+        self.worker = ClusterEventsWorker(
+            self.config,
+            self.ai_client_mock,
+            self.cluster_events_storage_mock,
+            self.es_store
+        )
+        cluster = {"id": "abcd", "name": "mycluster", "hosts": [], "updated_at": "2022-01-01T00:00:00.000Z"}
+        self.es_store.store_changes_batch.return_value = False
+
+        self.worker.process_clusters([dict(cluster)])
+        assert 1 == self.error_counter.get_errors()
+        assert 0 == self.config.watermarks.size()
+        assert self.config.state_store.get("abcd", "last_event_time") is None
+
+        self.es_store.reset_mock()
+        self.es_store.store_changes_batch.return_value = True
+        self.worker.process_clusters([dict(cluster)])
+        self.es_store.store_changes_batch.assert_any_call(self.config.events.events_index, ANY)
+        assert 1 == self.error_counter.get_errors()
+        assert 1 == self.config.watermarks.size()
+        assert self.config.state_store.get("abcd", "last_event_time") == "2022-01-01T00:00:00.000Z"
+
+    def test_error_fetching_cluster(self):
+        self.ai_client_mock.get_events.side_effect = Exception("Error getting events")
+        self.worker.process_clusters([{"id": "abcd", "name": "mycluster", "hosts": []}])
+
+        self.cluster_events_storage_mock.store_prepared.assert_not_called()
+        # only listed infra envs are stored, at the end of the pass
+        self.es_store.store_changes_batch.assert_called_once_with(self.config.events.infra_envs_events_index, ANY)
+        assert 1 == self.error_counter.get_errors()
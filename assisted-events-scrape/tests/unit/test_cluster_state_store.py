@@ -0,0 +1,89 @@
+from unittest.mock import Mock
+from storage import ClusterStateStore, SQLiteStateBackend
+
+
+class TestClusterStateStore:
+    def test_update_and_get(self):
+        store = ClusterStateStore()
+        assert store.get("A", "event_count") is None
+        assert store.get("A", "event_count", 0) == 0
+
+        store.update("A", event_count=3, checksum="foo")
+        store.update("B", checksum="bar")
+        assert store.get("A", "event_count") == 3
+        assert store.get_all("checksum") == {"A": "foo", "B": "bar"}
+        assert store.get_all("event_count") == {"A": 3}
+
+        # no backend: flush does nothing
+        store.flush()
+
+    def test_flush_only_dirty(self):
+        backend = Mock()
+        backend.load.return_value = {"A": {"event_count": 3}}
+        store = ClusterStateStore(backend)
+        store.load()
+
+        store.update("A", event_count=3)
+        store.flush()
+        backend.save.assert_not_called()
+
+        store.update("A", event_count=4)
+        store.update("B", checksum="foo")
+        store.flush()
+        backend.save.assert_called_once_with({"A": {"event_count": 4}, "B": {"checksum": "foo"}})
+
+    def test_flush_error_keeps_dirty(self):
+        backend = Mock()
+        backend.save.side_effect = [Exception("Error saving"), None]
+        store = ClusterStateStore(backend)
+
+        store.update("A", event_count=1)
+        store.flush()
+        store.flush()
+        assert backend.save.call_count == 2
+        backend.save.assert_called_with({"A": {"event_count": 1}})
+
+    def test_sqlite_backend(self, tmp_path):
+        path = str(tmp_path / "state.db")
+        store = ClusterStateStore(SQLiteStateBackend(path))
+        store.update("A", event_count=3, last_event_time="2022-01-01T00:00:00.000Z")
+        store.flush()
+
+        restarted_store = ClusterStateStore(SQLiteStateBackend(path))
+        restarted_store.load()
+        assert restarted_store.get("A", "event_count") == 3
+        assert restarted_store.get("A", "last_event_time") == "2022-01-01T00:00:00.000Z"
+
+    def test_prune(self):
+        backend = Mock()
+        backend.load.return_value = {"A": {"watermark": "foo"}, "B": {"watermark": "bar"}}
+        backend.delete.side_effect = [Exception("Error deleting"), None]
+        store = ClusterStateStore(backend)
+        store.load()
+        store.update("C", watermark="qux")
+
+        store.prune(["B"])
+        assert store.get_all("watermark") == {"B": "bar"}
+        store.flush()
+        store.flush()
+        # deletions are retried on next flush, new states of deleted clusters are not saved
+        assert backend.delete.call_count == 2
+        backend.delete.assert_called_with({"A", "C"})
+        backend.save.assert_not_called()
+
+        store.flush()
+        assert backend.delete.call_count == 2
+
+    def test_sqlite_backend_delete(self, tmp_path):
+        path = str(tmp_path / "state.db")
+        store = ClusterStateStore(SQLiteStateBackend(path))
+        store.update("A", watermark="foo")
+        store.update("B", watermark="bar")
+        store.flush()
+
+        store.prune(["B"])
+        store.flush()
+
+        restarted_store = ClusterStateStore(SQLiteStateBackend(path))
+        restarted_store.load()
+        assert restarted_store.get_all("watermark") == {"B": "bar"}
@@ -0,0 +1,104 @@
+from unittest.mock import Mock
+import pytest
+from storage import PointInTimeCursor, ScrollCursor, SearchAfterCursor, create_cursor
+from storage.cursor import get_sort
+
+
+class FakeSearchClient:
+    """
+    Serves hits sorted by (event_time, event_id), with OpenSearch point in time responses.
+    Every request is recorded as (method, path, params, body)
+    """
+    def __init__(self, hits):
+        self.hits = sorted(hits, key=lambda hit: hit["sort"])
+        self.requests = []
+        self.transport = Mock()
+        self.transport.perform_request = Mock(side_effect=self._perform_request)
+
+    def search(self, body, index=None, **kwargs):
+        path = "/_search" if index is None else f"/{index}/_search"
+        self.requests.append(("POST", path, kwargs, body))
+        hits = self.hits
+        if "search_after" in body:
+            hits = [hit for hit in hits if hit["sort"] > body["search_after"]]
+        response = {"hits": {"hits": hits[:body["size"]]}}
+        if "pit" in body:
+            response["pit_id"] = f"pit-{len(self.requests)}"
+        return response
+
+    def _perform_request(self, method, url, params=None, body=None, **kwargs):
+        self.requests.append((method, url, dict(params or {}, **kwargs), body))
+        if method == "POST":
+            return {"pit_id": "pit-0", "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                    "creation_time": 1640995200000}
+        return {"pits": [{"pit_id": pit_id, "successful": True} for pit_id in body["pit_id"]]}
+
+
+class TestCursor:
+    def setup(self):
+        self.hits = [{"_id": f"id-{i}", "_source": {"n": i}, "sort": [f"2022-01-{i // 2 + 1:02d}", f"id-{i}"]}
+                     for i in range(10)]
+        self.client = FakeSearchClient(self.hits)
+
+    def test_search_after(self):
+        cursor = SearchAfterCursor(self.client, ".events", {"query": {"match_all": {}}}, "event_id", size=3,
+                                   request_timeout=30, sort=[{"event_time": "asc"}])
+        assert list(cursor) == self.hits
+        assert cursor.checkpoint == self.hits[-1]["sort"]
+
+        assert [request[:3] for request in self.client.requests] == [("POST", "/.events/_search",
+                                                                      {"request_timeout": 30})] * 4
+        first_body = self.client.requests[0][3]
+        assert first_body == {"query": {"match_all": {}}, "size": 3,
+                              "sort": [{"event_time": "asc"}, {"event_id": "asc"}]}
+        assert self.client.requests[1][3]["search_after"] == self.hits[2]["sort"]
+        self.client.transport.perform_request.assert_not_called()
+
+    def test_point_in_time(self):
+        cursor = PointInTimeCursor(self.client, ".events", {"query": {"match_all": {}}}, "event_id", size=3,
+                                   sort=[{"event_time": "asc"}])
+        assert list(cursor) == self.hits
+        assert cursor.checkpoint == self.hits[-1]["sort"]
+
+        requests = self.client.requests
+        assert len(requests) == 6
+        assert requests[0] == ("POST", "/.events/_search/point_in_time", {"keep_alive": "5m"}, None)
+        # searches within a point in time do not target the index
+        assert [request[:2] for request in requests[1:5]] == [("POST", "/_search")] * 4
+        assert requests[1][3] == {"query": {"match_all": {}}, "size": 3,
+                                  "sort": [{"event_time": "asc"}, {"event_id": "asc"}],
+                                  "pit": {"id": "pit-0", "keep_alive": "5m"}}
+        assert requests[2][3]["pit"]["id"] == "pit-2"
+        assert requests[2][3]["search_after"] == self.hits[2]["sort"]
+        assert requests[5] == ("DELETE", "/_search/point_in_time", {"ignore": 404}, {"pit_id": ["pit-5"]})
+
+    def test_resume_from_checkpoint(self):
+        cursor = PointInTimeCursor(self.client, ".events", {"query": {"match_all": {}}}, "event_id", size=3)
+        consumed = []
+        for hit in cursor:
+            consumed.append(hit)
+            if len(consumed) == 5:
+                break
+        # the point in time is released when the consumer stops
+        assert self.client.requests[-1][:2] == ("DELETE", "/_search/point_in_time")
+        assert cursor.checkpoint == self.hits[3]["sort"]
+
+        resumed = SearchAfterCursor(self.client, ".events", {"query": {"match_all": {}}}, "event_id", size=3,
+                                    checkpoint=cursor.checkpoint)
+        # the last hit was not consumed entirely when the consumer stopped: it is returned again
+        assert list(resumed) == self.hits[4:]
+
+    def test_create_cursor(self):
+        assert isinstance(create_cursor("scroll", Mock(), "index", {}, tiebreaker="id", checkpoint=["a"]),
+                          ScrollCursor)
+        assert isinstance(create_cursor("search_after", Mock(), "index", {}, tiebreaker="id"), SearchAfterCursor)
+        assert isinstance(create_cursor("point_in_time", Mock(), "index", {}, tiebreaker="id"), PointInTimeCursor)
+        # without a unique field to sort by, results cannot be paged with search_after
+        assert isinstance(create_cursor("point_in_time", Mock(), "index", {}, size=10), ScrollCursor)
+        with pytest.raises(ValueError):
+            create_cursor("snapshot", Mock(), "index", {})
+
+    def test_sort(self):
+        assert get_sort(None, "event_id") == [{"event_id": "asc"}]
+        assert get_sort([{"offset": "desc"}], "event_id") == [{"offset": "desc"}, {"event_id": "asc"}]
+        assert get_sort(["event_id"], "event_id") == ["event_id"]
@@ -0,0 +1,158 @@
+import json
+from unittest.mock import Mock
+import pytest
+from opensearchpy.exceptions import TransportError
+from storage import DocumentsBatch, DocumentsNotStoredException, ElasticsearchStorage
+
+
+class TestDocumentsBatch:
+    def setup(self):
+        self._es_store = Mock()
+        self._es_store.serialize = json.dumps
+        self._batch = DocumentsBatch(self._es_store, 3)
+
+    def test_flush(self):
+        self._batch.add("foo", [{"id": "A"}, {"id": "B"}], id_fn=lambda d: d["id"])
+        self._batch.add("bar", [{"id": "A"}], id_fn=lambda d: d["id"])
+        # same document from another cluster is stored only once
+        self._batch.add("foo", [{"id": "A"}], id_fn=lambda d: d["id"])
+        self._es_store.store_changes_batch.assert_not_called()
+
+        self._batch.flush()
+        assert self._es_store.store_changes_batch.call_count == 2
+        self._es_store.store_changes_batch.assert_any_call(
+            "foo", {"A": '{"id": "A"}', "B": '{"id": "B"}'})
+        self._es_store.store_changes_batch.assert_any_call("bar", {"A": '{"id": "A"}'})
+
+        self._es_store.reset_mock()
+        self._batch.flush()
+        self._es_store.store_changes_batch.assert_not_called()
+
+    def test_on_stored(self):
+        on_stored = Mock()
+        self._batch.add("foo", [{"id": "A"}], id_fn=lambda d: d["id"], on_stored=on_stored)
+        on_stored.assert_not_called()
+
+        self._batch.flush()
+        self._es_store.store_changes_batch.assert_called_once_with("foo", {"A": '{"id": "A"}'})
+        on_stored.assert_called_once_with()
+
+        # nothing to store
+        on_stored.reset_mock()
+        self._batch.add("foo", [], id_fn=lambda d: d["id"], on_stored=on_stored)
+        on_stored.assert_called_once_with()
+
+    def test_not_stored(self):
+        self._es_store.store_changes_batch.side_effect = lambda index, _: index != "foo"
+        on_foo_stored = Mock()
+        on_bar_stored = Mock()
+        self._batch.add("foo", [{"id": "A"}], id_fn=lambda d: d["id"], on_stored=on_foo_stored)
+        self._batch.add("bar", [{"id": "A"}], id_fn=lambda d: d["id"], on_stored=on_bar_stored)
+
+        with pytest.raises(DocumentsNotStoredException):
+            self._batch.flush()
+        # other indices are stored nonetheless
+        assert self._es_store.store_changes_batch.call_count == 2
+        on_foo_stored.assert_not_called()
+        on_bar_stored.assert_called_once_with()
+
+    def test_store_when_full(self):
+        def add_foo(d):
+            return {**d, "foo": "bar"}
+
+        self._batch.add("foo", [{"id": "A"}, {"id": "B"}], id_fn=lambda d: d["id"], transform_document_fn=add_foo)
+        self._es_store.store_changes_batch.assert_not_called()
+        self._batch.add("foo", [{"id": "C"}], id_fn=lambda d: d["id"], transform_document_fn=add_foo)
+        self._es_store.store_changes_batch.assert_called_once_with("foo", {
+            "A": '{"id": "A", "foo": "bar"}',
+            "B": '{"id": "B", "foo": "bar"}',
+            "C": '{"id": "C", "foo": "bar"}',
+        })
+
+
+class TestElasticsearchStorageBatch:
+    def test_store_changes_batch(self, monkeypatch):
+        es_client = Mock()
+        es_client.mget.return_value = {"docs": [
+            {"_id": "A", "found": True},
+            {"_id": "B", "found": False},
+        ]}
+        bulk = Mock(return_value=(1, []))
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        es_store = ElasticsearchStorage(es_client)
+        assert es_store.store_changes_batch("foo", {"A": '{"id": "A"}', "B": '{"id": "B"}'})
+
+        es_client.mget.assert_called_once_with(index="foo", body={"ids": ["A", "B"]}, _source=False)
+        actions = list(bulk.call_args[0][1])
+        assert actions == [{"_index": "foo", "_id": "B", "_source": '{"id": "B"}', "_op_type": "create"}]
+        assert es_store.stats.get() == {"foo": {"inserted": 1, "duplicates": 0, "errors": 0}}
+
+    def test_store_changes_batch_optimistic(self, monkeypatch):
+        es_client = Mock()
+        bulk = Mock(return_value=(1, [
+            {"create": {"_index": "foo", "_id": "A", "status": 409}},
+            {"create": {"_index": "foo", "_id": "C", "status": 400}},
+        ]))
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        es_store = ElasticsearchStorage(es_client, optimistic=True)
+        # C was not stored
+        assert not es_store.store_changes_batch("foo", {"A": '{"id": "A"}', "B": '{"id": "B"}', "C": '{"id": "C"}'})
+
+        es_client.mget.assert_not_called()
+        actions = list(bulk.call_args[0][1])
+        assert [action["_id"] for action in actions] == ["A", "B", "C"]
+        assert es_store.stats.reset() == {"foo": {"inserted": 1, "duplicates": 1, "errors": 1}}
+        assert es_store.stats.get() == {}
+
+    def test_store_changes_optimistic(self, monkeypatch):
+        es_client = Mock()
+        bulk = Mock(return_value=(2, []))
+        scan = Mock()
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+        monkeypatch.setattr("opensearchpy.helpers.scan", scan)
+
+        es_store = ElasticsearchStorage(es_client, optimistic=True)
+        assert es_store.store_changes("foo", [{"id": "A"}, {"id": "B"}], id_fn=lambda d: d["id"])
+
+        scan.assert_not_called()
+        actions = list(bulk.call_args[0][1])
+        assert [action["_id"] for action in actions] == ["A", "B"]
+        assert es_store.stats.get() == {"foo": {"inserted": 2, "duplicates": 0, "errors": 0}}
+
+    def test_store_changes_conflicts(self, monkeypatch):
+        es_client = Mock()
+        bulk = Mock(return_value=(1, [{"create": {"_index": "foo", "_id": "A", "status": 409}}]))
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        es_store = ElasticsearchStorage(es_client, optimistic=True)
+        # A was already stored
+        assert es_store.store_changes("foo", [{"id": "A"}, {"id": "B"}], id_fn=lambda d: d["id"])
+
+    def test_store_changes_error(self, monkeypatch):
+        es_client = Mock()
+        monkeypatch.setattr("opensearchpy.helpers.bulk", Mock(side_effect=Exception("Connection refused")))
+
+        es_store = ElasticsearchStorage(es_client, optimistic=True)
+        assert not es_store.store_changes("foo", [{"id": "A"}], id_fn=lambda d: d["id"])
+
+    def test_store_changes_retry(self, monkeypatch):
+        es_client = Mock()
+        sleep = Mock()
+        monkeypatch.setattr("retry.api.time.sleep", sleep)
+        bulk = Mock(side_effect=[TransportError(503, "unavailable"), (1, [])])
+        monkeypatch.setattr("opensearchpy.helpers.bulk", bulk)
+
+        es_store = ElasticsearchStorage(es_client, optimistic=True)
+        assert es_store.store_changes("foo", [{"id": "A"}], id_fn=lambda d: d["id"])
+        assert bulk.call_count == 2
+        sleep.assert_called_once()
+        # the same actions are sent again
+        assert bulk.call_args_list[0][0][1] == bulk.call_args_list[1][0][1]
+        assert [action["_id"] for action in bulk.call_args[0][1]] == ["A"]
+
+        # retries are exhausted
+        bulk.side_effect = TransportError(503, "unavailable")
+        assert not es_store.store_changes("foo", [{"id": "A"}], id_fn=lambda d: d["id"])
+        assert bulk.call_count == 5
@@ -1,6 +1,7 @@
 from events import EventsExporter, EventStream
-from storage import DateOffsetOptions
-from unittest.mock import Mock
+from config import EventExportConfig, ObjectStorageConfig
+from storage import DateOffset, DateOffsetOptions, ObjectStorageWriter, ParquetOptions
+from unittest.mock import Mock, patch
 
 
 class TestEventsExporter:
@@ -51,6 +52,142 @@ class TestEventsExporter:
         }
         assert query == expected_query
 
+    @patch("storage.cursor.helpers")
+    def test_parallel_export(self, helpers):
+        docs = {
+            cluster_id: [{"_source": {"cluster_id": cluster_id, "event_time": f"2022-01-0{day}T00:00:00Z"}}
+                         for day in range(1, 10)]
+            for cluster_id in ["a", "b", "c", "d"]
+        }
+
+        def scan(_client, query, **_kwargs):
+            must = query["query"]["bool"].get("must")
+            if must is None:
+                # partitions without offset
+                return iter(docs["d"])
+            return iter(docs[must[1]["term"]["cluster_id"]])
+
+        helpers.scan.side_effect = scan
+        offsets = DateOffset([{"partition": cluster_id, "offset": "2022-01-01T00:00:00Z"} for cluster_id in "abc"])
+        stream = EventStream(".events", DateOffsetOptions("cluster_id", "event_time"))
+        writer = ObjectStorageWriter(Mock(), ObjectStorageConfig("mykey", "mysecret", "myendpoint", "mybucket"))
+        written = []
+
+        for parallel_partitions in [1, 3]:
+            exporter = EventsExporter(EventExportConfig(10, parallel_partitions, 2), Mock(), writer, Mock())
+            with patch("storage.object_storage_writer.smart_open") as smart_open:
+                new_offsets = writer.write_ndjson_stream(
+                    lambda _doc: "key", map(lambda x: x["_source"], exporter._get_all_docs(stream, offsets)),
+                    stream.options)
+            written.append(sorted(call.args[0] for call in smart_open.open.return_value.write.call_args_list))
+            assert new_offsets.getAll() == {cluster_id: "2022-01-09T00:00:00Z" for cluster_id in "abcd"}
+        assert written[0] == written[1]
+        assert len(written[0]) == 36
+
+    @patch("storage.cursor.helpers")
+    def test_single_scan_export(self, helpers):
+        docs = [
+            {"_source": {"cluster_id": cluster_id, "event_time": f"2022-01-0{day}T00:00:00Z"}}
+            for cluster_id in ["a", "b", "c"] for day in range(1, 6)
+        ]
+
+        def scan(_client, query, **_kwargs):
+            must_not = query["query"]["bool"].get("must_not")
+            if must_not is not None:
+                excluded = must_not[0]["terms"]["cluster_id"]
+                return iter(doc for doc in docs if doc["_source"]["cluster_id"] not in excluded)
+            return iter(doc for doc in docs if doc["_source"]["event_time"] > "2022-01-01T00:00:00Z")
+
+        helpers.scan.side_effect = scan
+        offsets = DateOffset([
+            {"partition": "a", "offset": "2022-01-01T00:00:00Z"},
+            {"partition": "b", "offset": "2022-01-03T00:00:00Z"},
+        ])
+        stream = EventStream(".events", DateOffsetOptions("cluster_id", "event_time"))
+        exporter = EventsExporter(EventExportConfig(10, strategy="single_scan"), Mock(), Mock(), Mock())
+
+        docs = [doc["_source"] for doc in exporter._get_all_docs(stream, offsets)]
+
+        assert [call.kwargs["query"] for call in helpers.scan.call_args_list] == [
+            {"query": {"bool": {"must": [{"range": {"event_time": {"gt": "2022-01-01T00:00:00Z"}}}]}}},
+            {"query": {"bool": {"must_not": [{"terms": {"cluster_id": ["a", "b"]}}]}}},
+        ]
+        # documents of partitions without offset are all exported, even before the earliest offset
+        assert [(doc["cluster_id"], doc["event_time"][8:10]) for doc in docs] == [
+            ("a", "02"), ("a", "03"), ("a", "04"), ("a", "05"),
+            ("b", "04"), ("b", "05"),
+            ("c", "01"), ("c", "02"), ("c", "03"), ("c", "04"), ("c", "05"),
+        ]
+
+    def test_checkpoints(self):
+        offset_repo = Mock()
+        stream = EventStream(".events", DateOffsetOptions("cluster_id", "event_time"), tiebreaker="event_id")
+        exporter = EventsExporter(EventExportConfig(10, checkpoint_documents=100), Mock(), Mock(), offset_repo)
+        # documents are only sorted by sorted cursors
+        assert exporter._get_checkpoint(stream) is None
+
+        exporter = EventsExporter(EventExportConfig(10, cursor="point_in_time", checkpoint_seconds=60),
+                                  Mock(), Mock(), offset_repo)
+        # and only with a unique field to sort by
+        assert exporter._get_checkpoint(EventStream(".events", stream.options)) is None
+        checkpoint = exporter._get_checkpoint(stream)
+        assert (checkpoint.documents, checkpoint.seconds) == (0, 60)
+
+        checkpoint.fn(DateOffset([{"partition": "a", "offset": "2022-01-01T10:00:00.000Z"},
+                                  {"partition": "b", "offset": "2022-01-01T10:00:00"}]))
+        name, saved = offset_repo.save.call_args.args
+        assert name == ".events"
+        # documents sharing the last offset are exported again on resume, rather than skipped
+        assert saved.getAll() == {"a": "2022-01-01T09:59:59.999Z", "b": "2022-01-01T09:59:59.999Z"}
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_resume_from_checkpoint(self, smart_open):
+        hits = [{"_source": {"cluster_id": cluster_id, "event_time": f"2022-01-0{day}T00:00:00.000Z",
+                             "event_id": f"{cluster_id}{day}"}}
+                for day in range(1, 5) for cluster_id in "ab"]
+        for hit in hits:
+            hit["sort"] = [hit["_source"]["event_time"], hit["_source"]["event_id"]]
+
+        def search(index, body, **_kwargs):
+            assert index == ".events"
+            assert body["sort"] == [{"event_time": "asc"}, {"event_id": "asc"}]
+            after = [hit for hit in hits if "search_after" not in body or hit["sort"] > body["search_after"]]
+            return {"hits": {"hits": after[:body["size"]]}}
+
+        opened = []
+        closed = []
+        saved = []
+
+        def open_stream(url, *_args, **_kwargs):
+            opened.append(url)
+            stream = Mock()
+            stream.close.side_effect = lambda: closed.append(url)
+            return stream
+
+        def save(_name, offsets):
+            saved.append((list(closed), offsets.getAll()))
+
+        smart_open.open.side_effect = open_stream
+        es_client = Mock()
+        es_client.search.side_effect = search
+        offset_repo = Mock()
+        offset_repo.load.return_value = DateOffset()
+        offset_repo.save.side_effect = save
+        writer = ObjectStorageWriter(Mock(), ObjectStorageConfig("mykey", "mysecret", "myendpoint", "mybucket"))
+        stream = EventStream(".events", DateOffsetOptions("cluster_id", "event_time"), tiebreaker="event_id")
+        exporter = EventsExporter(EventExportConfig(3, cursor="search_after", checkpoint_documents=3),
+                                  es_client, writer, offset_repo)
+
+        exporter.export_stream(stream)
+
+        # each checkpoint holds the offsets of the documents of the objects closed right before it
+        assert [(len(closed_objects), offsets) for closed_objects, offsets in saved] == [
+            (2, {"a": "2022-01-01T23:59:59.999Z", "b": "2021-12-31T23:59:59.999Z"}),
+            (4, {"a": "2022-01-02T23:59:59.999Z", "b": "2022-01-02T23:59:59.999Z"}),
+            (5, {"a": "2022-01-04T00:00:00.000Z", "b": "2022-01-04T00:00:00.000Z"}),
+        ]
+        assert closed == opened
+
     def test_query_no_partition(self):
         stream = EventStream(
             "foobar",
@@ -91,3 +228,20 @@ class TestEventsExporter:
             }
         }
         assert query == expected_query
+
+    def test_parquet_export(self):
+        writer = Mock()
+        offset_repo = Mock()
+        offset_repo.load.return_value = DateOffset()
+        stream = EventStream(".events", DateOffsetOptions("cluster_id", "event_time"), "zstd", "parquet")
+        exporter = EventsExporter(EventExportConfig(10, parquet_row_group_size=100), Mock(), writer, offset_repo)
+        exporter._get_all_docs = Mock(return_value=[])
+
+        exporter.export_stream(stream)
+
+        writer.write_ndjson_stream.assert_not_called()
+        key_fn = writer.write_parquet_stream.call_args.args[0]
+        assert key_fn({"event_time": "2022-01-02T03:04:05Z"}).startswith(".events/2022-01-02/")
+        assert key_fn({"event_time": "2022-01-02T03:04:05Z"}).endswith(".parquet")
+        assert writer.write_parquet_stream.call_args.kwargs["parquet_options"] == ParquetOptions(100, "zstd")
+        offset_repo.save.assert_called_once_with(".events", writer.write_parquet_stream.return_value)
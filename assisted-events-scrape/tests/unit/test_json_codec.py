@@ -0,0 +1,51 @@
+import json
+from datetime import datetime
+import pytest
+from opensearchpy.serializer import JSONSerializer
+from clients import CodecJSONSerializer
+from utils import json_loads, json_dumps, set_json_codec, get_json_codec_name
+
+
+@pytest.fixture(params=["stdlib", "orjson"])
+def codec(request):
+    pytest.importorskip(request.param if request.param != "stdlib" else "json")
+    previous = get_json_codec_name()
+    set_json_codec(request.param)
+    yield request.param
+    set_json_codec(previous)
+
+
+class TestJSONCodec:
+    def setup(self):
+        self.doc = {"b": [1, "two", None, 1.5, True], "a": {"é": "ü"}, "created_at": datetime(2022, 1, 2, 3, 4, 5)}
+
+    def test_round_trip(self, codec):  # pylint: disable=unused-argument
+        dumped = json_dumps(self.doc, default=str)
+        assert json_loads(dumped) == dict(self.doc, created_at="2022-01-02 03:04:05")
+        assert json_loads(dumped.encode("utf-8")) == json_loads(dumped)
+
+    def test_sort_keys(self, codec):  # pylint: disable=unused-argument
+        assert list(json_loads(json_dumps(self.doc, default=str, sort_keys=True))) == ["a", "b", "created_at"]
+
+    def test_not_encodable_without_default(self, codec):  # pylint: disable=unused-argument
+        with pytest.raises(TypeError):
+            json_dumps(self.doc)
+
+    def test_fallback(self, codec):  # pylint: disable=unused-argument
+        # orjson does not support these, the standard library encodes them
+        assert json_loads(json_dumps({1: "one"})) == {"1": "one"}
+        assert json_loads(json_dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
+
+    def test_invalid_documents(self, codec):  # pylint: disable=unused-argument
+        for document in ["", "{", "[1,]"]:
+            with pytest.raises(json.JSONDecodeError):
+                json_loads(document)
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            set_json_codec("simplejson")
+
+    def test_serializer_output_is_unchanged(self, codec):  # pylint: disable=unused-argument
+        assert CodecJSONSerializer().dumps(self.doc) == JSONSerializer().dumps(self.doc)
+        assert CodecJSONSerializer().dumps("already serialized") == "already serialized"
+        assert CodecJSONSerializer().loads('{"a": [1]}') == {"a": [1]}
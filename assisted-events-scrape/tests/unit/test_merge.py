@@ -0,0 +1,47 @@
+import threading
+import pytest
+from utils import merge_parallel
+
+
+class TestMergeParallel:
+    def setup(self):
+        self.closed = []
+        self.lock = threading.Lock()
+
+    def source(self, name, count, fail_at=None):
+        def generate():
+            try:
+                for i in range(count):
+                    if i == fail_at:
+                        raise ValueError(name)
+                    yield (name, i)
+            finally:
+                with self.lock:
+                    self.closed.append(name)
+        return generate
+
+    def test_merge(self):
+        sources = [self.source(name, 50) for name in "abcdef"]
+        items = list(merge_parallel(sources, workers=3, queue_size=2))
+
+        assert sorted(items) == sorted((name, i) for name in "abcdef" for i in range(50))
+        for name in "abcdef":
+            # order is kept within each source
+            assert [i for item_name, i in items if item_name == name] == list(range(50))
+        assert sorted(self.closed) == list("abcdef")
+
+    def test_no_sources(self):
+        assert not list(merge_parallel([], workers=3, queue_size=2))
+
+    def test_error_is_raised(self):
+        sources = [self.source("a", 1000), self.source("b", 10, fail_at=5), self.source("c", 1000)]
+        with pytest.raises(ValueError, match="b"):
+            list(merge_parallel(sources, workers=3, queue_size=2))
+        assert "b" in self.closed
+
+    def test_consumer_stops(self):
+        merged = merge_parallel([self.source(name, 1000) for name in "ab"], workers=2, queue_size=2)
+        assert next(merged) is not None
+        merged.close()
+        # producers are stopped and their sources closed
+        assert sorted(self.closed) == ["a", "b"]
@@ -0,0 +1,56 @@
+import threading
+import pytest
+from storage.multipart_upload import MIN_PART_SIZE, UploadPool
+from unittest.mock import Mock
+
+
+class TestMultipartUpload:
+    def setup(self):
+        self.client = Mock()
+        self.client.create_multipart_upload.return_value = {"UploadId": "myupload"}
+        self.client.upload_part.side_effect = lambda **kwargs: {"ETag": f"etag{kwargs['PartNumber']}"}
+
+    def test_small_object(self):
+        with UploadPool(self.client, 2) as pool:
+            stream = pool.open("mybucket", "mykey")
+            stream.write(b"foo\n")
+            stream.write(b"bar\n")
+            stream.close()
+
+        self.client.put_object.assert_called_once_with(Bucket="mybucket", Key="mykey", Body=b"foo\nbar\n")
+        self.client.create_multipart_upload.assert_not_called()
+
+    def test_parts(self):
+        uploaded = {}
+        lock = threading.Lock()
+
+        def upload_part(**kwargs):
+            with lock:
+                uploaded[kwargs["PartNumber"]] = kwargs["Body"]
+            return {"ETag": f"etag{kwargs['PartNumber']}"}
+
+        self.client.upload_part.side_effect = upload_part
+        chunk = b"x" * (MIN_PART_SIZE // 2 + 1)
+        with UploadPool(self.client, 2, max_pending=1) as pool:
+            stream = pool.open("mybucket", "mykey")
+            for _ in range(5):
+                stream.write(chunk)
+            stream.close()
+
+        assert sorted(uploaded) == [1, 2, 3]
+        assert b"".join(uploaded[number] for number in sorted(uploaded)) == chunk * 5
+        self.client.complete_multipart_upload.assert_called_once_with(
+            Bucket="mybucket", Key="mykey", UploadId="myupload",
+            MultipartUpload={"Parts": [{"PartNumber": number, "ETag": f"etag{number}"} for number in [1, 2, 3]]})
+
+    def test_failed_part(self):
+        self.client.upload_part.side_effect = ConnectionError("unreachable")
+        with UploadPool(self.client, 1) as pool:
+            stream = pool.open("mybucket", "mykey")
+            stream.write(b"x" * MIN_PART_SIZE)
+            with pytest.raises(ConnectionError):
+                stream.close()
+
+        self.client.complete_multipart_upload.assert_not_called()
+        self.client.abort_multipart_upload.assert_called_once_with(Bucket="mybucket", Key="mykey",
+                                                                   UploadId="myupload")
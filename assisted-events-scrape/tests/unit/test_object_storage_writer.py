@@ -1,6 +1,11 @@
-from storage import ObjectStorageWriter
+import gzip
+import io
+import json
+import pytest
+from storage import DateOffsetOptions, ObjectStorageWriter, ParquetOptions, WriteCheckpoint
+from storage.object_storage_writer import get_part_key
 from config import ObjectStorageConfig
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 
 class TestObjectStorageWriter:
@@ -36,3 +41,221 @@ class TestObjectStorageWriter:
 
         offset = self._writer._get_offset_from_doc(doc, "")
         assert offset is None
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_checkpoints(self, smart_open):
+        opened = []
+        closed = []
+        checkpoints = []
+
+        def open_stream(url, *_args, **_kwargs):
+            opened.append(url)
+            stream = Mock()
+            stream.close.side_effect = lambda: closed.append(url)
+            return stream
+
+        def save_checkpoint(offset):
+            # objects are complete before offsets are reported
+            assert sorted(closed) == sorted(opened)
+            checkpoints.append(dict(offset.getAll()))
+
+        smart_open.open.side_effect = open_stream
+        documents = [{"cluster_id": "ab"[i % 2], "event_time": f"2022-01-0{i + 1}", "day": i // 4} for i in range(7)]
+        offset = self._writer.write_ndjson_stream(
+            lambda doc: f"events/{doc['day']}/1_abc.ndjson", documents,
+            options=DateOffsetOptions("cluster_id", "event_time"),
+            checkpoint=WriteCheckpoint(save_checkpoint, documents=3))
+
+        assert checkpoints == [
+            {"a": "2022-01-03", "b": "2022-01-02"},
+            {"a": "2022-01-05", "b": "2022-01-06"},
+        ]
+        assert offset.getAll() == {"a": "2022-01-07", "b": "2022-01-06"}
+        assert opened == [
+            "s3://mybucket/events/0/1_abc.ndjson",
+            "s3://mybucket/events/0/1_abc-1.ndjson",
+            "s3://mybucket/events/1/1_abc.ndjson",
+            "s3://mybucket/events/1/1_abc-1.ndjson",
+        ]
+        assert sorted(closed) == sorted(opened)
+
+    def test_part_key(self):
+        assert get_part_key("events/2022-01-01/1_abc.ndjson", 0) == "events/2022-01-01/1_abc.ndjson"
+        assert get_part_key("events/2022-01-01/1_abc.ndjson", 2) == "events/2022-01-01/1_abc-2.ndjson"
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_max_open_streams(self, smart_open):
+        open_streams = set()
+        opened = []
+
+        def open_stream(url, *_args, **_kwargs):
+            assert len(open_streams) < 2
+            open_streams.add(url)
+            opened.append(url)
+            stream = Mock()
+            stream.close.side_effect = lambda: open_streams.remove(url)
+            return stream
+
+        smart_open.open.side_effect = open_stream
+        self._writer.config.max_open_streams = 2
+        days = ["1", "2", "1", "3", "1", "2"]
+        self._writer.write_ndjson_stream(lambda doc: f"events/{doc['day']}.ndjson", [{"day": day} for day in days])
+
+        # "1" is written recently enough to stay open, "2" is closed when "3" is opened and rolls to a new part
+        assert opened == [
+            "s3://mybucket/events/1.ndjson",
+            "s3://mybucket/events/2.ndjson",
+            "s3://mybucket/events/3.ndjson",
+            "s3://mybucket/events/2-1.ndjson",
+        ]
+        assert not open_streams
+
+    @staticmethod
+    def capture_objects(smart_open):
+        objects = {}
+
+        class UploadedObject(io.BytesIO):
+            def __init__(self, url):
+                super().__init__()
+                self.url = url
+
+            def close(self):
+                objects[self.url] = self.getvalue()
+                super().close()
+
+        smart_open.open.side_effect = lambda url, mode, **_kwargs: UploadedObject(url)
+        return objects
+
+    def write_compressed(self, smart_open, compression):
+        objects = self.capture_objects(smart_open)
+        documents = [{"id": i, "day": i % 2, "text": "repeated " * 10} for i in range(100)]
+        self._writer.write_ndjson_stream(lambda doc: f"events/{doc['day']}.ndjson", documents,
+                                         compression=compression)
+        assert all(call.args[1] == "wb" for call in smart_open.open.call_args_list)
+        return objects
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_gzip(self, smart_open):
+        objects = self.write_compressed(smart_open, "gzip")
+
+        assert sorted(objects) == ["s3://mybucket/events/0.ndjson.gz", "s3://mybucket/events/1.ndjson.gz"]
+        lines = gzip.decompress(objects["s3://mybucket/events/1.ndjson.gz"]).decode("utf-8").splitlines()
+        assert [json.loads(line)["id"] for line in lines] == list(range(1, 100, 2))
+        assert len(objects["s3://mybucket/events/1.ndjson.gz"]) < len("\n".join(lines)) / 10
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_zstd(self, smart_open):
+        zstandard = pytest.importorskip("zstandard")
+        objects = self.write_compressed(smart_open, "zstd")
+
+        assert sorted(objects) == ["s3://mybucket/events/0.ndjson.zst", "s3://mybucket/events/1.ndjson.zst"]
+        content = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(objects["s3://mybucket/events/0.ndjson.zst"]))
+        assert [json.loads(line)["id"] for line in content.read().splitlines()] == list(range(0, 100, 2))
+
+    def test_unknown_compression(self):
+        with pytest.raises(ValueError):
+            self._writer.write_ndjson_stream(lambda doc: "key", [{"id": 1}], compression="lzma")
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_parquet(self, smart_open):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        objects = self.capture_objects(smart_open)
+        documents = [{"id": i, "day": i % 2, "time": f"2022-01-01T00:00:{i:02}", "props": {"hosts": i}}
+                     for i in range(50)]
+
+        offset = self._writer.write_parquet_stream(lambda doc: f"events/{doc['day']}.parquet", documents,
+                                                   options=DateOffsetOptions("day", "time"),
+                                                   parquet_options=ParquetOptions(row_group_size=10))
+
+        assert sorted(objects) == ["s3://mybucket/events/0.parquet", "s3://mybucket/events/1.parquet"]
+        parquet_file = parquet.ParquetFile(io.BytesIO(objects["s3://mybucket/events/1.parquet"]))
+        assert parquet_file.metadata.num_row_groups == 3
+        assert parquet_file.read().to_pylist() == documents[1::2]
+        assert offset.getAll() == {0: "2022-01-01T00:00:48", 1: "2022-01-01T00:00:49"}
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_parquet_schema_change(self, smart_open):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        objects = self.capture_objects(smart_open)
+        documents = [{"id": 1, "name": "one"}, {"id": 2}, {"id": 3, "name": None}, {"id": "four"},
+                     {"id": 5, "props": {"a": 1}}, {"id": 6, "props": "six"}]
+
+        self._writer.write_parquet_stream(lambda doc: "events.parquet", documents,
+                                          parquet_options=ParquetOptions(row_group_size=1, compression="zstd"))
+
+        def read(key):
+            return parquet.read_table(io.BytesIO(objects[f"s3://mybucket/{key}"])).to_pylist()
+
+        assert set(objects) == {f"s3://mybucket/events{part}.parquet" for part in ["", "-1", "-2", "-3"]}
+        # missing and null values fit, other types and new columns go to new objects
+        assert read("events.parquet") == [{"id": 1, "name": "one"}, {"id": 2, "name": None}, {"id": 3, "name": None}]
+        assert read("events-1.parquet") == [{"id": "four"}]
+        assert read("events-2.parquet") == [{"id": 5, "props": {"a": 1}}]
+        assert read("events-3.parquet") == [{"id": 6, "props": "six"}]
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_parquet_heterogeneous_documents(self, smart_open):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        objects = self.capture_objects(smart_open)
+        documents = [
+            {"id": 1, "props": {"a": 1}, "hosts": [{"id": "h1"}], "name": None},
+            {"id": 2.5, "props": {"b": "two"}, "hosts": [{"id": "h2", "role": "master"}], "name": None},
+            {"id": 3, "hosts": None, "name": "three"},
+            {"id": 4, "props": {"a": 4.5, "c": {"d": [4]}}, "hosts": [], "name": "four"},
+        ]
+        # once the schema is written, later row groups are cast to it
+        documents += [{"id": i, "props": {"c": {"d": None}}, "hosts": [{"role": "worker"}]} for i in range(5, 15)]
+
+        self._writer.write_parquet_stream(lambda doc: "events.parquet", documents + [{"id": 15, "new": True}],
+                                          parquet_options=ParquetOptions(row_group_size=1))
+
+        table = parquet.read_table(io.BytesIO(objects["s3://mybucket/events.parquet"]))
+        assert str(table.schema.field("id").type) == "double"
+        assert str(table.schema.field("props").type) == \
+            "struct<a: double, b: string, c: struct<d: list<element: int64>>>"
+        rows = table.to_pylist()
+        assert rows[:4] == [
+            {"id": 1, "props": {"a": 1, "b": None, "c": None}, "hosts": [{"id": "h1", "role": None}], "name": None},
+            {"id": 2.5, "props": {"a": None, "b": "two", "c": None}, "hosts": [{"id": "h2", "role": "master"}],
+             "name": None},
+            {"id": 3, "props": None, "hosts": None, "name": "three"},
+            {"id": 4, "props": {"a": 4.5, "b": None, "c": {"d": [4]}}, "hosts": [], "name": "four"},
+        ]
+        assert rows[4:] == [{"id": i, "props": {"a": None, "b": None, "c": {"d": None}},
+                             "hosts": [{"id": None, "role": "worker"}], "name": None} for i in range(5, 15)]
+        # new columns do not fit in a written schema
+        assert parquet.read_table(io.BytesIO(objects["s3://mybucket/events-1.parquet"])).to_pylist() == [
+            {"id": 15, "new": True}
+        ]
+
+    @patch("storage.object_storage_writer.smart_open")
+    def test_parquet_mixed_types(self, smart_open):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        objects = self.capture_objects(smart_open)
+        documents = [{"id": 1, "props": {"a": 1}}, {"id": 2, "props": "two"}, {"id": 3}]
+
+        self._writer.write_parquet_stream(lambda doc: "events.parquet", documents)
+
+        rows = parquet.read_table(io.BytesIO(objects["s3://mybucket/events.parquet"])).to_pylist()
+        assert rows == [{"id": 1, "props": '{"a":1}'}, {"id": 2, "props": "two"}, {"id": 3, "props": None}]
+
+    def test_upload_pool(self):
+        cfg = ObjectStorageConfig("mykey", "mysecret", "myendpoint", "mybucket", upload_concurrency=2)
+        writer = ObjectStorageWriter(self._client, cfg)
+
+        writer.write_ndjson_stream(lambda doc: f"events/{doc['day']}.ndjson", [{"day": day} for day in [1, 2, 1]])
+
+        bodies = {call.kwargs["Key"]: call.kwargs["Body"] for call in self._client.put_object.call_args_list}
+        assert bodies == {"events/1.ndjson": b'{"day":1}\n{"day":1}\n', "events/2.ndjson": b'{"day":2}\n'}
+
+    def test_upload_pool_parquet(self):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        cfg = ObjectStorageConfig("mykey", "mysecret", "myendpoint", "mybucket", upload_concurrency=2)
+        writer = ObjectStorageWriter(self._client, cfg)
+        documents = [{"id": i, "name": f"name{i}"} for i in range(10)]
+
+        writer.write_parquet_stream(lambda doc: "events.parquet", documents,
+                                    parquet_options=ParquetOptions(row_group_size=3, compression="gzip"))
+
+        body = self._client.put_object.call_args.kwargs["Body"]
+        assert parquet.read_table(io.BytesIO(body)).to_pylist() == documents
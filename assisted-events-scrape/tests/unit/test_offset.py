@@ -1,4 +1,6 @@
-from storage import DateOffset
+from unittest.mock import Mock, patch
+from storage import DateOffset, DateOffsetRepository
+from storage.offset import OFFSET_LOAD_PAGE_SIZE
 
 
 class TestDateOffset:
@@ -32,3 +34,60 @@ class TestDateOffset:
 
         offset = self._offset.getOffset("A")
         assert offset == "Wed Jan 02 00:00:01 GMT 2022"
+
+    def test_missing_offset(self):
+        self._offset.setOffset(None, "A")
+        assert self._offset.size() == 0
+        assert self._offset.getOffset("A") is None
+
+        self._offset.setOffset("2022-01-01", "A")
+        self._offset.setOffset(None, "A")
+        assert self._offset.getOffset("A") == "2022-01-01"
+
+        offset = DateOffset([{"partition": "A", "offset": None}, {"partition": "B", "offset": "2022-01-01"}])
+        assert offset.getAll() == {"B": "2022-01-01"}
+
+    def test_is_after(self):
+        assert self._offset.getMinOffset() is None
+        assert self._offset.isAfter("2022-01-01", "A")
+
+        self._offset.setOffset("2022-01-01T10:00:00.000Z", "A")
+        self._offset.setOffset("2021-06-01T10:00:00Z", "B")
+        assert self._offset.getMinOffset() == "2021-06-01T10:00:00Z"
+
+        assert not self._offset.isAfter("2022-01-01T10:00:00Z", "A")
+        assert self._offset.isAfter("2022-01-01T10:00:00.001Z", "A")
+        assert self._offset.isAfter("2021-07-01", "B")
+        assert self._offset.isAfter("2020-01-01", "C")
+
+        self._offset.setOffset("2022-06-01", "B")
+        assert not self._offset.isAfter("2021-07-01", "B")
+        assert self._offset.getMinOffset() == "2022-01-01T10:00:00.000Z"
+
+    def test_many_partitions(self):
+        partitions = 200000
+        for i in range(partitions):
+            self._offset.setOffset(f"2022-01-01T00:{i % 60:02}:00Z", f"cluster-{i}")
+        self._offset.setOffset("2021-01-01T00:00:00Z", "cluster-1")
+        self._offset.setOffset("2023-01-01T00:00:00Z", "cluster-2")
+
+        assert self._offset.size() == partitions
+        assert self._offset.getOffset("cluster-1") == "2022-01-01T00:01:00Z"
+        assert self._offset.getOffset("cluster-2") == "2023-01-01T00:00:00Z"
+        assert self._offset.getOffset("cluster-unknown") is None
+        assert self._offset.getMinOffset() == "2022-01-01T00:00:00Z"
+        assert dict(self._offset.items()) == self._offset.getAll()
+        assert list(self._offset.getAll())[:2] == ["cluster-0", "cluster-1"]
+
+    @patch("storage.cursor.helpers")
+    def test_load_all_partitions(self, helpers):
+        partitions = 3 * OFFSET_LOAD_PAGE_SIZE + 1
+        helpers.scan.return_value = iter(
+            {"_source": {"partition": f"cluster-{i}", "offset": "2022-01-01T00:00:00Z"}} for i in range(partitions)
+        )
+
+        offset = DateOffsetRepository(Mock(), "offsets").load("mystream")
+
+        assert offset.size() == partitions
+        assert helpers.scan.call_args.kwargs["size"] == OFFSET_LOAD_PAGE_SIZE
+        assert "terminate_after" not in helpers.scan.call_args.kwargs["query"]
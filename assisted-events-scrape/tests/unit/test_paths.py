@@ -0,0 +1,48 @@
+from utils import compile_getter, compile_deleter
+
+
+class TestPaths:
+    def setup(self):
+        self.doc = {
+            "id": "abcd",
+            "cluster": {
+                "name": "mycluster",
+                "hosts": [
+                    {"id": "1", "connectivity": "foo", "progress": {"current_stage": "Done"}},
+                    {"id": "2"},
+                    {"id": "3", "connectivity": "bar"},
+                ],
+            },
+        }
+
+    def test_get(self):
+        assert compile_getter("id")(self.doc) == "abcd"
+        assert compile_getter("cluster.name")(self.doc) == "mycluster"
+        assert compile_getter("cluster.hosts.0.progress.current_stage")(self.doc) == "Done"
+        assert compile_getter("cluster.hosts.5.id")(self.doc) is None
+        assert compile_getter("cluster.hosts.id")(self.doc) is None
+        assert compile_getter("cluster.name.first")(self.doc) is None
+        assert compile_getter("this.key.is.undefined")(self.doc, "default") == "default"
+        assert compile_getter("")(self.doc) is None
+
+    def test_paths_are_compiled_once(self):
+        assert compile_getter("cluster.name") is compile_getter("cluster.name")
+
+    def test_delete(self):
+        compile_deleter("cluster.name")(self.doc)
+        compile_deleter("cluster.hosts.0.progress")(self.doc)
+        compile_deleter("cluster.hosts.*.connectivity")(self.doc)
+        compile_deleter("this.key.is.undefined")(self.doc)
+        assert self.doc == {"id": "abcd", "cluster": {"hosts": [{"id": "1"}, {"id": "2"}, {"id": "3"}]}}
+
+        compile_deleter("cluster.hosts.1")(self.doc)
+        assert self.doc["cluster"]["hosts"] == [{"id": "1"}, {"id": "3"}]
+        compile_deleter("cluster.*")(self.doc)
+        assert self.doc == {"id": "abcd", "cluster": {}}
+
+    def test_delete_traversing_lists(self):
+        compile_deleter("cluster.hosts.connectivity")(self.doc)
+        assert compile_getter("cluster.hosts.0.connectivity")(self.doc) == "foo"
+
+        compile_deleter("cluster.hosts.connectivity", traverse_lists=True)(self.doc)
+        assert [host.get("connectivity") for host in self.doc["cluster"]["hosts"]] == [None, None, None]
@@ -0,0 +1,44 @@
+import threading
+from workers.pipeline import Pipeline, Stage
+
+
+class TestPipeline:
+    def setup(self):
+        self.lock = threading.Lock()
+        self.stored = []
+
+    def store(self, item):
+        with self.lock:
+            self.stored.append(item)
+
+    def test_run(self):
+        pipeline = Pipeline([
+            Stage("double", lambda x: x * 2, 3),
+            Stage("drop_odd_tens", lambda x: None if (x // 10) % 2 else x, 2),
+            Stage("store", self.store, 1),
+        ], queue_size=2)
+        pipeline.run(range(100))
+
+        assert sorted(self.stored) == [x * 2 for x in range(100) if ((x * 2) // 10) % 2 == 0]
+
+    def test_errors_drop_item(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("three")
+            return x
+
+        pipeline = Pipeline([Stage("fail", fail_on_three, 2), Stage("store", self.store, 1)], queue_size=1)
+        pipeline.run(range(5))
+
+        assert sorted(self.stored) == [0, 1, 2, 4]
+
+    def test_stop(self):
+        pipeline = Pipeline([Stage("store", self.store, 1)], queue_size=1)
+
+        def stop_on_two(x):
+            if x == 2:
+                pipeline.stop()
+            return x
+
+        pipeline.run(stop_on_two(x) for x in range(100))
+        assert len(self.stored) <= 3
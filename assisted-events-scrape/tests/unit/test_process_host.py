@@ -1,4 +1,8 @@
-from process import get_hosts_summary, reshape_host
+from unittest.mock import patch
+from process import get_hosts_summary, get_host_inventory, reshape_host
+from process.host import json_loads
+from storage.process import GetProcessedMetadataJson
+from events_scrape.assisted_service_api import get_host_macs
 
 
 class TestHostProcess:
@@ -139,6 +143,29 @@ class TestHostProcess:
         assert "host_inventory" in host
         assert host["host_inventory"] == ""
 
+    def test_inventory_is_parsed_once(self):
+        host = get_host_with_inventory()
+        with patch("process.host.json_loads", wraps=json_loads) as parse:
+            assert get_host_inventory(host)["bmc_address"] == "0.0.0.0"
+            parse.reset_mock()
+
+            reshape_host(host)
+            metadata = GetProcessedMetadataJson({"cluster": {"hosts": [host]}}).get_processed_json()
+            assert get_host_macs(host) == ["02:00:00:70:99:71", "02:00:00:bb:18:d9"]
+            assert parse.call_count == 1
+
+        assert metadata["cluster"]["hosts"][0]["vendor"] == {
+            "manufacturer": "Red Hat", "product_name": "KVM", "virtual": True
+        }
+
+    def test_vendor_is_set_on_every_host(self):
+        hosts = [get_host(inventory=None), get_host(inventory=""), get_host_with_inventory()]
+        for host in hosts:
+            reshape_host(host)
+        GetProcessedMetadataJson({"cluster": {"hosts": hosts}})
+        assert ["vendor" in host for host in hosts] == [False, False, True]
+        assert get_host_macs(hosts[0]) == []
+
 
 def assert_is_multiarch(summary):
     assert "heterogeneous_arch" in summary
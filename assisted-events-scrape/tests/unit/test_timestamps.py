@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from dateutil.parser import parse, ParserError
+from utils import get_timestamp_day, get_timestamp_micros, parse_timestamp
+
+TIMESTAMPS = [
+    "2022-01-02T03:04:05Z",
+    "2022-01-02T03:04:05.678Z",
+    "2022-01-02T03:04:05.123456789Z",
+    "2022-12-31T23:59:59.999999+00:00",
+    "2022-01-02T03:04:05+02:00",
+    "2022-01-02T03:04:05.1-0530",
+    "2022-01-02 23:59:59",
+    "2022-01-02T03:04",
+    "2022-01-02",
+    "1969-12-31T23:59:59.5Z",
+    "Wed Jan 02 00:00:01 GMT 2022",
+    "2022-01-02T03:04:05 +0000",
+]
+
+
+class TestTimestamps:
+    @pytest.mark.parametrize("value", TIMESTAMPS)
+    def test_same_as_dateutil(self, value):
+        expected = parse(value).replace(tzinfo=timezone.utc)
+
+        assert parse_timestamp(value) == expected
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        assert get_timestamp_micros(value) == (expected - epoch) // timedelta(microseconds=1)
+        assert get_timestamp_day(value) == expected.strftime("%Y-%m-%d")
+
+    def test_ordering(self):
+        ordered = sorted(TIMESTAMPS, key=lambda value: parse(value).replace(tzinfo=timezone.utc))
+        assert sorted(TIMESTAMPS, key=get_timestamp_micros) == ordered
+
+    @pytest.mark.parametrize("value", ["2022-02-30T00:00:00Z", "2022-01-02T24:00:00Z", "not a date"])
+    def test_invalid(self, value):
+        for fn in [parse_timestamp, get_timestamp_micros, get_timestamp_day]:
+            with pytest.raises(ParserError):
+                fn(value)
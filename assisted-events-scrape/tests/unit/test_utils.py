@@ -1,5 +1,6 @@
 from datetime import datetime
-from utils import ErrorCounter, Changes, get_dict_hash
+import pytest
+from utils import ErrorCounter, Changes, get_dict_hash, set_hash_algorithm, without_paths
 
 
 class TestUtils:
@@ -96,3 +97,44 @@ class TestUtils:
         hash_A = get_dict_hash(cluster_A, ignore_fields=ignore_fields)
         hash_C = get_dict_hash(cluster_C, ignore_fields=ignore_fields)
         assert hash_A == hash_C
+
+    def test_dict_hash_is_stable(self):
+        # hashes are document IDs: they must not change across releases
+        doc = {"b": [1, "two", None], "a": {"d": 1.5, "c": True}, "é": "ü"}
+        assert get_dict_hash(doc) == "6f7e2cbde0a06e4b13af781b463d6b5dd1f188e3009ce29bac2e100c7daf9fc5"
+        assert get_dict_hash(doc, ["é", "b"]) == get_dict_hash({"a": {"d": 1.5, "c": True}})
+
+    def test_hash_algorithm(self):
+        doc = {"a": 1}
+        sha256_hash = get_dict_hash(doc)
+        try:
+            set_hash_algorithm("blake2b")
+            assert get_dict_hash(doc) != sha256_hash
+            assert len(get_dict_hash(doc)) == 64
+        finally:
+            set_hash_algorithm("sha256")
+        assert get_dict_hash(doc) == sha256_hash
+
+        with pytest.raises(ValueError):
+            set_hash_algorithm("crc32")
+
+    def test_without_paths(self):
+        doc = {
+            "id": "abcd",
+            "updated_at": "2022-01-01",
+            "hosts": [{"id": "1", "checked_in_at": "x", "progress": {"a": 1}}, {"id": "2"}],
+            "nested": {"a": {"b": 1, "c": 2}},
+        }
+        pruned = without_paths(doc, ["updated_at", "hosts.*.checked_in_at", "nested.a.b", "missing.path"])
+        assert pruned == {
+            "id": "abcd",
+            "hosts": [{"id": "1", "progress": {"a": 1}}, {"id": "2"}],
+            "nested": {"a": {"c": 2}},
+        }
+        # doc is not modified, what is not pruned is shared
+        assert doc["updated_at"] == "2022-01-01"
+        assert doc["hosts"][0]["checked_in_at"] == "x"
+        assert pruned["hosts"][0]["progress"] is doc["hosts"][0]["progress"]
+        assert pruned["hosts"][1] is doc["hosts"][1]
+        assert without_paths(doc, ["missing"]) is doc
+        assert without_paths(doc, ["hosts.1", "hosts.0.id"])["hosts"] == [{"checked_in_at": "x", "progress": {"a": 1}}]
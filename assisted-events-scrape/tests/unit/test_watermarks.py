@@ -0,0 +1,45 @@
+from utils import ClusterWatermarks, get_cluster_watermark
+
+
+class TestClusterWatermarks:
+    def setup(self):
+        self._watermarks = ClusterWatermarks()
+
+    def test_get_changed(self):
+        clusters = [
+            {"id": "A", "updated_at": "2022-01-01T00:00:00.000Z"},
+            {"id": "B", "updated_at": "2022-01-01T00:00:00.000Z"},
+            {"id": "C"},
+        ]
+        assert self._watermarks.get_changed(clusters) == clusters
+
+        for cluster in clusters:
+            self._watermarks.set_processed(cluster["id"], get_cluster_watermark(cluster))
+
+        # cluster without updated_at is always considered changed
+        assert self._watermarks.get_changed(clusters) == [clusters[2]]
+
+        clusters[0]["updated_at"] = "2022-01-02T00:00:00.000Z"
+        assert self._watermarks.get_changed(clusters) == [clusters[0], clusters[2]]
+
+    def test_hosts_change_watermark(self):
+        cluster = {
+            "id": "A",
+            "updated_at": "2022-01-01T00:00:00.000Z",
+            "hosts": [{"id": "1", "updated_at": "2022-01-01T00:00:00.000Z"}]
+        }
+        self._watermarks.set_processed(cluster["id"], get_cluster_watermark(cluster))
+        assert self._watermarks.get_changed([cluster]) == []
+
+        cluster["hosts"][0]["updated_at"] = "2022-01-03T00:00:00.000Z"
+        assert self._watermarks.get_changed([cluster]) == [cluster]
+
+    def test_prune(self):
+        self._watermarks.set_processed("A", "foo")
+        self._watermarks.set_processed("B", "bar")
+        self._watermarks.set_processed("C", None)
+        assert self._watermarks.size() == 2
+
+        self._watermarks.prune(["B"])
+        assert self._watermarks.size() == 1
+        assert self._watermarks.get_changed([{"id": "A", "updated_at": "foo"}]) == [{"id": "A", "updated_at": "foo"}]
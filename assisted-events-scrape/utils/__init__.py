@@ -1,8 +1,20 @@
 from .logger import log
-from .counters import ErrorCounter, Changes
-from .hash import get_dict_hash
+from .counters import ErrorCounter, Changes, BulkStats
+from .hash import get_dict_hash, set_hash_algorithm
+from .json_codec import json_loads, json_dumps, set_json_codec, get_json_codec_name
+from .paths import compile_getter, compile_deleter, without_paths
 from .events import get_event_id
-from .env import get_env
+from .env import get_env, get_bool_env
 from .anonymizer import Anonymizer
+from .watermarks import ClusterWatermarks, get_cluster_watermark
+from .pending_writes import PendingWrites
+from .cache import LRUCache
+from .merge import merge_parallel
+from .timestamps import parse_timestamp, get_timestamp_micros, get_timestamp_day
 
-__all__ = ["Anonymizer", "Changes", "ErrorCounter", "log", "get_dict_hash", "get_event_id", "get_env"]
+__all__ = ["Anonymizer", "BulkStats", "Changes", "ClusterWatermarks", "ErrorCounter", "LRUCache", "PendingWrites",
+           "log",
+           "get_dict_hash", "get_event_id", "get_env", "get_bool_env", "get_cluster_watermark", "set_hash_algorithm",
+           "compile_getter", "compile_deleter", "without_paths",
+           "json_loads", "json_dumps", "set_json_codec", "get_json_codec_name", "merge_parallel",
+           "parse_timestamp", "get_timestamp_micros", "get_timestamp_day"]
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe cache, bounded in size and in entries age: least recently used entries are evicted
+    first, and entries older than `ttl_seconds` are treated as missing.
+    A `None` value is a negative entry: a key known not to exist, which is not loaded again until it expires
+    or is discarded with `discard_missing`.
+    """
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.lock = threading.Lock()
+        self._max_size = max(1, max_size)
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._stats = _new_stats()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            found, value = self._get(key)
+            return value if found else default
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            found, _ = self._get(key, count=False)
+            return found
+
+    def get_or_load(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        """
+        Returns the cached value for key, calling `loader` on a miss. Concurrent misses on the same key
+        wait for the first one, so `loader` is called once. Exceptions from `loader` are not cached.
+        """
+        count = True
+        while True:
+            with self.lock:
+                found, value = self._get(key, count=count)
+                if found:
+                    return value
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # The other thread either stores the value or fails: look it up again, without counting twice
+            count = False
+            loading.wait()
+        try:
+            value = loader(key)
+            self.put(key, value)
+            return value
+        finally:
+            with self.lock:
+                del self._loading[key]
+            loading.set()
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self._put(key, value)
+
+    def put_many(self, values: Dict[Hashable, Any]) -> None:
+        with self.lock:
+            for key, value in values.items():
+                self._put(key, value)
+
+    def values(self) -> List[Any]:
+        """Values of entries that did not expire, negative entries excluded"""
+        with self.lock:
+            now = self._clock()
+            return [value for value, expires_at in self._entries.values() if value is not None and expires_at > now]
+
+    def discard_missing(self) -> None:
+        """Drops negative entries, so missing keys are loaded again"""
+        with self.lock:
+            for key in [key for key, (value, _) in self._entries.items() if value is None]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def reset_stats(self) -> Dict[str, int]:
+        """Returns current stats and starts counting from scratch"""
+        with self.lock:
+            stats = dict(self._stats, size=len(self._entries))
+            self._stats = _new_stats()
+            return stats
+
+    def _get(self, key: Hashable, count: bool = True) -> tuple:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= self._clock():
+            del self._entries[key]
+            self._stats["expired"] += 1
+            entry = None
+        if entry is None:
+            if count:
+                self._stats["misses"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        if count:
+            self._stats["hits"] += 1
+        return True, entry[0]
+
+    def _put(self, key: Hashable, value: Optional[Any]) -> None:
+        self._entries[key] = (value, self._clock() + self._ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
+def _new_stats() -> Dict[str, int]:
+    return {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
@@ -1,4 +1,5 @@
 import threading
+from typing import Dict
 from datetime import datetime, timedelta
 
 
@@ -36,3 +37,28 @@ class Changes:
             if self.last_update is None:
                 return False
             return self.last_update + timedelta(minutes=minutes) > datetime.now()
+
+
+class BulkStats:
+    """Counts, per index, documents inserted, rejected as duplicates and failed while bulk indexing"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = {}
+
+    def add(self, index: str, inserted: int = 0, duplicates: int = 0, errors: int = 0) -> None:
+        with self.lock:
+            stats = self.value.setdefault(index, {"inserted": 0, "duplicates": 0, "errors": 0})
+            stats["inserted"] += inserted
+            stats["duplicates"] += duplicates
+            stats["errors"] += errors
+
+    def get(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            return {index: dict(stats) for index, stats in self.value.items()}
+
+    def reset(self) -> Dict[str, Dict[str, int]]:
+        """Returns current stats and starts counting from scratch"""
+        with self.lock:
+            stats = self.value
+            self.value = {}
+            return stats
@@ -1,5 +1,7 @@
 import os
 
+TRUE_VALUES = ["true", "1", "yes", "on"]
+
 
 def get_env(key, mandatory=False, default=None):
     res = os.environ.get(key, default)
@@ -12,3 +14,7 @@ def get_env(key, mandatory=False, default=None):
         raise ValueError(f'Mandatory environment variable is missing: {key}')
 
     return res
+
+
+def get_bool_env(key, default="false") -> bool:
+    return get_env(key, default=default).lower() in TRUE_VALUES
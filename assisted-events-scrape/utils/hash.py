@@ -1,14 +1,48 @@
 import hashlib
 import json
-import copy
-from typing import Iterable
+from typing import Any, Callable, Dict, Iterable
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+HASH_ALGORITHM_SHA256 = "sha256"
+HASH_ALGORITHM_BLAKE2B = "blake2b"
+HASH_ALGORITHM_XXH3 = "xxh3_128"
+DEFAULT_HASH_ALGORITHM = HASH_ALGORITHM_SHA256
+
+# Same output as json.dumps(d, default=str, sort_keys=True), without building an encoder on each call.
+# Documents are JSON trees, so there is no need to check for circular references
+_ENCODER = json.JSONEncoder(default=str, sort_keys=True, check_circular=False)
+
+_HASHERS: Dict[str, Callable[[], Any]] = {
+    HASH_ALGORITHM_SHA256: hashlib.sha256,
+    HASH_ALGORITHM_BLAKE2B: lambda: hashlib.blake2b(digest_size=32),
+}
+if xxhash is not None:
+    _HASHERS[HASH_ALGORITHM_XXH3] = xxhash.xxh3_128
+
+_hasher = _HASHERS[DEFAULT_HASH_ALGORITHM]
+
+
+def set_hash_algorithm(algorithm: str) -> None:
+    """
+    Sets the digest used by `get_dict_hash`. Hashes are used as document IDs: changing the algorithm
+    means documents already stored are not recognized anymore.
+    """
+    global _hasher  # pylint: disable=global-statement
+    if algorithm not in _HASHERS:
+        raise ValueError(f"Unsupported hash algorithm {algorithm}, supported: {', '.join(sorted(_HASHERS))}")
+    _hasher = _HASHERS[algorithm]
 
 
 def get_dict_hash(d: dict, ignore_fields: Iterable[str] = None) -> str:
-    to_hash = copy.deepcopy(d)
+    """
+    Hashes the canonical JSON form of d. Ignored top level fields are skipped without copying d.
+    """
     if ignore_fields:
-        for field in ignore_fields:
-            if field in to_hash:
-                del to_hash[field]
-    hashed_str = json.dumps(to_hash, default=str, sort_keys=True).encode('utf-8')
-    return hashlib.sha256(hashed_str).hexdigest()
+        d = {key: value for key, value in d.items() if key not in ignore_fields}
+    hasher = _hasher()
+    hasher.update(_ENCODER.encode(d).encode('utf-8'))
+    return hasher.hexdigest()
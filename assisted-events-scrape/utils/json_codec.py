@@ -0,0 +1,76 @@
+import json
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSON_CODEC_STDLIB = "stdlib"
+JSON_CODEC_ORJSON = "orjson"
+
+
+class StdlibJSONCodec:
+    """
+    Output is compact and non-ASCII characters are not escaped, as with orjson, so documents do not depend on
+    the codec
+    """
+    name = JSON_CODEC_STDLIB
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None, sort_keys: bool = False) -> str:
+        return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":"))
+
+
+class OrjsonJSONCodec:
+    """
+    Dates and dataclasses go through `default`, as with the standard library, and what orjson cannot encode
+    (e.g. non string keys, integers over 64 bits) is encoded by the standard library.
+    """
+    name = JSON_CODEC_ORJSON
+
+    @staticmethod
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None, sort_keys: bool = False) -> str:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return StdlibJSONCodec.dumps(obj, default=default, sort_keys=sort_keys)
+
+
+_CODECS = {StdlibJSONCodec.name: StdlibJSONCodec}
+if orjson is not None:
+    _CODECS[OrjsonJSONCodec.name] = OrjsonJSONCodec
+
+_codec = _CODECS.get(JSON_CODEC_ORJSON, StdlibJSONCodec)
+
+
+def set_json_codec(name: str) -> None:
+    """Sets the codec used by `json_loads` and `json_dumps`. Defaults to orjson when installed"""
+    global _codec  # pylint: disable=global-statement
+    if name not in _CODECS:
+        raise ValueError(f"Unsupported JSON codec {name}, supported: {', '.join(sorted(_CODECS))}")
+    _codec = _CODECS[name]
+
+
+def get_json_codec_name() -> str:
+    return _codec.name
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """Invalid documents raise `json.JSONDecodeError` with both codecs"""
+    return _codec.loads(data)
+
+
+def json_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None, sort_keys: bool = False) -> str:
+    return _codec.dumps(obj, default=default, sort_keys=sort_keys)
@@ -0,0 +1,80 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple
+
+# How long producers wait for room in the queue before checking whether the consumer stopped
+PUT_TIMEOUT_SECONDS = 0.1
+
+_DONE = object()
+
+
+class _Failure(NamedTuple):
+    error: BaseException
+
+
+def merge_parallel(sources: List[Callable[[], Iterable[Any]]], workers: int, queue_size: int) -> Iterator[Any]:
+    """
+    Yields the items of all sources, iterating up to `workers` sources at a time, each one in its own thread.
+    Items are handed over through a queue of `queue_size` items, so producers wait when the consumer is slower.
+    Items of a source are yielded in order, items of different sources are interleaved.
+    The first error raised by a source is raised to the consumer, and remaining sources are not iterated.
+    """
+    pending = queue.SimpleQueue()
+    for source in sources:
+        pending.put(source)
+    items = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=PUT_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            while not stopped.is_set():
+                try:
+                    source = pending.get_nowait()
+                except queue.Empty:
+                    return
+                _produce_source(source, put)
+        except Exception as e:
+            put(_Failure(e))
+        finally:
+            put(_DONE)
+
+    threads = [threading.Thread(target=produce, name=f"merge-{n}", daemon=True)
+               for n in range(max(1, min(workers, len(sources))))]
+    for thread in threads:
+        thread.start()
+    running = len(threads)
+    try:
+        while running > 0:
+            item = items.get()
+            if item is _DONE:
+                running -= 1
+            elif isinstance(item, _Failure):
+                raise item.error
+            else:
+                yield item
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+
+def _produce_source(source: Callable[[], Iterable[Any]], put: Callable[[Any], bool]) -> None:
+    iterator = iter(source())
+    try:
+        for item in iterator:
+            if not put(item):
+                return
+    finally:
+        # Lets generators release what they hold, e.g. scroll contexts
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,151 @@
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+PATH_SEPARATOR = "."
+PATH_WILDCARD = "*"
+
+# A parsed path segment: the key for dicts, and the index for lists when the key is a number
+Segment = Tuple[str, Optional[int]]
+
+
+@lru_cache(maxsize=256)
+def compile_getter(path: str) -> Callable[..., Any]:
+    """
+    Parses a dotted path such as `cluster.hosts.0.id` once, and returns a function retrieving it from documents.
+    The function returns `default` (None unless given) when the path is not found.
+    """
+    segments = _parse_path(path)
+
+    def get(doc: Any, default: Any = None) -> Any:
+        value = doc
+        for key, index in segments:
+            if isinstance(value, dict):
+                if key not in value:
+                    return default
+                value = value[key]
+            elif isinstance(value, list) and index is not None and index < len(value):
+                value = value[index]
+            else:
+                return default
+        return value
+
+    return get
+
+
+@lru_cache(maxsize=256)
+def compile_deleter(path: str, traverse_lists: bool = False) -> Callable[[Any], None]:
+    """
+    Parses a dotted path once, and returns a function deleting it from documents in place, when found.
+    `*` matches any key of a dict or any item of a list, numbers match list indices.
+    With `traverse_lists`, other segments are applied to every item of lists, i.e. `cluster.hosts.connectivity`
+    deletes `connectivity` from all the hosts.
+    """
+    segments = _parse_path(path)
+    last = len(segments) - 1
+
+    def delete(node: Any, position: int = 0) -> None:
+        key, index = segments[position]
+        if isinstance(node, dict) and key != PATH_WILDCARD:
+            # most common case, no need to build a list of targets
+            if key in node:
+                if position < last:
+                    delete(node[key], position + 1)
+                else:
+                    del node[key]
+            return
+        if traverse_lists and isinstance(node, list) and key != PATH_WILDCARD and index is None:
+            for item in node:
+                delete(item, position)
+            return
+        targets = _get_targets(node, key, index)
+        if position < last:
+            for target in targets:
+                delete(node[target], position + 1)
+            return
+        # delete list items from the end, so that remaining indices are still valid
+        for target in reversed(targets):
+            del node[target]
+
+    return delete
+
+
+def _get_targets(node: Any, key: str, index: Optional[int]) -> list:
+    if isinstance(node, dict):
+        # literal keys are handled by the caller
+        return list(node)
+    if isinstance(node, list):
+        if key == PATH_WILDCARD:
+            return list(range(len(node)))
+        if index is not None and index < len(node):
+            return [index]
+    return []
+
+
+def without_paths(doc: Any, paths: Iterable[str]) -> Any:
+    """
+    Returns doc without the given dotted paths, with the same matching rules as `compile_deleter`
+    (without `traverse_lists`). Only dicts and lists on the way to removed fields are copied:
+    the rest is shared with doc, which is left untouched.
+    """
+    return _prune(doc, _get_paths_tree(tuple(paths)))
+
+
+def _parse_path(path: str) -> Tuple[Segment, ...]:
+    return tuple((key, int(key) if key.isdigit() else None) for key in path.split(PATH_SEPARATOR))
+
+
+@lru_cache(maxsize=64)
+def _get_paths_tree(paths: Tuple[str, ...]) -> dict:
+    """
+    Parses paths once into a tree of segments, where None marks the end of a path:
+    ["a.b", "a.c"] becomes {"a": {"b": {None: {}}, "c": {None: {}}}}
+    """
+    tree = {}
+    for path in paths:
+        node = tree
+        for segment in path.split(PATH_SEPARATOR):
+            node = node.setdefault(segment, {})
+        node[None] = {}
+    return tree
+
+
+def _prune(doc: Any, tree: dict) -> Any:
+    if isinstance(doc, dict):
+        items = doc.items()
+    elif isinstance(doc, list):
+        items = enumerate(doc)
+    else:
+        return doc
+
+    pruned = {}
+    changed = False
+    for key, value in items:
+        subtree = _get_subtree(tree, key)
+        if subtree is None:
+            pruned[key] = value
+        elif None in subtree:
+            changed = True
+        else:
+            pruned_value = _prune(value, subtree)
+            changed = changed or pruned_value is not value
+            pruned[key] = pruned_value
+    if not changed:
+        return doc
+    if isinstance(doc, list):
+        return list(pruned.values())
+    return pruned
+
+
+def _get_subtree(tree: dict, key: Any) -> dict:
+    exact = tree.get(str(key))
+    wildcard = tree.get(PATH_WILDCARD)
+    if exact is None or wildcard is None:
+        return exact if exact is not None else wildcard
+    return _merge_trees(wildcard, exact)
+
+
+def _merge_trees(left: dict, right: dict) -> dict:
+    merged = dict(left)
+    for segment, subtree in right.items():
+        merged[segment] = _merge_trees(merged[segment], subtree) if segment in merged else subtree
+    return merged
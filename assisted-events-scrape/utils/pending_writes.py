@@ -0,0 +1,36 @@
+import threading
+from typing import Callable, Optional
+
+
+class PendingWrites:
+    """
+    Calls `on_done` once writes are all confirmed. Each write is tracked by `add`, which returns the callback
+    to call once it is confirmed, possibly later on and from another thread, e.g. when a batch is stored.
+    `done` is called once all writes were added. Writes that are never confirmed keep `on_done` from being called
+    """
+    def __init__(self, on_done: Callable[[], None]):
+        self._lock = threading.Lock()
+        self._on_done = on_done
+        # until `done` is called
+        self._pending = 1
+
+    def add(self, on_stored: Optional[Callable[[], None]] = None) -> Callable[[], None]:
+        """`on_stored`, if any, is called first when the write is confirmed"""
+        with self._lock:
+            self._pending += 1
+
+        def _stored():
+            if on_stored is not None:
+                on_stored()
+            self._release()
+        return _stored
+
+    def done(self) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+            finished = self._pending == 0
+        if finished:
+            self._on_done()
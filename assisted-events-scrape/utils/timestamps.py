@@ -0,0 +1,64 @@
+import re
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from dateutil.parser import parse
+
+# Timestamps as emitted by assisted-service, e.g. 2022-01-02T03:04:05.678Z. Other forms are parsed by dateutil
+_ISO_TIMESTAMP = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6})\d*)?)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?"
+)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Same as `dateutil.parser.parse(value).replace(tzinfo=timezone.utc)`: the time zone, if any, is dropped and
+    the time is read as UTC
+    """
+    fields = _match(value)
+    if fields is None:
+        return parse(value).replace(tzinfo=timezone.utc)
+    return datetime(*fields, tzinfo=timezone.utc)
+
+
+def get_timestamp_micros(value: str) -> int:
+    """Microseconds since epoch of `parse_timestamp(value)`, to compare timestamps as integers"""
+    fields = _match(value)
+    if fields is None:
+        parsed = parse_timestamp(value)
+        fields = (parsed.year, parsed.month, parsed.day, parsed.hour, parsed.minute, parsed.second,
+                  parsed.microsecond)
+    year, month, day, hour, minute, second, microsecond = fields
+    days = _get_day_ordinal(year, month, day) - _EPOCH_ORDINAL
+    return days * _MICROSECONDS_PER_DAY + ((hour * 60 + minute) * 60 + second) * 10 ** 6 + microsecond
+
+
+def get_timestamp_day(value: str) -> str:
+    """Day of `parse_timestamp(value)` as YYYY-MM-DD"""
+    if _match(value) is not None:
+        return value[:10]
+    return parse_timestamp(value).strftime("%Y-%m-%d")
+
+
+def _match(value: str):
+    match = _ISO_TIMESTAMP.fullmatch(value)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction = match.groups()
+    hour, minute, second = int(hour or 0), int(minute or 0), int(second or 0)
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    try:
+        _get_day_ordinal(int(year), int(month), int(day))
+    except ValueError:
+        # Not a date: left to dateutil, which raises
+        return None
+    microsecond = int(fraction.ljust(6, "0")) if fraction else 0
+    return int(year), int(month), int(day), hour, minute, second, microsecond
+
+
+@lru_cache(maxsize=1024)
+def _get_day_ordinal(year: int, month: int, day: int) -> int:
+    # Exported documents span a few days: checking dates and counting days is done once per day
+    return date(year, month, day).toordinal()
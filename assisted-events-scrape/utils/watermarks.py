@@ -0,0 +1,66 @@
+import threading
+from typing import Dict, Iterable, List, Optional
+
+
+class ClusterWatermarks:
+    """
+    Keeps track of the last processed state of each cluster, so that clusters
+    that did not change since last time they were processed can be skipped.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._watermarks = {}
+
+    def get_changed(self, clusters: Iterable[dict]) -> List[dict]:
+        changed = []
+        with self.lock:
+            for cluster in clusters:
+                watermark = get_cluster_watermark(cluster)
+                if watermark is None or self._watermarks.get(cluster["id"]) != watermark:
+                    changed.append(cluster)
+        return changed
+
+    def set_processed(self, cluster_id: str, watermark: Optional[str]) -> None:
+        if watermark is None:
+            return
+        with self.lock:
+            self._watermarks[cluster_id] = watermark
+
+    def restore(self, watermarks: Dict[str, str]) -> None:
+        with self.lock:
+            self._watermarks.update(watermarks)
+
+    def get_all(self) -> Dict[str, str]:
+        with self.lock:
+            return dict(self._watermarks)
+
+    def prune(self, cluster_ids: Iterable[str]) -> None:
+        """Forget clusters that are not in the given list, i.e. deleted clusters"""
+        keep = set(cluster_ids)
+        with self.lock:
+            for cluster_id in list(self._watermarks):
+                if cluster_id not in keep:
+                    del self._watermarks[cluster_id]
+
+    def size(self) -> int:
+        with self.lock:
+            return len(self._watermarks)
+
+
+def get_cluster_watermark(cluster: dict) -> Optional[str]:
+    """
+    Returns a string that changes whenever the cluster is updated.
+    Hosts are taken into account when they are part of the cluster listing, as
+    host updates do not always bump cluster's `updated_at`.
+    When no `updated_at` is available, returns None: cluster should always be processed.
+    """
+    updated_at = cluster.get("updated_at")
+    if not updated_at:
+        return None
+    watermark = [str(updated_at), str(cluster.get("status_updated_at", ""))]
+    hosts = cluster.get("hosts") or []
+    hosts_updated_at = [str(host.get("updated_at", "")) for host in hosts if host]
+    if hosts_updated_at:
+        watermark.append(max(hosts_updated_at))
+    watermark.append(str(len(hosts)))
+    return "|".join(watermark)
@@ -1,3 +1,4 @@
 from .cluster_events_worker import ClusterEventsWorker, ClusterEventsWorkerConfig
+from .async_cluster_events_worker import AsyncClusterEventsWorker
 
-__all__ = ["ClusterEventsWorker", "ClusterEventsWorkerConfig"]
+__all__ = ["ClusterEventsWorker", "ClusterEventsWorkerConfig", "AsyncClusterEventsWorker"]
@@ -0,0 +1,210 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, Dict, List
+from utils import Anonymizer, log, get_cluster_watermark
+from storage import AsyncClusterEventsStorage, AsyncElasticsearchStorage, DocumentsNotStoredException
+from events_scrape import AsyncInventoryClient
+from assisted_service_client.rest import ApiException
+import aiohttp
+
+from .cluster_events_worker import BaseClusterEventsWorker, ClusterEventsWorkerConfig, EVENT_CATEGORIES, \
+    anonymize_infra_env, check_cluster_hosts, get_hosts_infra_env_ids, handle_4XX_error
+
+DEFAULT_MAX_IN_FLIGHT = 200
+_NOT_CACHED = object()
+RETRY_TRIES = 3
+RETRY_DELAY = 1
+RETRY_BACKOFF = 2
+RETRY_MAX_DELAY = 4
+# Up to this many seconds are added to each delay, so that clusters failing together are not retried together
+RETRY_JITTER = 1
+# Server errors, and connection errors or timeouts of the aiohttp client
+RETRIED_EXCEPTIONS = (ApiException, aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class AsyncClusterEventsWorker(BaseClusterEventsWorker):
+    """
+    Processes clusters like `ClusterEventsWorker`, but with asyncio instead of threads: all I/O
+    towards assisted-service and Elasticsearch is non-blocking, and up to `max_in_flight` clusters
+    are processed concurrently.
+    The same event loop is kept across passes, so connection pools can be reused.
+    """
+    def __init__(self, config: ClusterEventsWorkerConfig, ai_client: AsyncInventoryClient,
+                 cluster_events_storage: AsyncClusterEventsStorage, es_store: AsyncElasticsearchStorage,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        super().__init__(config)
+        self._ai_client = ai_client
+        self.cluster_events_storage = cluster_events_storage
+        self._es_store = es_store
+        self._max_in_flight = max_in_flight
+        self._loop = asyncio.new_event_loop()
+        self._shutdown = False
+        self._versions_lock = None
+
+    def process_clusters(self, clusters: List[dict]) -> None:
+        self._loop.run_until_complete(self.async_process_clusters(clusters))
+
+    async def async_process_clusters(self, clusters: List[dict]) -> None:
+        self._start_pass()
+        self._versions_lock = asyncio.Lock()
+        infra_envs = await self._ai_client.infra_envs_list()
+        self._cache_infra_envs(infra_envs)
+        try:
+            await self.cluster_events_storage.prefetch_event_counts([cluster["id"] for cluster in clusters])
+        except Exception as e:
+            # counts will be retrieved per cluster
+            self._handle_unexpected_error(e, "Error while prefetching clusters event count")
+
+        semaphore = asyncio.Semaphore(self._max_in_flight)
+
+        async def _store_with_limit(cluster):
+            async with semaphore:
+                if self._shutdown:
+                    return
+                await self.store_events_for_cluster(cluster)
+
+        log.info(f"Sent {len(clusters)} clusters for processing...")
+        await asyncio.gather(*[_store_with_limit(cluster) for cluster in clusters])
+        await self._store_pass_changes(infra_envs)
+        self._end_pass()
+
+    async def store_events_for_cluster(self, cluster: dict) -> None:
+        watermark = get_cluster_watermark(cluster)
+        try:
+            self._check_cluster(cluster)
+            Anonymizer.anonymize_cluster(cluster)
+            await self._enrich_cluster(cluster)
+            check_cluster_hosts(cluster)
+
+            events = await self.__get_events(cluster["id"])
+            component_versions = await self._get_component_versions()
+
+            hosts_infra_envs = await self._get_hosts_infraenvs(cluster["hosts"])
+
+            await self._store_normalized_events(cluster, events, hosts_infra_envs.values())
+            await self.cluster_events_storage.store(component_versions, cluster, events, hosts_infra_envs)
+            self._cluster_stored(cluster["id"], watermark)
+        except Exception as e:
+            self._cluster_failed(cluster["id"], watermark, e)
+
+    async def _get_component_versions(self) -> dict:
+        if self._versions_lock is None:
+            self._versions_lock = asyncio.Lock()
+        async with self._versions_lock:
+            if self._component_versions is None:
+                self._component_versions = await self.__get_versions()
+            return self._component_versions
+
+    async def _store_pass_changes(self, infra_envs: List[dict]) -> None:
+        for changes in self._get_pass_changes(infra_envs):
+            try:
+                await self._store_changes(**changes)
+            except Exception as e:
+                self._handle_unexpected_error(e, f'Error while storing {changes["index"]}')
+
+    async def __get_versions(self):
+        return await retry_request(lambda: handle_4XX_apiexception(
+            self._ai_client.get_versions,
+            message_404="Versions not found. This should never happen",
+            default_return_value=[]
+        ))
+
+    async def __get_events(self, cluster_id: str):
+        def _internal_get_events():
+            return self._ai_client.get_events(cluster_id, categories=EVENT_CATEGORIES)
+
+        return await retry_request(lambda: handle_4XX_apiexception(
+            _internal_get_events,
+            message_404=f"Events for cluster {cluster_id} not found",
+            default_return_value=[]
+        ))
+
+    async def __get_hosts(self, cluster_id: str):
+        # If a cluster is not found, then we consider to have 0 hosts. It was probably deleted
+        def _internal_get_hosts():
+            return self._ai_client.get_cluster_hosts(cluster_id=cluster_id)
+
+        return await retry_request(lambda: handle_4XX_apiexception(
+            _internal_get_hosts,
+            message_404=f"Cluster {cluster_id} not found while retrieving hosts",
+            default_return_value=[]
+        ))
+
+    async def __get_infra_env(self, infra_env_id: str):
+        async def _internal_get_infraenv():
+            infra_env = await self._ai_client.get_infra_env(infra_env_id=infra_env_id)
+            if infra_env:
+                return infra_env.to_dict()
+            return None
+
+        return await retry_request(lambda: handle_4XX_apiexception(
+            _internal_get_infraenv,
+            message_404=f"InfraEnv {infra_env_id} not found",
+            default_return_value=None
+        ))
+
+    async def _get_hosts_infraenvs(self, hosts: List[dict]) -> Dict[str, dict]:
+        hosts_infra_envs = {}
+        for infra_env_id in get_hosts_infra_env_ids(hosts):
+            infra_env = self._infra_envs.get(infra_env_id, _NOT_CACHED)
+            if infra_env is _NOT_CACHED:
+                infra_env = anonymize_infra_env(await self.__get_infra_env(infra_env_id))
+                self._infra_envs.put(infra_env_id, infra_env)
+            hosts_infra_envs[infra_env_id] = infra_env
+        return self._found_infra_envs(hosts_infra_envs)
+
+    async def _store_normalized_events(self, cluster, event_list, infra_envs):
+        """Errors are raised: the cluster is failed, so that it is processed again on next pass"""
+        for changes in self._get_normalized_changes(cluster, event_list, infra_envs):
+            await self._store_changes(**changes)
+
+    async def _store_changes(self, on_stored: Callable[[], None] = None, **changes) -> None:
+        if not await self._es_store.store_changes(**changes):
+            raise DocumentsNotStoredException(f"Documents were not all stored in {changes['index']}")
+        if on_stored is not None:
+            on_stored()
+
+    async def _enrich_cluster(self, cluster: dict):
+        if "hosts" not in cluster or len(cluster["hosts"]) == 0:
+            cluster["hosts"] = await self.__get_hosts(cluster["id"])
+        self._reshape_cluster(cluster)
+
+    def shutdown(self):
+        # Clusters that are not being processed yet will be skipped
+        self._shutdown = True
+
+    def close(self):
+        self._loop.run_until_complete(self._close())
+        self._loop.close()
+
+    async def _close(self):
+        await self._ai_client.close()
+        await self.cluster_events_storage.close()
+        await self._es_store.close()
+
+
+async def retry_request(f: Callable[[], Awaitable], tries=RETRY_TRIES, delay=RETRY_DELAY,
+                        backoff=RETRY_BACKOFF, max_delay=RETRY_MAX_DELAY, jitter=RETRY_JITTER):
+    """
+    Awaits `f()`, retrying with exponential backoff and random jitter on `RETRIED_EXCEPTIONS`. Same policy as the
+    `retry` decorator used by the threaded worker, but sleeping without blocking the event loop
+    """
+    for attempt in range(1, tries + 1):
+        try:
+            return await f()
+        except RETRIED_EXCEPTIONS as e:
+            if attempt == tries:
+                raise e
+            sleep = delay + random.uniform(0, jitter)
+            log.warning(f"{e!r}, retrying in {sleep:.1f} seconds...")
+            await asyncio.sleep(sleep)
+            delay = min(delay * backoff, max_delay)
+    return None
+
+
+async def handle_4XX_apiexception(f: Callable[[], Awaitable], message_404="", default_return_value=None):
+    try:
+        return await f()
+    except ApiException as e:
+        handle_4XX_error(e, message_404)
+    return default_return_value
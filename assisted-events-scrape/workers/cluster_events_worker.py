@@ -1,26 +1,27 @@
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
 from copy import deepcopy
+from functools import partial
 import queue
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import dpath.util
-from dpath.exceptions import PathNotFound
 from retry import retry
-from utils import ErrorCounter, Changes, log, get_event_id, get_dict_hash, Anonymizer
+from utils import ErrorCounter, Changes, ClusterWatermarks, LRUCache, PendingWrites, log, get_event_id, \
+    get_dict_hash, without_paths, Anonymizer, get_cluster_watermark
 from process import reshape_host
-from storage import ClusterEventsStorage, ElasticsearchStorage
+from storage import ClusterEventsStorage, ClusterStateStore, DocumentsBatch, DocumentsNotStoredException, \
+    ElasticsearchStorage
+from storage.cluster_events_storage import PreparedClusterEvents, prepare_cluster_events
 from events_scrape import InventoryClient
 from sentry_sdk import capture_exception
-from config import SentryConfig, EventStoreConfig
+from config import SentryConfig, EventStoreConfig, PipelineConfig, InfraEnvCacheConfig
 from assisted_service_client.rest import ApiException
+from .pipeline import Pipeline, Stage
 
 EVENT_CATEGORIES = ["user", "metrics"]
 MAX_HOSTS_COUNT = 50
-
-
-class ResourceNotFoundException(Exception):
-    pass
+INFRA_ENVS_SYNC_BATCH_SIZE = 1000
 
 
 class ClusterBlacklistedException(Exception):
@@ -38,61 +39,328 @@ class ClusterEventsWorkerConfig:
     error_counter: ErrorCounter
     changes: Changes
     events: EventStoreConfig
+    watermarks: Optional[ClusterWatermarks] = None
+    state_store: Optional[ClusterStateStore] = None
+    pipeline: Optional[PipelineConfig] = None
+    infra_env_cache: Optional[InfraEnvCacheConfig] = None
+
+
+class SerializedChanges(NamedTuple):
+    """Normalized documents of a cluster, serialized ahead of storing by `DocumentsBatch.serialize`"""
+    index: str
+    documents: Dict[str, str]
+    on_stored: Optional[Callable[[], None]]
+
+
+@dataclass
+class ClusterWork:
+    """
+    A cluster going through processing stages, with what was retrieved and computed for it so far
+    """
+    cluster: dict
+    watermark: Optional[str]
+    events: List[dict] = field(default_factory=list)
+    component_versions: dict = field(default_factory=dict)
+    hosts_infra_envs: dict = field(default_factory=dict)
+    prepared_events: Optional[PreparedClusterEvents] = None
+    serialized_documents: Optional[List[SerializedChanges]] = None
+
+
+class BaseClusterEventsWorker:
+    """
+    Processing steps shared by the threaded and the asyncio workers, that do not involve any I/O
+    """
+    def __init__(self, config: ClusterEventsWorkerConfig):
+        self._config = config
+        cache_config = config.infra_env_cache if config.infra_env_cache is not None else InfraEnvCacheConfig()
+        # Infra envs are anonymized once, when cached, then shared read-only by the clusters referencing them
+        self._infra_envs = LRUCache(cache_config.max_size, cache_config.ttl_seconds)
+        # Hashes of infra envs already sent to the store, so each version of an infra env is written once
+        self._stored_infra_envs = LRUCache(cache_config.max_size, cache_config.ttl_seconds)
+        self._state_store = config.state_store if config.state_store is not None else ClusterStateStore()
+        self._blacklisted_names = ["perf-test"]
+        # Component versions are retrieved once per pass, see `_start_pass`
+        self._component_versions = None
+
+    def _start_pass(self) -> None:
+        self._component_versions = None
+        # Infra envs not found during previous pass might have been created since
+        self._infra_envs.discard_missing()
+
+    def _end_pass(self) -> None:
+        log.info(f"Normalized events bulk stats: {self._es_store.stats.reset()}")
+        log.info(f"Infra envs cache stats: {self._infra_envs.reset_stats()}")
+
+    def close(self) -> None:
+        """Releases what is kept across passes, once done with processing"""
+
+    def _cache_infra_envs(self, infra_envs: List[dict]) -> None:
+        for infra_env in infra_envs:
+            Anonymizer.anonymize_infra_env(infra_env)
+        self._infra_envs.put_many({infra_env["id"]: infra_env for infra_env in infra_envs})
+
+    @staticmethod
+    def _found_infra_envs(infra_envs: Dict[str, Optional[dict]]) -> Dict[str, dict]:
+        """Missing infra envs are cached as None, so they are retrieved only once per pass"""
+        for infra_env_id, infra_env in infra_envs.items():
+            if infra_env is None:
+                log.error(f"InfraEnv not found: Infra env {infra_env_id} not found")
+        return {infra_env_id: infra_env for infra_env_id, infra_env in infra_envs.items() if infra_env is not None}
+
+    def _get_pass_changes(self, infra_envs: List[dict]) -> List[dict]:
+        """
+        Returns `store_changes` arguments for documents stored once per pass rather than once per cluster:
+        infra envs that changed, including those not referenced by any host, and component versions.
+        `infra_envs` are all the infra envs listed for the pass: the cache might not hold all of them.
+        """
+        changes = []
+        for i in range(0, len(infra_envs), INFRA_ENVS_SYNC_BATCH_SIZE):
+            infra_envs_changes = self._get_infra_envs_changes(infra_envs[i:i + INFRA_ENVS_SYNC_BATCH_SIZE])
+            if infra_envs_changes is not None:
+                changes.append(infra_envs_changes)
+        if self._component_versions:
+            changes.append(dict(
+                index=EventStoreConfig.COMPONENT_VERSIONS_EVENTS_INDEX,
+                documents=[self._component_versions],
+                id_fn=get_version_hash,
+                transform_document_fn=add_timestamp
+            ))
+        return changes
+
+    def _get_infra_envs_changes(self, infra_envs: Iterable[dict]) -> Optional[dict]:
+        """
+        Returns `store_changes` arguments for infra envs not stored yet, which are considered stored once
+        `on_stored` is called. None if all of them were already stored.
+        """
+        new_infra_envs = {}
+        for infra_env in infra_envs:
+            infra_env_hash = get_dict_hash(infra_env)
+            if infra_env_hash not in self._stored_infra_envs:
+                new_infra_envs[infra_env_hash] = infra_env
+        if not new_infra_envs:
+            return None
+        return dict(
+            index=EventStoreConfig.INFRA_ENVS_EVENTS_INDEX,
+            documents=list(new_infra_envs.values()),
+            id_fn=get_dict_hash,
+            filter_by={"ids": {"values": list(new_infra_envs)}},
+            on_stored=partial(self._stored_infra_envs.put_many, dict.fromkeys(new_infra_envs, True))
+        )
+
+    def _check_cluster(self, cluster: dict) -> None:
+        if self._is_blacklisted(cluster):
+            raise ClusterBlacklistedException(f"Cluster ID {cluster['id']} is blacklisted.")
+
+    def _cluster_stored(self, cluster_id: str, watermark: Optional[str]) -> None:
+        self._config.changes.set_changed()
+        self._set_processed(cluster_id, watermark)
+        log.debug(f'Storing events for cluster {cluster_id}')
+
+    def _cluster_failed(self, cluster_id: str, watermark: Optional[str], e: Exception) -> None:
+        if isinstance(e, (ClusterTooLargeException, ClusterBlacklistedException)):
+            # Nothing to retry: clusters are skipped until they change
+            self._set_processed(cluster_id, watermark)
+            log.warning(str(e))
+            return
+        self._handle_unexpected_error(e, f'Error while processing cluster {cluster_id}')
+
+    def _set_processed(self, cluster_id: str, watermark: Optional[str]) -> None:
+        if self._config.watermarks is not None:
+            self._config.watermarks.set_processed(cluster_id, watermark)
+
+    def _handle_unexpected_error(self, e: Exception, msg: str):
+        self._config.error_counter.inc()
+        if self._config.sentry.enabled:
+            capture_exception(e)
+        log.exception(f"Unexpected error: {msg}")
+
+    def _get_normalized_changes(self, cluster, event_list, infra_envs) -> List[dict]:
+        """
+        Returns `store_changes` arguments for each kind of normalized document to store for the cluster.
+        What did not change since it was last stored, according to cluster state, is skipped: cluster state
+        is updated by `on_stored`, to be called once documents are stored.
+        Only infra envs referenced by the cluster hosts are expected: the others are synced once per pass.
+        """
+        cluster_id_filter = {
+            "term": {
+                "cluster_id": cluster["id"]
+            }
+        }
+        changes = []
+        infra_envs_changes = self._get_infra_envs_changes(infra_envs)
+        if infra_envs_changes is not None:
+            changes.append(infra_envs_changes)
+
+        checksum = cluster.get("cluster_state_id")
+        if checksum is None or self._state_store.get(cluster["id"], "checksum") != checksum:
+            changes.append(dict(
+                index=EventStoreConfig.CLUSTER_EVENTS_INDEX,
+                documents=[cluster],
+                id_fn=self._cluster_checksum,
+                filter_by=cluster_id_filter,
+                on_stored=partial(self._state_store.update, cluster["id"], checksum=checksum)
+            ))
+
+        last_event_time = get_last_event_time(event_list)
+        if last_event_time is None or self._state_store.get(cluster["id"], "last_event_time") != last_event_time:
+            changes.append(dict(
+                index=EventStoreConfig.EVENTS_INDEX,
+                documents=event_list,
+                id_fn=get_event_id,
+                transform_document_fn=add_event_id,
+                filter_by=cluster_id_filter,
+                on_stored=partial(self._state_store.update, cluster["id"], last_event_time=last_event_time)
+            ))
+        return changes
+
+    def _cluster_checksum(self, doc: dict) -> str:
+        return get_cluster_checksum(doc, self._config.events.cluster_events_ignore_fields)
 
+    def add_cluster_state_id(self, doc: dict):
+        doc_copy = deepcopy(doc)
+        doc_copy["cluster_state_id"] = self._cluster_checksum(doc)
+        return doc_copy
 
-class ClusterEventsWorker:
+    def _reshape_cluster(self, cluster: dict):
+        cluster["cluster_state_id"] = self._cluster_checksum(cluster)
+        for host in cluster["hosts"]:
+            reshape_host(host)
+
+    def _is_blacklisted(self, cluster: dict) -> bool:
+        return "name" in cluster and cluster["name"] in self._blacklisted_names
+
+
+class ClusterEventsWorker(BaseClusterEventsWorker):
     def __init__(self, config: ClusterEventsWorkerConfig, ai_client: InventoryClient,
                  cluster_events_storage: ClusterEventsStorage, es_store: ElasticsearchStorage):
-
+        super().__init__(config)
         self._es_store = es_store
         self._ai_client = ai_client
         self.cluster_events_storage = cluster_events_storage
-        self._config = config
         self._executor = None
-        self._es_store = es_store
-        self._infra_envs = {}
-        self._blacklisted_names = ["perf-test"]
+        self._pipeline = None
+        self._versions_lock = threading.Lock()
+        self._documents_batch = None
+        if config.events.batch_size > 0:
+            self._documents_batch = DocumentsBatch(es_store, config.events.batch_size)
+        if config.pipeline is not None:
+            # Bulk writes are always batched across clusters by the store stage
+            self._documents_batch = DocumentsBatch(es_store, config.pipeline.batch_size)
+            self._pipeline = Pipeline([
+                Stage("fetch", self._fetch_cluster, config.pipeline.fetch_workers),
+                Stage("transform", self._transform_cluster, config.pipeline.transform_workers),
+                Stage("store", self._store_cluster, config.pipeline.store_workers),
+            ], config.pipeline.queue_size)
 
     def process_clusters(self, clusters: List[dict]) -> None:
-        infraenvs = self._ai_client.infra_envs_list()
-        self._infra_envs = {item["id"] : item for item in infraenvs}
-
-        with ThreadPoolExecutor(max_workers=self._config.max_workers) as self._executor:
-            cluster_count = len(clusters)
-            for cluster in clusters:
-                self._executor.submit(self.store_events_for_cluster, cluster)
-            log.info(f"Sent {cluster_count} clusters for processing...")
+        self._start_pass()
+        infra_envs = self._ai_client.infra_envs_list()
+        self._cache_infra_envs(infra_envs)
+        try:
+            self.cluster_events_storage.prefetch_event_counts([cluster["id"] for cluster in clusters])
+        except Exception as e:
+            # counts will be retrieved per cluster
+            self._handle_unexpected_error(e, "Error while prefetching clusters event count")
 
-    def store_events_for_cluster(self, cluster: dict) -> None:
+        if self._pipeline is not None:
+            log.info(f"Sending {len(clusters)} clusters through processing pipeline...")
+            self._pipeline.run(clusters)
+        else:
+            with ThreadPoolExecutor(max_workers=self._config.max_workers) as self._executor:
+                cluster_count = len(clusters)
+                for cluster in clusters:
+                    self._executor.submit(self.store_events_for_cluster, cluster)
+                log.info(f"Sent {cluster_count} clusters for processing...")
+        self._store_pass_changes(infra_envs)
+        self.flush()
+        self._end_pass()
+
+    def _store_pass_changes(self, infra_envs: List[dict]) -> None:
+        for changes in self._get_pass_changes(infra_envs):
+            try:
+                self._store_changes(**changes)
+            except Exception as e:
+                self._handle_unexpected_error(e, f'Error while storing {changes["index"]}')
+
+    def flush(self) -> None:
+        """Stores pending batched documents, if batching is enabled"""
+        if self._documents_batch is None:
+            return
         try:
-            if self._is_blacklisted(cluster):
-                raise ClusterBlacklistedException(f"Cluster ID {cluster['id']} is blacklisted.")
-            Anonymizer.anonymize_cluster(cluster)
-            self._enrich_cluster(cluster)
+            self._documents_batch.flush()
+        except Exception as e:
+            self._handle_unexpected_error(e, "Error while storing batched normalized events")
 
-            if len(cluster["hosts"]) > MAX_HOSTS_COUNT:
-                raise ClusterTooLargeException(
-                    f"Cluster ID {cluster['id']} has too many hosts ({len(cluster['hosts'])}>{MAX_HOSTS_COUNT})."
-                )
+    def store_events_for_cluster(self, cluster: dict) -> None:
+        work = self._fetch_cluster(cluster)
+        if work is not None:
+            work = self._transform_cluster(work)
+        if work is not None:
+            self._store_cluster(work)
 
-            log.debug(f"Storing cluster: {cluster}")
+    def _fetch_cluster(self, cluster: dict) -> Optional[ClusterWork]:
+        """
+        First processing stage: retrieves from assisted-service what is needed to store the cluster
+        """
+        work = ClusterWork(cluster, get_cluster_watermark(cluster))
+        try:
+            self._check_cluster(cluster)
+            if "hosts" not in cluster or len(cluster["hosts"]) == 0:
+                cluster["hosts"] = self.__get_hosts(cluster["id"])
+            check_cluster_hosts(cluster)
 
-            events = self.__get_events(cluster["id"])
-            component_versions = self.__get_versions()
+            work.events = self.__get_events(cluster["id"])
+            work.component_versions = self._get_component_versions()
 
-            hosts_infra_envs = self._get_hosts_infraenvs(cluster["hosts"])
-            infra_envs = self.__get_infra_envs_list()
+            work.hosts_infra_envs = self._get_hosts_infraenvs(cluster["hosts"])
+            return work
+        except Exception as e:
+            self._cluster_failed(cluster["id"], work.watermark, e)
+        return None
 
-            _anonymize_infra_envs(hosts_infra_envs, infra_envs)
+    def _transform_cluster(self, work: ClusterWork) -> Optional[ClusterWork]:
+        """
+        Second processing stage, CPU bound: anonymization, hosts reshaping and checksums.
+        In pipeline mode documents are also processed and serialized, so that storing is only I/O.
+        Normalized documents are serialized first: processing legacy events metadata updates the cluster
+        """
+        cluster = work.cluster
+        try:
+            Anonymizer.anonymize_cluster(cluster)
+            self._reshape_cluster(cluster)
+            if self._pipeline is not None:
+                work.serialized_documents = self._serialize_normalized_events(work)
+                work.prepared_events = prepare_cluster_events(
+                    work.component_versions, cluster, work.events, work.hosts_infra_envs)
+            return work
+        except Exception as e:
+            self._cluster_failed(cluster["id"], work.watermark, e)
+        return None
 
-            self._store_normalized_events(component_versions, cluster, events, infra_envs)
-            self.cluster_events_storage.store(component_versions, cluster, events, hosts_infra_envs)
-            self._config.changes.set_changed()
-            log.debug(f'Storing events for cluster {cluster["id"]}')
-        except (ClusterTooLargeException, ClusterBlacklistedException) as e:
-            log.warning(str(e))
+    def _store_cluster(self, work: ClusterWork) -> None:
+        """
+        Last processing stage: stores normalized documents and legacy events.
+        Batched documents are stored later on: the cluster is considered stored once they are
+        """
+        cluster = work.cluster
+        try:
+            writes = PendingWrites(partial(self._cluster_stored, cluster["id"], work.watermark))
+            self._store_normalized_events(work, writes)
+            if work.prepared_events is not None:
+                self.cluster_events_storage.store_prepared(work.prepared_events)
+            else:
+                self.cluster_events_storage.store(
+                    work.component_versions, cluster, work.events, work.hosts_infra_envs)
+            writes.done()
         except Exception as e:
-            self.__handle_unexpected_error(e, f'Error while processing cluster {cluster["id"]}')
+            self._cluster_failed(cluster["id"], work.watermark, e)
+
+    def _get_component_versions(self) -> dict:
+        """Component versions are not expected to change within a pass: they are retrieved once"""
+        with self._versions_lock:
+            if self._component_versions is None:
+                self._component_versions = self.__get_versions()
+            return self._component_versions
 
     @retry(ApiException, delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
     def __get_versions(self):
@@ -125,42 +393,14 @@ class ClusterEventsWorker:
             default_return_value=[]
         )
 
-    def _get_hosts_infraenvs(self, hosts):
-        hosts_infra_envs = []
-        hosts_infra_envs = self.__get_infra_envs(
-            [host["infra_env_id"] for host in hosts
-             if host and "infra_env_id" in host and host["infra_env_id"] is not None]
-        )
-        self.__set_infra_envs(hosts_infra_envs)
-        return hosts_infra_envs
-
-    def __get_infra_envs_list(self) -> List[dict]:
-        return list(self._infra_envs.values())
+    def _get_hosts_infraenvs(self, hosts: List[dict]) -> Dict[str, dict]:
+        return self._found_infra_envs({
+            infra_env_id: self._infra_envs.get_or_load(infra_env_id, self.__load_infra_env)
+            for infra_env_id in get_hosts_infra_env_ids(hosts)
+        })
 
-    def __set_infra_envs(self, infra_envs: dict):
-        for key in infra_envs:
-            self._infra_envs[key] = infra_envs[key]
-
-    def __get_infra_envs(self, infra_env_ids: List[str]) -> dict:
-        infra_envs = {}
-        for infra_env_id in infra_env_ids:
-            try:
-                infra_env = self.__get_cached_infra_env(infra_env_id)
-                infra_envs[infra_env["id"]] = deepcopy(infra_env)
-            except ResourceNotFoundException as e:
-                log.exception(f"InfraEnv not found: {e}")
-
-        return infra_envs
-
-    def __get_cached_infra_env(self, infra_env_id: str) -> dict:
-        infra_env = self._infra_envs.get(infra_env_id)
-        if infra_env:
-            return infra_env
-        infra_env = self.__get_infra_env(infra_env_id)
-        if not infra_env:
-            raise ResourceNotFoundException(f"Infra env {infra_env_id} not found")
-        self._infra_envs[infra_env["id"]] = infra_env
-        return infra_env
+    def __load_infra_env(self, infra_env_id: str) -> Optional[dict]:
+        return anonymize_infra_env(self.__get_infra_env(infra_env_id))
 
     @retry(ApiException, delay=1, tries=3, backoff=2, max_delay=4, jitter=1)
     def __get_infra_env(self, infra_env_id: str):
@@ -176,17 +416,13 @@ class ClusterEventsWorker:
             default_return_value=None
         )
 
-    def __handle_unexpected_error(self, e: Exception, msg: str):
-        self._config.error_counter.inc()
-        if self._config.sentry.enabled:
-            capture_exception(e)
-        log.exception(f"Unexpected error: {msg}")
-
     def shutdown(self):
         """
         This is needed for python 3.8 and lower. With python 3.9 we can pass a parameter:
         self._executor.shutdown(wait=False, cancel_futures=True)
         """
+        if self._pipeline:
+            self._pipeline.stop()
         if self._executor:
             # Do not accept further tasks
             self._executor.shutdown(wait=False)
@@ -201,77 +437,68 @@ class ClusterEventsWorker:
             if work_item:
                 work_item.future.cancel()
 
-    def _store_normalized_events(self, component_versions, cluster, event_list, infra_envs):
-        try:
-            cluster_id_filter = {
-                "term": {
-                    "cluster_id": cluster["id"]
-                }
-            }
-
-            self._es_store.store_changes(
-                index=EventStoreConfig.INFRA_ENVS_EVENTS_INDEX,
-                documents=infra_envs,
-                id_fn=get_dict_hash,
-                filter_by=cluster_id_filter
+    def _store_normalized_events(self, work: ClusterWork, writes: PendingWrites):
+        """Errors are raised: the cluster is failed, so that it is processed again on next pass"""
+        cluster = work.cluster
+        if work.serialized_documents is not None:
+            for changes in work.serialized_documents:
+                self._documents_batch.add_serialized(changes.index, changes.documents, writes.add(changes.on_stored))
+        else:
+            for changes in self._get_normalized_changes(cluster, work.events, work.hosts_infra_envs.values()):
+                self._store_changes(**dict(changes, on_stored=writes.add(changes.get("on_stored"))))
+
+    def _serialize_normalized_events(self, work: ClusterWork) -> List[SerializedChanges]:
+        return [
+            SerializedChanges(
+                changes["index"],
+                self._documents_batch.serialize(
+                    changes["documents"], changes["id_fn"], changes.get("transform_document_fn")),
+                changes.get("on_stored")
             )
+            for changes in self._get_normalized_changes(work.cluster, work.events, work.hosts_infra_envs.values())
+        ]
 
-            self._es_store.store_changes(
-                index=EventStoreConfig.CLUSTER_EVENTS_INDEX,
-                documents=[cluster],
-                id_fn=self._cluster_checksum,
-                filter_by=cluster_id_filter
-            )
-            self._es_store.store_changes(
-                index=EventStoreConfig.EVENTS_INDEX,
-                documents=event_list,
-                id_fn=get_event_id,
-                transform_document_fn=add_event_id,
-                filter_by=cluster_id_filter
-            )
-            self._es_store.store_changes(
-                index=EventStoreConfig.COMPONENT_VERSIONS_EVENTS_INDEX,
-                documents=[component_versions],
-                id_fn=get_version_hash,
-                transform_document_fn=add_timestamp
-            )
-        except Exception as e:
-            self.__handle_unexpected_error(e, f'Error while storing normalized events for cluster {cluster["id"]}')
+    def _store_changes(self, on_stored: Callable[[], None] = None, **changes):
+        """
+        `changes` are `ElasticsearchStorage.store_changes` arguments. `on_stored` is called once documents
+        are stored, which is later on when they are batched
+        """
+        if self._documents_batch is not None:
+            self._documents_batch.add(changes["index"], changes["documents"], changes["id_fn"],
+                                      changes.get("transform_document_fn"), on_stored)
+            return
+        if not self._es_store.store_changes(**changes):
+            raise DocumentsNotStoredException(f"Documents were not all stored in {changes['index']}")
+        if on_stored is not None:
+            on_stored()
 
-    def _cluster_checksum(self, doc: dict) -> dict:
-        doc_copy = deepcopy(doc)
-        log.debug(f"Ignoring fields: <{self._config.events.cluster_events_ignore_fields}>")
-        for field in self._config.events.cluster_events_ignore_fields:
-            try:
-                dpath.util.delete(doc_copy, field, separator=".")
-            except PathNotFound:
-                # if field is not there, no need to delete it, but don't fail
-                pass
-        if "hosts" in doc_copy:
-            doc_copy["hosts"].sort(key=by_id)
-        return get_dict_hash(doc_copy)
 
-    def add_cluster_state_id(self, doc: dict):
-        doc_copy = deepcopy(doc)
-        doc_copy["cluster_state_id"] = self._cluster_checksum(doc)
-        return doc_copy
+def anonymize_infra_env(infra_env: Optional[dict]) -> Optional[dict]:
+    if not infra_env:
+        return None
+    Anonymizer.anonymize_infra_env(infra_env)
+    return infra_env
 
-    def _enrich_cluster(self, cluster: dict):
-        if "hosts" not in cluster or len(cluster["hosts"]) == 0:
-            cluster["hosts"] = self.__get_hosts(cluster["id"])
-        cluster["cluster_state_id"] = self._cluster_checksum(cluster)
-        for host in cluster["hosts"]:
-            reshape_host(host)
 
-    def _is_blacklisted(self, cluster: dict) -> bool:
-        return "name" in cluster and cluster["name"] in self._blacklisted_names
+def get_hosts_infra_env_ids(hosts: List[dict]) -> List[str]:
+    return list(dict.fromkeys(host["infra_env_id"] for host in hosts
+                              if host and "infra_env_id" in host and host["infra_env_id"] is not None))
+
+
+def check_cluster_hosts(cluster: dict) -> None:
+    if len(cluster["hosts"]) > MAX_HOSTS_COUNT:
+        raise ClusterTooLargeException(
+            f"Cluster ID {cluster['id']} has too many hosts ({len(cluster['hosts'])}>{MAX_HOSTS_COUNT})."
+        )
+    log.debug(f"Storing cluster: {cluster}")
 
 
-def _anonymize_infra_envs(hosts_infra_envs, infra_envs):
-    for infra_env in hosts_infra_envs:
-        Anonymizer.anonymize_infra_env(infra_env)
-    for infra_env in infra_envs:
-        Anonymizer.anonymize_infra_env(infra_env)
+def get_cluster_checksum(doc: dict, ignore_fields: List[str]) -> str:
+    # doc is not copied: ignored fields are left out of a view sharing everything else with doc
+    to_hash = without_paths(doc, ignore_fields)
+    if "hosts" in to_hash:
+        to_hash = dict(to_hash, hosts=sorted(to_hash["hosts"], key=by_id))
+    return get_dict_hash(to_hash)
 
 
 def by_id(item: dict) -> str:
@@ -299,6 +526,13 @@ def add_event_id(doc: dict) -> dict:
     return d
 
 
+def get_last_event_time(event_list: List[dict]) -> Optional[str]:
+    event_times = [event["event_time"] for event in event_list if event.get("event_time")]
+    if not event_times:
+        return None
+    return max(event_times)
+
+
 def get_version_hash(d: dict) -> str:
     return get_dict_hash(d, ["timestamp"])
 
@@ -307,11 +541,18 @@ def handle_4XX_apiexception(f, message_404="", default_return_value=None):
     try:
         return f()
     except ApiException as e:
-        if e.status >= 500:
-            raise e
-        if e.status == 404:
-            log.debug(message_404)
-        else:
-            capture_exception(e)
-            log.exception()
+        handle_4XX_error(e, message_404)
     return default_return_value
+
+
+def handle_4XX_error(e: ApiException, message_404=""):
+    """
+    Raises server errors, so they can be retried, and logs client errors
+    """
+    if e.status >= 500:
+        raise e
+    if e.status == 404:
+        log.debug(message_404)
+    else:
+        capture_exception(e)
+        log.exception(f"Unexpected assisted-service response: {e.status}")
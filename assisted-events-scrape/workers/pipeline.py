@@ -0,0 +1,76 @@
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+from utils import log
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    A step of a pipeline. `fn` receives an item from the previous stage and returns the item for the
+    next stage, or None to drop it. `fn` is expected to handle its own errors.
+    """
+    name: str
+    fn: Callable[[Any], Optional[Any]]
+    workers: int
+
+
+class Pipeline:
+    """
+    Runs items through stages, each one with its own pool of threads. Stages are connected by bounded
+    queues: when a stage is slower than the previous one its input queue fills up and upstream threads
+    block, so the number of items in memory is bounded regardless of the number of input items.
+    """
+    def __init__(self, stages: List[Stage], queue_size: int):
+        self._stages = stages
+        self._queue_size = queue_size
+        self._stopped = threading.Event()
+
+    def run(self, items: Iterable[Any]) -> None:
+        self._stopped.clear()
+        queues = [queue.Queue(maxsize=self._queue_size) for _ in self._stages]
+        stage_threads = []
+        for i, stage in enumerate(self._stages):
+            output = queues[i + 1] if i + 1 < len(queues) else None
+            threads = [
+                threading.Thread(target=self._run_stage, args=(stage, queues[i], output),
+                                 name=f"{stage.name}-{n}", daemon=True)
+                for n in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            stage_threads.append(threads)
+
+        for item in items:
+            if self._stopped.is_set():
+                break
+            queues[0].put(item)
+
+        # Stages are closed in order, once all the items of the previous stage were processed
+        for i, threads in enumerate(stage_threads):
+            for _ in threads:
+                queues[i].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+    def stop(self) -> None:
+        """Stops feeding items. Items already in the pipeline are discarded"""
+        self._stopped.set()
+
+    def _run_stage(self, stage: Stage, input_queue: queue.Queue, output_queue: Optional[queue.Queue]) -> None:
+        while True:
+            item = input_queue.get()
+            if item is _DONE:
+                return
+            if self._stopped.is_set():
+                continue
+            try:
+                result = stage.fn(item)
+            except Exception:
+                log.exception(f"Unexpected error in pipeline stage {stage.name}")
+                continue
+            if result is not None and output_queue is not None:
+                output_queue.put(result)